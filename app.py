@@ -3,11 +3,31 @@ The Seventh Sanctum - Game Server
 Flask backend with complete game logic
 """
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, has_request_context, make_response
 from flask_cors import CORS
+from shard_router import shard_for
+import atexit
+import base64
+import hashlib
+import hmac
 import json
+import operator
+import os
 import random
+import secrets
+import signal
+import sqlite3
+import struct
+import threading
+import time
 import uuid
+import weakref
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from math import comb, isnan
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 
 app = Flask(__name__)
@@ -30,18 +50,1485 @@ def diagnostics():
     return render_template('diagnostics.html')
 
 
-# Load card database
-with open('card_database.json', 'r') as f:
-    CARD_DATABASE = json.load(f)
+# Keyword bitflags for CardTable.keywords
+KW_GUARD = 1 << 0
+KW_SWIFT = 1 << 1
+KW_WITHER = 1 << 2
+KW_CORRUPT = 1 << 3
+KW_PIERCE = 1 << 4
+KW_RETREAT = 1 << 5
+KEYWORD_FLAGS = {
+    'Guard': KW_GUARD,
+    'Swift': KW_SWIFT,
+    'Wither': KW_WITHER,
+    'Corrupt': KW_CORRUPT,
+    'Pierce': KW_PIERCE,
+    'Retreat': KW_RETREAT,
+}
 
-CARDS_BY_ID = {card['id']: card for card in CARD_DATABASE['cards']}
 
-# Game state storage (in-memory for prototype)
-games = {}
+class CardTable:
+    """
+    The card database compiled into integer-indexed parallel arrays
+    
+    Card i has ID ids[i] and stats cost[i], atk[i], defense[i] and spd[i];
+    type_code[i] and faction_code[i] index into types/factions, and
+    keywords[i] is an OR of KW_* flags. `index` maps card ID strings to i,
+    so string IDs only need converting at the edges (decks, API input)
+    while hot loops do tuple lookups and bit tests instead of dict lookups
+    and `in` checks on keyword lists. Keywords without a KW_* flag are
+    left out of the bitflags.
+    
+    by_faction, by_type, by_cost and by_keyword index the cards for
+    /api/cards queries (string keys are lowercase).
+    
+    A table is never modified after it is built: reloading the card file
+    builds a new one (see reload_card_table()), and each game keeps the
+    table it started with as `game.cards`.
+    """
+    
+    def __init__(self, database, version):
+        self.database = database
+        self.version = version
+        cards = database['cards']
+        self.by_id = {card['id']: card for card in cards}
+        self.ids = tuple(card['id'] for card in cards)
+        self.index = {card_id: i for i, card_id in enumerate(self.ids)}
+        self.types = tuple(sorted({card['type'] for card in cards}))
+        self.factions = tuple(sorted({card.get('faction', '') for card in cards}))
+        type_codes = {name: i for i, name in enumerate(self.types)}
+        faction_codes = {name: i for i, name in enumerate(self.factions)}
+        
+        self.cost = tuple(card.get('cost', 0) for card in cards)
+        self.atk = tuple(card.get('atk', 0) for card in cards)
+        self.defense = tuple(card.get('def', 0) for card in cards)
+        self.spd = tuple(card.get('spd', 0) for card in cards)
+        self.type_code = tuple(type_codes[card['type']] for card in cards)
+        self.faction_code = tuple(faction_codes[card.get('faction', '')] for card in cards)
+        self.keywords = tuple(
+            sum(KEYWORD_FLAGS.get(keyword, 0) for keyword in set(card.get('keywords', [])))
+            for card in cards
+        )
+        
+        self.by_faction = self.group(cards, lambda card: [card.get('faction', '').lower()])
+        self.by_type = self.group(cards, lambda card: [card['type'].lower()])
+        self.by_cost = self.group(cards, lambda card: [card.get('cost', 0)])
+        self.by_keyword = self.group(cards, lambda card: [k.lower() for k in card.get('keywords', [])])
+        
+        self.responses = {}  # Normalized /api/cards filters -> serialized response
+        self.starter_decks = {}
+    
+    @staticmethod
+    def group(cards, keys_of):
+        """Index of key -> card indices (database order)"""
+        groups = {}
+        for i, card in enumerate(cards):
+            for key in keys_of(card):
+                groups.setdefault(key, []).append(i)
+        return {key: tuple(indices) for key, indices in groups.items()}
+    
+    def flags(self, card_id):
+        """Keyword bitflags for a card ID"""
+        return self.keywords[self.index[card_id]]
+    
+    def query(self, faction=None, card_type=None, cost=None, keyword=None):
+        """Indices of the cards matching every given filter, in database order"""
+        groups = []
+        if faction is not None:
+            groups.append(self.by_faction.get(faction.lower(), ()))
+        if card_type is not None:
+            groups.append(self.by_type.get(card_type.lower(), ()))
+        if cost is not None:
+            groups.append(self.by_cost.get(cost, ()))
+        if keyword is not None:
+            groups.append(self.by_keyword.get(keyword.lower(), ()))
+        if not groups:
+            return tuple(range(len(self.ids)))
+        
+        # Intersect starting from the smallest index
+        groups.sort(key=len)
+        matches = set(groups[0])
+        for group in groups[1:]:
+            matches.intersection_update(group)
+        return tuple(sorted(matches))
+    
+    def cards_response(self, faction=None, card_type=None, cost=None, keyword=None):
+        """
+        Serialized /api/cards body for a query, cached per distinct query
+        
+        Only queries on values that exist in the indexes are cached, so the
+        cache is bounded by the card data rather than by what clients send.
+        """
+        key = (
+            faction and faction.lower(),
+            card_type and card_type.lower(),
+            cost,
+            keyword and keyword.lower(),
+        )
+        body = self.responses.get(key)
+        if body is not None:
+            return body
+        
+        if key == (None, None, None, None):
+            payload = self.database
+        else:
+            cards = self.database['cards']
+            matches = self.query(faction, card_type, cost, keyword)
+            payload = {name: value for name, value in self.database.items() if name != 'cards'}
+            payload['total_cards'] = len(matches)
+            payload['cards'] = [cards[i] for i in matches]
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        
+        known = (
+            (key[0] is None or key[0] in self.by_faction) and
+            (key[1] is None or key[1] in self.by_type) and
+            (cost is None or cost in self.by_cost) and
+            (key[3] is None or key[3] in self.by_keyword)
+        )
+        if known:
+            self.responses[key] = body
+        return body
+    
+    def starter_deck(self, faction):
+        """A faction's starter deck as card IDs, expanded and checked against this table once"""
+        deck = self.starter_decks.get(faction)
+        if deck is None:
+            if faction not in STARTER_DECKLISTS:
+                return ()
+            deck = []
+            for card_id, count in STARTER_DECKLISTS[faction].items():
+                if card_id in self.index:
+                    deck.extend([card_id] * count)
+                else:
+                    print(f"Warning: Card not found: {card_id}")
+            deck = self.starter_decks[faction] = tuple(deck)
+        return deck
+
+
+# Starter decks: card ID -> copies (EXACT 42-card lists with duplicates)
+STARTER_DECKLISTS = {
+    'Skyforge': {
+        'skyforge_skyforge_drone': 3,
+        'skyforge_skyforge_scout': 3,
+        'skyforge_skyforge_gunner': 2,
+        'skyforge_skyforge_interceptor': 1,
+        'skyforge_skyforge_bulwark': 1,
+        'skyforge_skyforge_overseer': 1,
+        'human_scrapland_scavenger': 2,  # Added +1 for 42nd card
+        'hybrid_ashfang_hound': 1,
+        'ancient_wasteland_sentinel': 1,
+        'beast_carrion_drifter': 1,
+        'human_dustrunner_nomad': 1,
+        'mutant_ironhide_behemoth': 1,
+        'mutant_signal_leech': 1,
+        'undead_gravefield_lurker': 1,
+        'undead_wanderer_of_ash': 1,
+        'skyforge_override': 1,
+        'skyforge_software_update': 1,
+        'skyforge_velocity_patch': 1,
+        'skyforge_reboot': 1,
+        'generic_arcane_surge': 2,  # Duplicate (+1)
+        'generic_veil_of_binding': 1,
+        'generic_food_rations': 1,
+        'generic_travelling_merchant': 1,
+        'skyforge_lockdown': 1,
+        'skyforge_counter_measure': 2,  # Duplicate (+1)
+        'skyforge_self_destruct': 1,
+        'skyforge_decoy_protocol': 1,
+        'generic_flute_of_slumber': 1,
+        'generic_return_to_sender': 1,
+        'skyforge_assembly_line': 2,  # Duplicate (+1)
+        'skyforge_relay_node': 1,
+        'skyforge_kill_zone': 1,
+        'skyforge_rustfields': 1,
+    },
+    'Miasma': {
+        'miasma_miasma_drifter': 3,
+        'miasma_miasma_husk': 3,
+        'miasma_miasma_stalker': 2,
+        'miasma_miasma_spore_swarm': 1,
+        'miasma_miasma_blightcrawler': 1,
+        'miasma_miasma_corruptor': 1,
+        'miasma_miasma_rot_titan': 1,
+        'miasma_the_living_miasma': 1,
+        'gnome_knoxx_the_engineer': 2,  # Added +1 for 42nd card
+        'undead_fog_walker_guide': 1,
+        'undead_ashara_the_bone_seer': 1,
+        'human_edda_the_thief': 1,
+        'human_scrap_gladiator': 1,
+        'human_kalzar_of_the_scribes': 1,
+        'human_beast_tamer_tarn': 1,
+        'miasma_encroaching_fog': 1,
+        'miasma_toxic_sludge': 1,
+        'miasma_petrify': 1,
+        'miasma_choking_spores': 1,
+        'generic_eviction_notice': 1,
+        'generic_emergency_repairs': 2,  # Duplicate (+1)
+        'generic_adrenal_rush': 1,
+        'generic_salvage_the_ruins': 2,  # Duplicate (+1)
+        'miasma_miasma_potion': 2,  # Duplicate (+1)
+        'miasma_rot_beneath_the_surface': 1,
+        'miasma_foglash': 1,
+        'generic_earthquake': 1,
+        'generic_counter_sigil': 1,
+        'generic_false_step': 1,
+        'miasma_lowlands_mist': 1,
+        'miasma_blight_pools': 2,  # Duplicate (+1)
+        'miasma_rotfall_expanse': 1,
+    },
+}
+
+
+def validate_card_database(database):
+    """Raise ValueError if a parsed card database can't be served"""
+    if not isinstance(database, dict) or not isinstance(database.get('cards'), list) or not database['cards']:
+        raise ValueError('Card database needs a non-empty "cards" list')
+    
+    seen = set()
+    for position, card in enumerate(database['cards']):
+        card_id = card.get('id') if isinstance(card, dict) else None
+        if not isinstance(card_id, str) or not card_id:
+            raise ValueError(f'Card #{position} has no id')
+        if card_id in seen:
+            raise ValueError(f'Duplicate card id: {card_id}')
+        seen.add(card_id)
+        for field in ('name', 'type'):
+            if not isinstance(card.get(field), str):
+                raise ValueError(f'{card_id}: missing {field}')
+        stats = ('cost', 'atk', 'def', 'spd') if card['type'].startswith('UNIT') else ('cost',)
+        for stat in stats:
+            if not isinstance(card.get(stat, 0), int):
+                raise ValueError(f'{card_id}: {stat} must be an integer')
+        if not isinstance(card.get('keywords', []), list):
+            raise ValueError(f'{card_id}: keywords must be a list')
+    
+    # New games are dealt starter decks, so they must still be complete
+    for faction, decklist in STARTER_DECKLISTS.items():
+        missing = [card_id for card_id in decklist if card_id not in seen]
+        if missing:
+            raise ValueError(f'{faction} starter deck uses unknown cards: {", ".join(missing)}')
+
+
+def load_card_table(path):
+    """Read, validate and compile a card database file"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        database = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    validate_card_database(database)
+    return CardTable(database, hashlib.sha1(raw).hexdigest()[:12])
+
+
+# Card table used by new games. reload_card_table() swaps in a new one.
+# CARD_TABLES finds the tables still in use by version. It only holds them
+# weakly: games keep theirs as game.cards, so an old table goes away with
+# the last game playing it (one loaded again later from storage plays on
+# with the current table, see GameState.restore()).
+CARD_DATABASE_PATH = 'card_database.json'
+CARD_TABLE = load_card_table(CARD_DATABASE_PATH)
+CARD_TABLES = weakref.WeakValueDictionary({CARD_TABLE.version: CARD_TABLE})
+
+# Sharded deployments (see shard_router.py): this process owns every game
+# whose ID hashes to SHARD_INDEX
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+
+def new_owned_id():
+    """New UUID string that the router will send back to this process"""
+    while True:
+        new_id = str(uuid.uuid4())
+        if SHARD_COUNT == 1 or shard_for(new_id, SHARD_COUNT) == SHARD_INDEX:
+            return new_id
+
+
+class GameStore:
+    """
+    In-memory game storage with idle expiry and a size cap
+    
+    Every get() refreshes a game's last-access time. Games idle for longer
+    than ttl_seconds are dropped by a background reaper thread, and once
+    max_games is reached the least recently used game is evicted to make room.
+    """
+    
+    def __init__(self, ttl_seconds=7200, max_games=1000, reap_interval=60, loader=None):
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.max_games = max_games
+        self.reap_interval = reap_interval
+        self.games = OrderedDict()  # game_id -> GameState, least recently used first
+        self.last_access = {}
+        self.lock = threading.Lock()
+        self.game_locks = {}  # game_id -> RLock serializing that game's mutations
+        self.game_conditions = {}  # game_id -> Condition on that lock, for long-polling
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self.reaper = None
+    
+    def get(self, game_id, default=None):
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is not None:
+                self.games.move_to_end(game_id)
+                self.last_access[game_id] = time.monotonic()
+                self.touched(game_id, game)
+                return game
+        
+        # Not in memory - loading happens outside the lock since it may be slow
+        game = self.load(game_id)
+        if game is None:
+            return default
+        with self.lock:
+            # A recovery may have already put the game back while loading
+            existing = self.games.get(game_id)
+            loaded = existing is None or existing is game
+            if existing is not None:
+                game = existing
+                self.games.move_to_end(game_id)
+                self.last_access[game_id] = time.monotonic()
+            else:
+                self._insert(game_id, game)
+            self.touched(game_id, game)
+        if loaded and getattr(game, 'ai_job_id', None):
+            # Only the copy that made it into the store picks its AI job back up
+            with self.locked(game_id):
+                resume_ai_job(game)
+        return game
+    
+    def __setitem__(self, game_id, game):
+        with self.lock:
+            self._insert(game_id, game)
+            self.touched(game_id, game)
+    
+    def _insert(self, game_id, game):
+        self.games[game_id] = game
+        self.games.move_to_end(game_id)
+        self.last_access[game_id] = time.monotonic()
+        while len(self.games) > self.max_games:
+            old_id, old_game = self.games.popitem(last=False)
+            self.last_access.pop(old_id, None)
+            self.game_locks.pop(old_id, None)
+            self.game_conditions.pop(old_id, None)
+            self.evicted(old_id, old_game)
+            self.evicted_capacity += 1
+    
+    # Hooks for persistent backends (the in-memory store has nothing behind it)
+    
+    def load(self, game_id):
+        """Fetch a game that isn't in memory; None if it doesn't exist"""
+        if self.loader is not None:
+            return self.loader(game_id)
+        return None
+    
+    def touched(self, game_id, game):
+        """Called whenever a request reads or stores a game"""
+    
+    def mark_dirty(self, game_id, game):
+        """Flag a game as changed outside a POST request"""
+    
+    def evicted(self, game_id, game):
+        """Called when a game leaves memory"""
+    
+    def __contains__(self, game_id):
+        with self.lock:
+            return game_id in self.games
+    
+    def __len__(self):
+        return len(self.games)
+    
+    def pop(self, game_id, default=None):
+        with self.lock:
+            self.last_access.pop(game_id, None)
+            return self.games.pop(game_id, default)
+    
+    def lock_for(self, game_id):
+        """The lock that serializes every change to one game"""
+        with self.lock:
+            game_lock = self.game_locks.get(game_id)
+            if game_lock is None:
+                game_lock = self.game_locks[game_id] = threading.RLock()
+            return game_lock
+    
+    def condition_for(self, game_id):
+        """Condition on the game's lock, notified whenever the game changes"""
+        game_lock = self.lock_for(game_id)
+        with self.lock:
+            condition = self.game_conditions.get(game_id)
+            if condition is None:
+                condition = self.game_conditions[game_id] = threading.Condition(game_lock)
+            return condition
+    
+    @contextmanager
+    def locked(self, game_id):
+        """Hold a game's lock, recording how long it took to get it"""
+        game_lock = self.lock_for(game_id)
+        started = time.perf_counter()
+        with game_lock:
+            waited = time.perf_counter() - started
+            with self.lock:
+                self.lock_waits += 1
+                self.lock_wait_total += waited
+                self.lock_wait_max = max(self.lock_wait_max, waited)
+            yield
+    
+    def reap(self):
+        """Drop every game idle for longer than the TTL; returns how many were dropped"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        reaped = 0
+        with self.lock:
+            # Oldest access first, so stop at the first game still in use
+            for game_id in list(self.games):
+                if self.last_access[game_id] > cutoff:
+                    break
+                self.evicted(game_id, self.games.pop(game_id))
+                del self.last_access[game_id]
+                self.game_locks.pop(game_id, None)
+                self.game_conditions.pop(game_id, None)
+                reaped += 1
+            self.evicted_idle += reaped
+        return reaped
+    
+    def start_reaper(self):
+        """Start the background reaper thread (once per process)"""
+        if self.reaper is not None:
+            return
+        
+        def run():
+            while True:
+                time.sleep(self.reap_interval)
+                self.reap()
+        
+        self.reaper = threading.Thread(target=run, name='game-reaper', daemon=True)
+        self.reaper.start()
+    
+    def stats(self):
+        """Store counters for /api/metrics"""
+        return {
+            'games': len(self.games),
+            'max_games': self.max_games,
+            'ttl_seconds': self.ttl_seconds,
+            'evicted_idle': self.evicted_idle,
+            'evicted_capacity': self.evicted_capacity,
+            'lock_waits': self.lock_waits,
+            'lock_wait_avg_ms': round(1000 * self.lock_wait_total / self.lock_waits, 3) if self.lock_waits else 0.0,
+            'lock_wait_max_ms': round(1000 * self.lock_wait_max, 3),
+        }
+
+
+class SQLiteGameStore(GameStore):
+    """
+    GameStore backed by a SQLite database so games survive restarts
+    
+    Memory only holds the hot set: GameStore's TTL and size cap still apply,
+    but evicted games stay on disk and are loaded again on their next access.
+    Games touched during a POST request are written together in a single
+    transaction when the request finishes (see flush_game_writes()). Rows
+    not updated for disk_ttl_seconds are deleted by the reaper.
+    """
+    
+    def __init__(self, path, disk_ttl_seconds=7 * 24 * 3600, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS games ('
+            'game_id TEXT PRIMARY KEY, snapshot BLOB NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self.db.commit()
+        self.pending = threading.local()
+        self.loads = 0
+        self.writes = 0
+        self.batches = 0
+    
+    @staticmethod
+    def encode(game):
+        return encode_snapshot(game.snapshot(), compress=True)
+    
+    @staticmethod
+    def decode(blob):
+        # Rows written before binary snapshots are zlib JSON, which decode_snapshot() also reads
+        return GameState.from_snapshot(decode_snapshot(blob))
+    
+    def load(self, game_id):
+        with self.db_lock:
+            row = self.db.execute('SELECT snapshot FROM games WHERE game_id = ?', (game_id,)).fetchone()
+        if row is None:
+            return None
+        self.loads += 1
+        return self.decode(row[0])
+    
+    def touched(self, game_id, game):
+        if has_request_context() and request.method == 'POST':
+            self.mark_dirty(game_id, game)
+    
+    def mark_dirty(self, game_id, game):
+        if not hasattr(self.pending, 'games'):
+            self.pending.games = {}
+        self.pending.games[game_id] = game
+    
+    def evicted(self, game_id, game):
+        # Anything still waiting for this request's flush is written now
+        pending = getattr(self.pending, 'games', {})
+        if game_id in pending:
+            self.write([(game_id, pending.pop(game_id))])
+    
+    def write(self, items):
+        """Write (game_id, GameState) pairs in one transaction"""
+        rows = [(game_id, self.encode(game), time.time()) for game_id, game in items]
+        with self.db_lock:
+            with self.db:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO games (game_id, snapshot, updated_at) VALUES (?, ?, ?)',
+                    rows
+                )
+        self.writes += len(rows)
+        self.batches += 1
+    
+    def flush(self):
+        """Write every game this thread's current request touched"""
+        pending = getattr(self.pending, 'games', None)
+        if pending:
+            self.pending.games = {}
+            self.write(list(pending.items()))
+    
+    def pop(self, game_id, default=None):
+        with self.db_lock:
+            with self.db:
+                self.db.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
+        return super().pop(game_id, default)
+    
+    def reap(self):
+        reaped = super().reap()
+        with self.db_lock:
+            with self.db:
+                self.db.execute('DELETE FROM games WHERE updated_at < ?', (time.time() - self.disk_ttl_seconds,))
+        return reaped
+    
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'backend': 'sqlite',
+            'loads': self.loads,
+            'writes': self.writes,
+            'write_batches': self.batches,
+        })
+        return stats
+
+
+# Game state storage: in memory by default, or SQLite with GAME_STORE=sqlite
+GAME_STORE_OPTIONS = {
+    'ttl_seconds': int(os.environ.get('GAME_TTL_SECONDS', 7200)),
+    'max_games': int(os.environ.get('MAX_GAMES', 1000)),
+}
+if os.environ.get('GAME_STORE') == 'sqlite':
+    games = SQLiteGameStore(os.environ.get('GAME_STORE_PATH', 'games.db'), **GAME_STORE_OPTIONS)
+else:
+    games = GameStore(**GAME_STORE_OPTIONS)
+games.start_reaper()
+
+
+# ============================================================
+# GAME EVENTS
+# ============================================================
+
+# Typed facts the engine publishes as they happen. Every event starts with
+# the game_id; players are seat indices (0 or 1), slots are battlefield slots.
+UnitDeployed = namedtuple('UnitDeployed', 'game_id player slot card_id')
+AttackDeclared = namedtuple('AttackDeclared', 'game_id player attacker_slot attacker_id defender_slot defender_id')
+UnitDestroyed = namedtuple('UnitDestroyed', 'game_id player slot card_id cause')
+TrapTriggered = namedtuple('TrapTriggered', 'game_id player card_id')
+EnergyChanged = namedtuple('EnergyChanged', 'game_id player energy delta source')
+PhaseChanged = namedtuple('PhaseChanged', 'game_id turn player phase previous')
+GAME_EVENT_TYPES = (UnitDeployed, AttackDeclared, UnitDestroyed, TrapTriggered, EnergyChanged, PhaseChanged)
+
+
+def event_to_dict(event):
+    """JSON-ready form of an event: {'type': 'UnitDeployed', 'game_id': ..., ...}"""
+    return {'type': type(event).__name__, **event._asdict()}
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for game events
+
+    Handlers run synchronously in the thread that changed the game (with
+    the game's lock held), so they must be quick and must not block -
+    hand anything slow to another thread or event loop. Subscribing swaps
+    in a new handler table rather than editing it, so publish() never
+    needs a lock. GameState.emit() asks wants() first and does not even
+    build the event while nobody listens for its type.
+    """
+
+    def __init__(self):
+        self.handlers = {}  # event type (None = every type) -> tuple of handlers
+        self.lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+
+    def subscribe(self, handler, *event_types):
+        """Call handler(event) for the given event types, or for every type if none are given"""
+        with self.lock:
+            handlers = dict(self.handlers)
+            for event_type in event_types or (None,):
+                handlers[event_type] = handlers.get(event_type, ()) + (handler,)
+            self.handlers = handlers
+        return handler
+
+    def unsubscribe(self, handler):
+        with self.lock:
+            handlers = {}
+            for event_type, registered in self.handlers.items():
+                remaining = tuple(h for h in registered if h != handler)
+                if remaining:
+                    handlers[event_type] = remaining
+            self.handlers = handlers
+
+    def wants(self, event_type):
+        handlers = self.handlers
+        return event_type in handlers or None in handlers
+
+    def publish(self, event):
+        handlers = self.handlers
+        self.published += 1
+        for handler in handlers.get(type(event), ()) + handlers.get(None, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                # One broken consumer must not break the game that emitted the event
+                self.failed += 1
+                print(f"Event handler {handler!r} failed on {type(event).__name__}: {e}")
+
+    def stats(self):
+        """Bus counters for /api/metrics"""
+        handlers = self.handlers
+        return {
+            'published': self.published,
+            'failed': self.failed,
+            'subscriptions': {
+                (event_type.__name__ if event_type else '*'): len(registered)
+                for event_type, registered in handlers.items()
+            },
+        }
+
+
+# Live games publish here (see GameState.emit()); consumers subscribe at import time
+EVENT_BUS = EventBus()
+
+
+class ActionLog:
+    """
+    Append-only, per-game log of every accepted action
+    
+    Each game gets <directory>/<game_id>.log with one JSON line per accepted
+    request (endpoint, view args and JSON body), and <game_id>.snap holding
+    the most recent GameState.snapshot() (as a binary snapshot, see
+    encode_snapshot()) together with the log offset it covers. A snapshot is
+    taken when the game is created and then every snapshot_every actions,
+    so recovery loads the snapshot and replays only the tail of the log. The full log stays on disk as a replay/audit trail.
+    
+    Each entry also carries the game events (see EventBus) published since
+    the previous entry, so a replay viewer can animate what happened without
+    re-running the engine. Recovery replays actions with events muted.
+    
+    AI phases that ran in the worker pool are applied when their job is
+    collected, outside the advance_phase request that started them. That
+    is logged as an 'ai_result' entry followed by a fresh snapshot, so
+    recovery never has to re-run the job. Replay always runs the AI inline.
+    """
+    
+    # Endpoints that change a game and are replayed on recovery
+    ACTIONS = (
+        'play_card', 'attack', 'activate_trap', 'activate_counter_sigil', 'apply_pierce',
+        'target_technique', 'advance_phase', 'discard_card', 'rotfall_destroy',
+    )
+    
+    def __init__(self, directory, snapshot_every=25):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.seq = {}  # game_id -> number of actions logged
+        self.pending_events = {}  # game_id -> events not yet written with an action
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.snapshots = 0
+        self.recoveries = 0
+        self.replayed = 0
+        os.makedirs(directory, exist_ok=True)
+    
+    def path(self, game_id, extension):
+        # game_id comes from the URL - only accept real UUIDs as file names
+        return os.path.join(self.directory, f"{uuid.UUID(game_id)}.{extension}")
+    
+    def start(self, game):
+        """Record a new game's opening position"""
+        with self.lock:
+            self.seq[game.game_id] = 0
+            self.write_snapshot(game)
+    
+    def record_event(self, event):
+        """EventBus handler: hold an event until its action is appended (game lock held)"""
+        data = event_to_dict(event)
+        del data['game_id']
+        self.pending_events.setdefault(event.game_id, []).append(data)
+    
+    def take_events(self, game_id):
+        """Events recorded for a game since the last call"""
+        return self.pending_events.pop(game_id, [])
+    
+    def append(self, game, endpoint, view_args, body, events=()):
+        """Append one accepted action and snapshot every snapshot_every actions"""
+        with self.lock:
+            seq = self.seq.get(game.game_id, 0) + 1
+            self.seq[game.game_id] = seq
+            entry = {'seq': seq, 'time': time.time(), 'action': endpoint, 'args': view_args, 'body': body}
+            if events:
+                entry['events'] = events
+            with open(self.path(game.game_id, 'log'), 'a') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self.appended += 1
+            if seq % self.snapshot_every == 0:
+                self.write_snapshot(game)
+    
+    def checkpoint(self, game):
+        """Snapshot now, after a change the log can't replay (an AI job's result)"""
+        with self.lock:
+            self.write_snapshot(game)
+    
+    # .snap files: action count and log offset, then encode_snapshot() bytes
+    SNAP_HEADER = struct.Struct('<qq')
+    
+    def write_snapshot(self, game):
+        log_path = self.path(game.game_id, 'log')
+        snap_path = self.path(game.game_id, 'snap')
+        offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        with open(f"{snap_path}.tmp", 'wb') as f:
+            f.write(self.SNAP_HEADER.pack(self.seq.get(game.game_id, 0), offset))
+            f.write(encode_snapshot(game.snapshot(), compress=True))
+        os.replace(f"{snap_path}.tmp", snap_path)
+        self.snapshots += 1
+    
+    def read_snapshot(self, game_id):
+        """(seq, log_offset, snapshot dict) from a .snap file; None if missing or unreadable"""
+        try:
+            with open(self.path(game_id, 'snap'), 'rb') as f:
+                raw = f.read()
+            if raw[:1] == b'{':
+                # Written before binary snapshots
+                snap = json.loads(raw)
+                return snap['seq'], snap['log_offset'], snap['snapshot']
+            seq, offset = self.SNAP_HEADER.unpack_from(raw)
+            return seq, offset, decode_snapshot(raw[self.SNAP_HEADER.size:])
+        except (OSError, ValueError, KeyError, struct.error, zlib.error):
+            return None
+    
+    def entries(self, game_id, offset=0):
+        """Yield logged actions from a byte offset (0 = the whole history)"""
+        try:
+            f = open(self.path(game_id, 'log'), 'r')
+        except (OSError, ValueError):
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if line.endswith('\n'):  # A torn final write is ignored
+                    yield json.loads(line)
+    
+    def recover(self, game_id):
+        """Rebuild a game from its last snapshot plus the log tail; None if unknown"""
+        snap = self.read_snapshot(game_id)
+        if snap is None:
+            return None
+        seq, log_offset, snapshot = snap
+        
+        game = GameState.from_snapshot(snapshot)
+        # A snapshot taken while an AI job ran is from before the AI's move.
+        # The job's 'ai_result' entry replays it inline; without one the job
+        # is resumed by GameStore.get() (replayed actions would get a 409)
+        ai_job_id, game.ai_job_id = game.ai_job_id, None
+        # Replayed requests look the game up in the store, so it goes in first
+        games[game_id] = game
+        # The log already holds these actions' events - don't publish them twice
+        game.event_bus = EventBus()
+        replayed = 0
+        for entry in self.entries(game_id, log_offset):
+            if entry['action'] not in self.ACTIONS:
+                if ai_job_id and entry['args'].get('status') == 'done':
+                    game.advance_phase()
+                # Otherwise an 'ai_result' whose snapshot never made it to
+                # disk: the advance_phase before it already replayed the AI inline
+                ai_job_id = None
+                continue
+            view = app.view_functions[entry['action']]
+            with app.test_request_context(method='POST', json=entry['body'], environ_overrides={'sanctum.replay': True}):
+                view(**entry['args'])
+            replayed += 1
+        game.event_bus = EVENT_BUS
+        game.ai_job_id = ai_job_id
+        
+        with self.lock:
+            self.seq[game_id] = seq + replayed
+            self.recoveries += 1
+            self.replayed += replayed
+        return game
+    
+    def stats(self):
+        """Log counters for /api/metrics"""
+        return {
+            'appended': self.appended,
+            'snapshots': self.snapshots,
+            'recoveries': self.recoveries,
+            'replayed': self.replayed,
+        }
+
+
+# Event-sourced action log (off unless ACTION_LOG_DIR is set)
+ACTION_LOG = None
+if os.environ.get('ACTION_LOG_DIR'):
+    ACTION_LOG = ActionLog(
+        os.environ['ACTION_LOG_DIR'],
+        snapshot_every=int(os.environ.get('ACTION_LOG_SNAPSHOT_EVERY', 25)),
+    )
+    if games.loader is None and not isinstance(games, SQLiteGameStore):
+        games.loader = ACTION_LOG.recover
+    EVENT_BUS.subscribe(ACTION_LOG.record_event)
+
+
+# Callables run as listener(game_id) after any request changes a game
+# (WebSocket pushes, long-poll wakeups, ...)
+GAME_CHANGE_LISTENERS = []
+
+
+def notify_game_changed(game_id):
+    """Bump the game's version, wake its long-pollers and run the listeners (game lock held)"""
+    game = games.get(game_id)
+    if game is not None:
+        game.version += 1
+        games.condition_for(game_id).notify_all()
+    for listener in GAME_CHANGE_LISTENERS:
+        listener(game_id)
+
+
+def game_action(view):
+    """
+    Serialize a mutating endpoint per game
+    
+    Concurrent requests for the same game (double clicks, client retries)
+    run one at a time under that game's lock; different games never wait
+    for each other. The action log entry and the SQLite write happen before
+    the lock is released, so both see actions in the order they ran.
+    
+    While an AI phase runs in the worker pool every action is refused with
+    409: the job's result replaces the whole game when it is collected.
+    """
+    @wraps(view)
+    def wrapper(game_id, **kwargs):
+        # Unknown IDs never get a lock, so they can't grow games.game_locks
+        if games.get(game_id) is None:
+            return make_response(jsonify({'error': 'Game not found'}), 404)
+        with games.locked(game_id):
+            game = games.get(game_id)
+            if game is not None and getattr(game, 'ai_job_id', None):
+                return make_response(jsonify({'error': 'AI is still thinking', 'ai_job': game.ai_job_id}), 409)
+            response = make_response(view(game_id, **kwargs))
+            if request.environ.get('sanctum.replay'):
+                return response
+            if ACTION_LOG is not None:
+                events = ACTION_LOG.take_events(game_id)
+                if response.status_code < 400 and request.endpoint in ActionLog.ACTIONS:
+                    game = games.get(game_id)
+                    if game is not None:
+                        body = request.get_json(silent=True)
+                        if isinstance(body, dict):
+                            # Seat tokens stay out of the log (replays skip the check)
+                            body = {key: value for key, value in body.items() if key != 'token'}
+                        ACTION_LOG.append(game, request.endpoint, request.view_args, body, events)
+                        if request.environ.get('sanctum.ai_result'):
+                            ACTION_LOG.checkpoint(game)
+            if hasattr(games, 'flush'):
+                games.flush()
+            if response.status_code < 400:
+                notify_game_changed(game_id)
+            return response
+    return wrapper
+
+
+@app.after_request
+def flush_game_writes(response):
+    """Persist the games this request changed in one batch"""
+    if hasattr(games, 'flush'):
+        games.flush()
+    return response
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache of AI decisions keyed by a canonical state signature
+    
+    Keys are nested tuples of plain values (see GameState.plan_deploy() and
+    GameState.plan_attacks()), values are tuples. The cache can be saved to
+    and loaded from a JSON file so repeated positions stay cheap across runs.
+    """
+    
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()  # Request threads share the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Return the cached decision (refreshing its LRU position) or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        """Store a decision, evicting the least recently used entry when full"""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def stats(self):
+        """Hit/miss counters for /api/metrics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+    
+    def save(self, path):
+        """Write all entries (oldest first) to a JSON file"""
+        tmp_path = f"{path}.tmp"
+        with self.lock:
+            saved = [[key, value] for key, value in self.entries.items()]
+        with open(tmp_path, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp_path, path)
+    
+    def load(self, path):
+        """Load entries saved by save(); a missing or corrupt file is ignored"""
+        try:
+            with open(path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        
+        def to_tuple(value):
+            if isinstance(value, list):
+                return tuple(to_tuple(v) for v in value)
+            return value
+        
+        for key, value in saved:
+            self.put(to_tuple(key), to_tuple(value))
+
+
+# AI decisions (deploy plans, attack plans) keyed by canonical state signature.
+# Set AI_DECISION_CACHE_PATH to keep the cache on disk between runs.
+AI_DECISION_CACHE = DecisionCache(int(os.environ.get('AI_DECISION_CACHE_SIZE', 4096)))
+AI_DECISION_CACHE_PATH = os.environ.get('AI_DECISION_CACHE_PATH')
+if AI_DECISION_CACHE_PATH:
+    AI_DECISION_CACHE.load(AI_DECISION_CACHE_PATH)
+    atexit.register(AI_DECISION_CACHE.save, AI_DECISION_CACHE_PATH)
+
+# Endgame search: a bounded lookahead over attacks kicks in once decks are thin
+# or Control Loss is close to the limit, as long as the board is small enough
+# Either deck at or below this many cards
+ENDGAME_DECK_THRESHOLD = int(os.environ.get('AI_ENDGAME_DECK_THRESHOLD', 3))
+# Either player at or above this many Control Loss tokens
+ENDGAME_CONTROL_LOSS_THRESHOLD = int(os.environ.get('AI_ENDGAME_CONTROL_LOSS_THRESHOLD', 2))
+# Total Units on both battlefields
+ENDGAME_MAX_UNITS = int(os.environ.get('AI_ENDGAME_MAX_UNITS', 6))
+# Turns searched ahead (each ends with a draw)
+ENDGAME_SEARCH_TURNS = int(os.environ.get('AI_ENDGAME_SEARCH_TURNS', 4))
+ENDGAME_WIN_SCORE = 1000
+ENDGAME_TRANSPOSITION_TABLE = {}
+ENDGAME_TRANSPOSITION_TABLE_LIMIT = 200000
+
+# ============================================================
+# GAME LOG SINKS
+# ============================================================
+
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_LEVELS = {'debug': LOG_DEBUG, 'info': LOG_INFO, 'warning': LOG_WARNING}
+LOG_LEVEL_NAMES = {level: name for name, level in LOG_LEVELS.items()}
+
+
+class LogSink:
+    """
+    Where GameState.log() entries go
+    
+    Entries below `level` are dropped by GameState.log() before their
+    message is even formatted.
+    """
+    
+    def __init__(self, level=LOG_INFO):
+        self.level = level
+    
+    def emit(self, game, entry, level, args):
+        raise NotImplementedError
+
+
+class RingBufferSink(LogSink):
+    """Keeps the latest entries on the game (game.game_log, a bounded deque) for players to read"""
+    
+    def emit(self, game, entry, level, args):
+        game.game_log.append(entry)
+
+
+class NullSink(LogSink):
+    """Records nothing and formats nothing - for simulations and self-play"""
+    
+    def __init__(self):
+        super().__init__(level=float('inf'))
+    
+    def emit(self, game, entry, level, args):
+        pass
+
+
+class StructuredSink(LogSink):
+    """
+    Writes every entry as a JSON line for analytics
+    
+    Lines carry the game ID, timestamp, level, turn state and the raw
+    format arguments next to the rendered message, and are then passed on
+    to `inner` (normally a RingBufferSink so players still see the log).
+    Subscribed to the EventBus, it also writes every game event as a line
+    with a 'type' key (UnitDeployed, EnergyChanged, ...) instead of 'level'.
+    """
+    
+    def __init__(self, path, level=LOG_INFO, inner=None):
+        super().__init__(level)
+        self.stream = open(path, 'a', buffering=1)
+        self.inner = inner
+        self.lock = threading.Lock()
+    
+    def emit(self, game, entry, level, args):
+        record = {
+            'time': round(time.time(), 3),
+            'game_id': game.game_id,
+            'level': LOG_LEVEL_NAMES.get(level, level),
+            'half_turn': game.half_turn,
+            'active_player': game.active_player,
+            **entry,
+        }
+        if args:
+            record['args'] = [arg if isinstance(arg, (int, float, str, bool)) or arg is None else str(arg) for arg in args]
+        line = json.dumps(record, separators=(',', ':'))
+        with self.lock:
+            self.stream.write(line + '\n')
+        if self.inner is not None and level >= self.inner.level:
+            self.inner.emit(game, entry, level, args)
+    
+    def record_event(self, event):
+        """EventBus handler: one JSON line per game event"""
+        line = json.dumps({'time': round(time.time(), 3), **event_to_dict(event)}, separators=(',', ':'))
+        with self.lock:
+            self.stream.write(line + '\n')
+
+
+# Entries kept per game, and the sink live games log to:
+# GAME_LOG_LEVEL=debug|info|warning, GAME_EVENT_LOG=<path> adds JSON lines
+GAME_LOG_SIZE = int(os.environ.get('GAME_LOG_SIZE', 200))
+GAME_LOG_SINK = RingBufferSink(LOG_LEVELS.get(os.environ.get('GAME_LOG_LEVEL', 'info').lower(), LOG_INFO))
+if os.environ.get('GAME_EVENT_LOG'):
+    GAME_LOG_SINK = StructuredSink(os.environ['GAME_EVENT_LOG'], level=GAME_LOG_SINK.level, inner=GAME_LOG_SINK)
+    EVENT_BUS.subscribe(GAME_LOG_SINK.record_event)
+NULL_LOG_SINK = NullSink()
+
+
+# ============================================================
+# BINARY SNAPSHOTS
+# ============================================================
+
+# Versioned binary form of GameState.snapshot(), used wherever a snapshot
+# leaves the process: the SQLite store, AI worker hand-off and action log
+# checkpoints. Layout (little-endian):
+#
+#   header   b'S7', format version, flags (SNAPSHOT_ZLIB, SNAPSHOT_JSON,
+#            SNAPSHOT_CARD_IDS)
+#   game     game_id (16 UUID bytes), turn, half_turn, version, active
+#            player, winner (-1 = none), phase, ai_players bitmask,
+#            cards_version
+#   card IDs (SNAPSHOT_CARD_IDS only) the ID behind every card byte used
+#   players  x2: energy, Control Loss and the other counters, field, then
+#            each per-slot list packed as 5 numbers (SNAPSHOT_PLAYER), then
+#            deck, hand and discard at one byte per card, then any other
+#            keys as JSON
+#   log      turns, phases and the NUL-joined messages of the game log
+#   trigger  pending_trap_trigger as JSON, card dicts replaced by their IDs
+#   extras   (format 2) any other game keys as JSON, e.g. the ID of an AI
+#            job still running for the game
+#
+# Cards are bytes: their index in the game's card table, 255 for an empty
+# slot. Stored snapshots (compress=True) and snapshots of games on an older
+# card table also carry the IDs of the cards they use, so they decode in a
+# process that never loaded that table (after a restart with a changed card
+# file, or in a fresh AI worker); the rest need the game's table loaded.
+#
+# decode_snapshot(encode_snapshot(s)) == s for every GameState snapshot:
+# anything the layout cannot hold exactly (an unexpected key, a number out
+# of range, a NUL in a log message) makes encode_snapshot() store that
+# snapshot as JSON instead, with SNAPSHOT_JSON set. decode_snapshot() also
+# reads the zlib-compressed JSON that SQLite stores held before this format.
+SNAPSHOT_MAGIC = b'S7'
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_READABLE_VERSIONS = (1, 2)  # Format 1 had no game extras
+SNAPSHOT_ZLIB = 1 << 0  # Body is zlib-compressed
+SNAPSHOT_JSON = 1 << 1  # Body is a JSON snapshot (fallback)
+SNAPSHOT_CARD_IDS = 1 << 2  # Body ends with the IDs of the cards it uses
+SNAPSHOT_PHASES = ('start', 'deploy', 'combat', 'end')
+SNAPSHOT_PHASE_CODES = {phase: i for i, phase in enumerate(SNAPSHOT_PHASES)}
+SNAPSHOT_BUFF_EXPIRES = (None, 'end_turn', 'start_next_turn')
+SNAPSHOT_BUFF_EXPIRES_CODES = {expires: i for i, expires in enumerate(SNAPSHOT_BUFF_EXPIRES)}
+NO_CARD = 255
+
+SNAPSHOT_KEYS = frozenset((
+    'game_id', 'turn', 'active_player', 'half_turn', 'phase', 'players', 'winner', 'game_log',
+    'pending_trap_trigger', 'version', 'ai_players', 'cards_version',
+))  # Game keys the fixed layout covers (any others travel as JSON)
+# Per-slot lists, packed in this order after the battlefield cards
+SNAPSHOT_SLOT_FLAGS = (
+    'battlefield_exhausted', 'battlefield_corrupt', 'battlefield_no_retaliate',
+    'battlefield_no_attack', 'battlefield_enter_exhausted_next_turn',
+)
+SNAPSHOT_SLOT_NUMBERS = (
+    'battlefield_wither', 'battlefield_wither_applied_turn', 'battlefield_corrupt_applied_turn',
+    'battlefield_atk_buff', 'battlefield_def_buff', 'battlefield_spd_buff', 'battlefield_deployed_turn',
+)
+SNAPSHOT_SLOT_COLUMNS = operator.itemgetter(*SNAPSHOT_SLOT_FLAGS + SNAPSHOT_SLOT_NUMBERS)
+SNAPSHOT_PLAYER_COUNTERS = operator.itemgetter(
+    'energy', 'control_loss', 'must_discard', 'pending_energy', 'rotfall_must_destroy'
+)
+# Player keys the fixed layout covers (any others travel as JSON)
+SNAPSHOT_PLAYER_KEYS = frozenset(SNAPSHOT_SLOT_FLAGS + SNAPSHOT_SLOT_NUMBERS + (
+    'deck', 'hand', 'battlefield', 'battlefield_buff_expires', 'field', 'traps', 'traps_placed_turn',
+    'discard', 'energy', 'control_loss', 'must_discard', 'pending_energy', 'rotfall_must_destroy',
+    'relay_node_gained', 'skip_next_energy_gain',
+))
+
+SNAPSHOT_HEADER = struct.Struct('<2sBB')
+SNAPSHOT_GAME = struct.Struct('<16siiiBbBB')
+SNAPSHOT_PLAYER = struct.Struct('<5hBB5B25?5h5i5i5h5h5h5i5B3B3i')
+SNAPSHOT_SIZES = struct.Struct('<HHHI')  # deck, hand, discard, extras bytes
+SNAPSHOT_LOG = struct.Struct('<HI')  # entries, message bytes
+SNAPSHOT_BLOB = struct.Struct('<I')
+SNAPSHOT_CARD_LIST = struct.Struct('<BI')  # cards, ID bytes
+
+
+# Weak keys, so caching a table's codes doesn't keep the table alive (see CARD_TABLES)
+SNAPSHOT_CARD_CODES = weakref.WeakKeyDictionary()
+
+
+def snapshot_card_codes(table):
+    """(card ID -> byte, byte -> card ID) for a card table, None <-> NO_CARD"""
+    cached = SNAPSHOT_CARD_CODES.get(table)
+    if cached is not None:
+        return cached
+    if len(table.ids) >= NO_CARD:
+        raise ValueError('Too many cards for one-byte card codes')
+    codes = dict(table.index)
+    codes[None] = NO_CARD
+    cached = SNAPSHOT_CARD_CODES[table] = codes, table.ids + (None,) * (NO_CARD + 1 - len(table.ids))
+    return cached
+
+
+def encode_snapshot(data, compress=False):
+    """
+    GameState.snapshot() dict -> bytes (see BINARY SNAPSHOTS above)
+    
+    Args:
+        data: A snapshot() dict
+        compress: zlib-compress the body and include card IDs (for storage)
+    """
+    try:
+        card_ids = compress or data['cards_version'] != CARD_TABLE.version
+        flags, body = 0, encode_snapshot_body(data, card_ids)
+    except (KeyError, TypeError, ValueError, AttributeError, IndexError, struct.error):
+        flags, body = SNAPSHOT_JSON, json.dumps(data, separators=(',', ':')).encode('utf-8')
+    else:
+        flags |= SNAPSHOT_CARD_IDS if card_ids else 0
+    if compress:
+        flags |= SNAPSHOT_ZLIB
+        body = zlib.compress(body)
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, flags) + body
+
+
+def encode_snapshot_body(data, card_ids):
+    if not SNAPSHOT_KEYS <= data.keys():
+        raise KeyError('Missing snapshot keys')
+    game_id = uuid.UUID(data['game_id'])
+    if str(game_id) != data['game_id']:
+        raise ValueError('game_id is not a canonical UUID')
+    ai_players = data['ai_players']
+    if ai_players not in ([], [0], [1], [0, 1]):
+        raise ValueError('ai_players is not a sorted list of seats')
+    cards_version = data['cards_version'].encode('utf-8')
+    table = CARD_TABLES[data['cards_version']]
+    codes, _ = snapshot_card_codes(table)
+    card_bytes = codes.__getitem__
+    
+    winner = data['winner']
+    parts = [
+        SNAPSHOT_GAME.pack(
+            game_id.bytes, data['turn'], data['half_turn'], data['version'], data['active_player'],
+            -1 if winner is None else winner, SNAPSHOT_PHASE_CODES[data['phase']],
+            sum(1 << seat for seat in ai_players)
+        ),
+        bytes((len(cards_version),)), cards_version,
+    ]
+    cards = []  # Every card byte string, for the card ID list
+    for player in data['players']:
+        if type(player['relay_node_gained']) is not bool or type(player.get('skip_next_energy_gain', False)) is not bool:
+            raise TypeError('Expected bool flags')
+        values = list(SNAPSHOT_PLAYER_COUNTERS(player))
+        values.append(
+            player['relay_node_gained']
+            | ('skip_next_energy_gain' in player) << 1
+            | player.get('skip_next_energy_gain', False) << 2
+        )
+        values.append(card_bytes(player['field']))
+        values += map(card_bytes, player['battlefield'])
+        for column in SNAPSHOT_SLOT_COLUMNS(player):
+            values += column
+        values += map(SNAPSHOT_BUFF_EXPIRES_CODES.__getitem__, player['battlefield_buff_expires'])
+        values += map(card_bytes, player['traps'])
+        values += player['traps_placed_turn']
+        for key in SNAPSHOT_SLOT_FLAGS:
+            for flag in player[key]:
+                if type(flag) is not bool:
+                    raise TypeError(f'{key} holds a non-bool')
+        deck = bytes(player['deck'])
+        hand = bytes(map(card_bytes, player['hand']))
+        discard = bytes(map(card_bytes, player['discard']))
+        extra_keys = player.keys() - SNAPSHOT_PLAYER_KEYS
+        extras = json.dumps({key: player[key] for key in extra_keys}, separators=(',', ':')).encode('utf-8') if extra_keys else b''
+        parts += (
+            SNAPSHOT_PLAYER.pack(*values),
+            SNAPSHOT_SIZES.pack(len(deck), len(hand), len(discard), len(extras)),
+            deck, hand, discard, extras,
+        )
+        cards += (deck, hand, discard, bytes(values[6:12]), bytes(values[77:80]))
+    
+    log = data['game_log']
+    if any(len(entry) != 3 for entry in log):
+        raise KeyError('Unexpected log entry keys')
+    turns = [entry['turn'] for entry in log]
+    phases = bytes(map(SNAPSHOT_PHASE_CODES.__getitem__, [entry['phase'] for entry in log]))
+    messages = '\0'.join([entry['message'] for entry in log])
+    if messages.count('\0') != max(len(log) - 1, 0):
+        raise ValueError('NUL in a log message')
+    messages = messages.encode('utf-8')
+    parts += (
+        SNAPSHOT_LOG.pack(len(log), len(messages)),
+        struct.pack(f'<{len(turns)}i', *turns), phases, messages,
+    )
+    
+    trigger = data['pending_trap_trigger']
+    trigger = b'' if trigger is None else json.dumps(cards_to_ids(trigger, table), separators=(',', ':')).encode('utf-8')
+    parts += (SNAPSHOT_BLOB.pack(len(trigger)), trigger)
+    
+    extra_keys = data.keys() - SNAPSHOT_KEYS
+    extras = json.dumps({key: data[key] for key in extra_keys}, separators=(',', ':')).encode('utf-8') if extra_keys else b''
+    parts += (SNAPSHOT_BLOB.pack(len(extras)), extras)
+    
+    if card_ids:
+        used = bytes(sorted(set(b''.join(cards)) - {NO_CARD}))
+        listed = ','.join([table.ids[c] for c in used]).encode('utf-8')
+        parts[3:3] = (SNAPSHOT_CARD_LIST.pack(len(used), len(listed)), used, listed)
+    return b''.join(parts)
+
+
+def cards_to_ids(value, table):
+    """Replace whole card dicts inside a trap trigger with {'$card': id}"""
+    if isinstance(value, dict):
+        card_id = value.get('id')
+        if isinstance(card_id, str) and table.by_id.get(card_id) == value:
+            return {'$card': card_id}
+        return {key: cards_to_ids(item, table) for key, item in value.items()}
+    if isinstance(value, list):
+        return [cards_to_ids(item, table) for item in value]
+    return value
+
+
+def ids_to_cards(value, table):
+    if isinstance(value, dict):
+        if len(value) == 1 and '$card' in value:
+            return json.loads(json.dumps(table.by_id[value['$card']]))
+        return {key: ids_to_cards(item, table) for key, item in value.items()}
+    if isinstance(value, list):
+        return [ids_to_cards(item, table) for item in value]
+    return value
+
+
+def decode_snapshot(blob):
+    """
+    bytes from encode_snapshot() (or a legacy zlib JSON blob) -> snapshot() dict
+    
+    Raises:
+        ValueError: Not a snapshot, a format version this code can't read, or
+            an uncompressed snapshot whose card table is not loaded
+    """
+    blob = bytes(blob)
+    if blob[:2] != SNAPSHOT_MAGIC:
+        return json.loads(zlib.decompress(blob))
+    _, format_version, flags = SNAPSHOT_HEADER.unpack_from(blob)
+    if format_version not in SNAPSHOT_READABLE_VERSIONS:
+        raise ValueError(f'Unsupported snapshot format version {format_version}')
+    body = blob[SNAPSHOT_HEADER.size:]
+    if flags & SNAPSHOT_ZLIB:
+        body = zlib.decompress(body)
+    if flags & SNAPSHOT_JSON:
+        return json.loads(body)
+    
+    game_id, turn, half_turn, version, active_player, winner, phase, ai_mask = SNAPSHOT_GAME.unpack_from(body)
+    offset = SNAPSHOT_GAME.size + 1 + body[SNAPSHOT_GAME.size]
+    cards_version = body[SNAPSHOT_GAME.size + 1:offset].decode('utf-8')
+    
+    # Same table choice as GameState.restore(). A stored snapshot from a card
+    # table this process never loaded has its card bytes recoded by ID.
+    table = CARD_TABLES.get(cards_version)
+    recode = None
+    if flags & SNAPSHOT_CARD_IDS:
+        used_count, listed_size = SNAPSHOT_CARD_LIST.unpack_from(body, offset)
+        offset += SNAPSHOT_CARD_LIST.size
+        used = body[offset:offset + used_count]
+        offset += used_count
+        listed = body[offset:offset + listed_size].decode('utf-8').split(',')
+        offset += listed_size
+        if table is None:
+            table = CARD_TABLE
+            try:
+                recode = bytearray(range(NO_CARD + 1))
+                for old, card_id in zip(used, listed):
+                    recode[old] = table.index[card_id]
+            except KeyError as e:
+                raise ValueError(f'Card {e} is no longer in the card database')
+            recode = bytes(recode)
+    elif table is None:
+        raise ValueError(f'Card table {cards_version} is not loaded')
+    _, card_ids = snapshot_card_codes(table)
+    
+    players = []
+    for _ in range(2):
+        values = SNAPSHOT_PLAYER.unpack_from(body, offset)
+        offset += SNAPSHOT_PLAYER.size
+        deck_size, hand_size, discard_size, extras_size = SNAPSHOT_SIZES.unpack_from(body, offset)
+        offset += SNAPSHOT_SIZES.size
+        deck = body[offset:offset + deck_size]
+        offset += deck_size
+        hand = body[offset:offset + hand_size]
+        offset += hand_size
+        discard = body[offset:offset + discard_size]
+        offset += discard_size
+        extras = body[offset:offset + extras_size]
+        offset += extras_size
+        refs = bytes(values[6:12]) + bytes(values[77:80])  # field, battlefield, traps
+        if recode:
+            deck, hand, discard, refs = (cards.translate(recode) for cards in (deck, hand, discard, refs))
+        
+        bits = values[5]
+        player = {
+            'deck': list(deck),
+            'hand': [card_ids[c] for c in hand],
+            'battlefield': [card_ids[c] for c in refs[1:6]],
+        }
+        for i, key in enumerate(SNAPSHOT_SLOT_FLAGS + SNAPSHOT_SLOT_NUMBERS):
+            player[key] = list(values[12 + i * 5:17 + i * 5])
+        player.update({
+            'battlefield_buff_expires': [SNAPSHOT_BUFF_EXPIRES[code] for code in values[72:77]],
+            'field': card_ids[refs[0]],
+            'traps': [card_ids[c] for c in refs[6:9]],
+            'traps_placed_turn': list(values[80:83]),
+            'discard': [card_ids[c] for c in discard],
+            'energy': values[0],
+            'control_loss': values[1],
+            'must_discard': values[2],
+            'pending_energy': values[3],
+            'rotfall_must_destroy': values[4],
+            'relay_node_gained': bool(bits & 1),
+        })
+        if bits & 2:
+            player['skip_next_energy_gain'] = bool(bits & 4)
+        if extras:
+            player.update(json.loads(extras))
+        players.append(player)
+    
+    count, messages_size = SNAPSHOT_LOG.unpack_from(body, offset)
+    offset += SNAPSHOT_LOG.size
+    turns = struct.unpack_from(f'<{count}i', body, offset)
+    offset += 4 * count
+    phases = body[offset:offset + count]
+    offset += count
+    messages = body[offset:offset + messages_size].decode('utf-8').split('\0') if count else []
+    offset += messages_size
+    game_log = [
+        {'turn': entry_turn, 'phase': SNAPSHOT_PHASES[entry_phase], 'message': message}
+        for entry_turn, entry_phase, message in zip(turns, phases, messages)
+    ]
+    
+    trigger_size, = SNAPSHOT_BLOB.unpack_from(body, offset)
+    offset += SNAPSHOT_BLOB.size
+    trigger = None
+    if trigger_size:
+        trigger = ids_to_cards(json.loads(body[offset:offset + trigger_size]), table)
+    offset += trigger_size
+    
+    extras = {}
+    if format_version >= 2:
+        extras_size, = SNAPSHOT_BLOB.unpack_from(body, offset)
+        offset += SNAPSHOT_BLOB.size
+        if extras_size:
+            extras = json.loads(body[offset:offset + extras_size])
+    
+    return {
+        **extras,
+        'game_id': str(uuid.UUID(bytes=game_id)),
+        'turn': turn,
+        'active_player': active_player,
+        'half_turn': half_turn,
+        'phase': SNAPSHOT_PHASES[phase],
+        'players': players,
+        'winner': None if winner < 0 else winner,
+        'game_log': game_log,
+        'pending_trap_trigger': trigger,
+        'version': version,
+        'ai_players': [seat for seat in (0, 1) if ai_mask >> seat & 1],
+        'cards_version': cards_version,
+    }
+
 
 class GameState:
-    def __init__(self, player1_deck, player2_deck):
-        self.game_id = str(uuid.uuid4())
+    def __init__(self, player1_deck, player2_deck, ai_players=(1,), cards=None, log_sink=None, event_bus=None):
+        self.cards = cards or CARD_TABLE  # Card data this game plays with, even after a reload
+        self.log_sink = log_sink or GAME_LOG_SINK
+        self.event_bus = event_bus or EVENT_BUS
+        self.game_log = deque(maxlen=GAME_LOG_SIZE)
+        self.game_id = new_owned_id()
+        self.ai_players = set(ai_players)  # Seats the server plays itself (empty for PvP)
+        # Secret per human seat in PvP, proving a request comes from that seat (see seat_error())
+        self.seat_tokens = None if self.ai_players else [secrets.token_urlsafe(16) for _ in range(2)]
         self.turn = 1
         self.active_player = 0  # 0 or 1
         self.half_turn = 1  # Increments every time any player starts a turn
@@ -50,7 +1537,7 @@ class GameState:
         # Player states
         self.players = [
             {
-                'deck': player1_deck.copy(),
+                'deck': [self.cards.index[card_id] for card_id in player1_deck],  # Top of deck last
                 'hand': [],
                 'battlefield': [None, None, None, None, None],  # 5 unit slots
                 'battlefield_exhausted': [False, False, False, False, False],  # Exhaustion state
@@ -78,7 +1565,7 @@ class GameState:
                 'relay_node_gained': False,  # Track Relay Node gain this turn (max 1)
             },
             {
-                'deck': player2_deck.copy(),
+                'deck': [self.cards.index[card_id] for card_id in player2_deck],
                 'hand': [],
                 'battlefield': [None, None, None, None, None],
                 'battlefield_exhausted': [False, False, False, False, False],
@@ -113,34 +1600,127 @@ class GameState:
             self.draw_cards(player, 5)
         
         self.winner = None
-        self.game_log = []
+        self.pending_trap_trigger = None  # Trap waiting for its owner's answer (see activate_trap())
+        self.version = 0  # Bumped after every change (see notify_game_changed())
+    
+    # Fields that make up a game in progress (everything else is derived)
+    SNAPSHOT_FIELDS = ('game_id', 'turn', 'active_player', 'half_turn', 'phase', 'players', 'winner', 'game_log')
+    
+    def snapshot(self):
+        """Compact, picklable copy of the game's mutable state"""
+        data = {field: getattr(self, field) for field in self.SNAPSHOT_FIELDS}
+        data['game_log'] = list(self.game_log)
+        data['pending_trap_trigger'] = getattr(self, 'pending_trap_trigger', None)
+        data['version'] = self.version
+        data['ai_players'] = sorted(self.ai_players)
+        data['cards_version'] = self.cards.version
+        if getattr(self, 'ai_job_id', None):
+            # Reloaded games keep refusing actions until the job is resumed (see resume_ai_job())
+            data['ai_job_id'] = self.ai_job_id
+        if getattr(self, 'seat_tokens', None):
+            data['seat_tokens'] = list(self.seat_tokens)
+        return data
+    
+    def restore(self, data):
+        """Replace this game's state with a snapshot() taken elsewhere"""
+        for field in self.SNAPSHOT_FIELDS:
+            setattr(self, field, data[field])
+        self.game_log = deque(data['game_log'], maxlen=GAME_LOG_SIZE)
+        if not hasattr(self, 'log_sink'):
+            self.log_sink = GAME_LOG_SINK
+        if not hasattr(self, 'event_bus'):
+            self.event_bus = EVENT_BUS
+        self.pending_trap_trigger = data.get('pending_trap_trigger')
+        # Never go back: a worker's snapshot carries the version it was taken at,
+        # and spectator renders and long-polls key on the live one
+        self.version = max(getattr(self, 'version', 0), data.get('version', 0))
+        self.ai_players = set(data.get('ai_players', (1,)))
+        self.ai_job_id = data.get('ai_job_id')
+        self.seat_tokens = data.get('seat_tokens')
+        # A version this process never loaded (e.g. from before a restart) plays with the current cards
+        self.cards = CARD_TABLES.get(data.get('cards_version'), CARD_TABLE)
+        for player in self.players:
+            deck = player['deck']
+            if deck and isinstance(deck[0], str):
+                # Snapshot from before decks were indexed: top card was first
+                player['deck'] = [self.cards.index[card_id] for card_id in reversed(deck)]
+    
+    @classmethod
+    def from_snapshot(cls, data):
+        """Rebuild a GameState from snapshot() without dealing new hands"""
+        game = cls.__new__(cls)
+        game.restore(data)
+        return game
         
     def draw_cards(self, player, count=1):
         """Draw cards from deck to hand"""
+        deck = player['deck']
         for _ in range(count):
-            if player['deck']:
-                card_id = player['deck'].pop(0)
-                player['hand'].append(card_id)
+            if deck:
+                # The top of the deck is the end of the list, so drawing is O(1)
+                player['hand'].append(self.cards.ids[deck.pop()])
             else:
                 # Deck exhaustion - player loses
-                player_idx = self.players.index(player)
+                player_idx = 0 if player is self.players[0] else 1
                 self.winner = 1 - player_idx
-                self.log(f"Player {player_idx + 1} ran out of cards and loses!")
+                self.log("Player %s ran out of cards and loses!", player_idx + 1)
     
-    def log(self, message):
-        """Add message to game log"""
-        self.game_log.append({
+    def log(self, message, *args, level=LOG_INFO):
+        """
+        Add message to game log (through the game's log sink)
+        
+        Extra args are %-formatted into the message only if the sink keeps
+        this level, so DEBUG messages cost nothing when DEBUG is off.
+        """
+        sink = self.log_sink
+        if level < sink.level:
+            return
+        if args:
+            message = message % args
+        sink.emit(self, {
             'turn': self.turn,
             'phase': self.phase,
             'message': message
-        })
+        }, level, args)
     
+    def emit(self, event_type, *fields):
+        """Publish a game event; nothing is built unless someone subscribes to its type"""
+        if self.event_bus.wants(event_type):
+            self.event_bus.publish(event_type(self.game_id, *fields))
+    
+    def change_energy(self, player, delta, source):
+        """Add `delta` (may be negative) to a player's energy and publish EnergyChanged"""
+        player['energy'] += delta
+        if delta and self.event_bus.wants(EnergyChanged):
+            seat = 0 if player is self.players[0] else 1
+            self.event_bus.publish(EnergyChanged(self.game_id, seat, player['energy'], delta, source))
+    
+    def set_phase(self, phase):
+        """Move to `phase` and publish PhaseChanged"""
+        previous = self.phase
+        self.phase = phase
+        if phase != previous:
+            self.emit(PhaseChanged, self.turn, self.active_player, phase, previous)
+    
+    def recent_log(self, count=10):
+        """The last `count` log entries"""
+        return list(self.game_log)[-count:]
+    
+    def viewer_for(self, player):
+        """Perspective to answer `player` with: themselves, or the human when `player` is the AI"""
+        if player in self.ai_players:
+            return 1 - player
+        return player
+
     def get_state(self, player_perspective=0):
-        """Get game state from a player's perspective"""
+        """Get game state from a player's perspective (or SPECTATOR for neither)"""
+        if player_perspective == SPECTATOR:
+            return self.get_spectator_state()
         opponent = 1 - player_perspective
         
         return {
             'game_id': self.game_id,
+            'version': self.version,
             'turn': self.turn,
             'phase': self.phase,
             'active_player': self.active_player,
@@ -169,37 +1749,71 @@ class GameState:
                 'deck_count': len(self.players[player_perspective]['deck']),
                 'discard_count': len(self.players[player_perspective]['discard'])
             },
-            'opponent': {
-                'energy': self.players[opponent]['energy'],
-                'control_loss': self.players[opponent]['control_loss'],
-                'hand_count': len(self.players[opponent]['hand']),
-                'battlefield': [
-                    self.get_card_data(
-                        cid, 
-                        self.players[opponent]['battlefield_exhausted'][i],
-                        self.players[opponent]['battlefield_wither'][i],
-                        self.players[opponent]['battlefield_corrupt'][i],
-                        self.players[opponent]['battlefield_atk_buff'][i],
-                        self.players[opponent]['battlefield_def_buff'][i],
-                        self.players[opponent]['battlefield_spd_buff'][i],
-                        self.players[opponent]['battlefield_no_attack'][i]
-                    ) if cid else None 
-                    for i, cid in enumerate(self.players[opponent]['battlefield'])
-                ],
-                'field': self.get_card_data(self.players[opponent]['field']) if self.players[opponent]['field'] else None,
-                'trap_count': sum(1 for t in self.players[opponent]['traps'] if t is not None),
-                'deck_count': len(self.players[opponent]['deck']),
-                'discard_count': len(self.players[opponent]['discard'])
-            },
-            'log': self.game_log[-10:]  # Last 10 messages
+            'opponent': self.get_public_player_state(opponent),
+            'log': self.recent_log(10)  # Last 10 messages
+        }
+    
+    def get_public_player_state(self, player_idx):
+        """What anyone can see of a player: no hand contents, traps face-down"""
+        player = self.players[player_idx]
+        return {
+            'energy': player['energy'],
+            'control_loss': player['control_loss'],
+            'hand_count': len(player['hand']),
+            'battlefield': [
+                self.get_card_data(
+                    cid, 
+                    player['battlefield_exhausted'][i],
+                    player['battlefield_wither'][i],
+                    player['battlefield_corrupt'][i],
+                    player['battlefield_atk_buff'][i],
+                    player['battlefield_def_buff'][i],
+                    player['battlefield_spd_buff'][i],
+                    player['battlefield_no_attack'][i]
+                ) if cid else None 
+                for i, cid in enumerate(player['battlefield'])
+            ],
+            'field': self.get_card_data(player['field']) if player['field'] else None,
+            'trap_count': sum(1 for t in player['traps'] if t is not None),
+            'deck_count': len(player['deck']),
+            'discard_count': len(player['discard'])
+        }
+    
+    def get_spectator_state(self):
+        """Game state for spectators: both players' public info, neither hand"""
+        return {
+            'game_id': self.game_id,
+            'version': self.version,
+            'turn': self.turn,
+            'phase': self.phase,
+            'active_player': self.active_player,
+            'winner': self.winner,
+            'players': [self.get_public_player_state(0), self.get_public_player_state(1)],
+            'log': self.recent_log(10)
         }
     
+    def spectator_payload(self):
+        """
+        Serialized spectator state, rendered once per version
+        
+        Every spectator of a game gets the same bytes, so a broadcast game
+        costs one get_spectator_state() per change however many people watch.
+        Call with the game's lock held.
+        """
+        cached = getattr(self, 'spectator_render', None)
+        if cached is None or cached[0] != self.version:
+            body = json.dumps(self.get_spectator_state(), separators=(',', ':')).encode('utf-8')
+            cached = self.spectator_render = (self.version, body)
+            SPECTATOR_STATS['renders'] += 1
+        SPECTATOR_STATS['served'] += 1
+        return cached[1]
+    
     def get_card_data(self, card_id, is_exhausted=False, wither_stacks=0, is_corrupt=False, atk_buff=0, def_buff=0, spd_buff=0, no_attack=False):
         """Get card data with runtime state"""
         if not card_id:
             return None
         
-        card = CARDS_BY_ID.get(card_id, {}).copy()
+        card = self.cards.by_id.get(card_id, {}).copy()
         # Add exhaustion state
         card['is_exhausted'] = is_exhausted
         # Add Wither stacks
@@ -245,7 +1859,7 @@ class GameState:
             if not trap_id:
                 continue  # Empty slot
             
-            trap = CARDS_BY_ID[trap_id]
+            trap = self.cards.by_id[trap_id]
             
             # Check if player can afford the trap
             if defender['energy'] < trap['cost']:
@@ -331,8 +1945,9 @@ class GameState:
         if not trigger_data:
             trigger_data = {}
         
-        trap = CARDS_BY_ID[trap_id]
+        trap = self.cards.by_id[trap_id]
         result = {'success': True, 'messages': []}
+        self.emit(TrapTriggered, trap_owner, trap_id)
         
         # ============================================
         # BATCH 1: SIMPLE ATTACK TRAPS
@@ -348,11 +1963,11 @@ class GameState:
                 self.players[attacker_player]['battlefield_no_attack'][attacker_index] = True
                 
                 attacker_card_id = self.players[attacker_player]['battlefield'][attacker_index]
-                attacker_name = CARDS_BY_ID[attacker_card_id]['name']
+                attacker_name = self.cards.by_id[attacker_card_id]['name']
                 
                 result['attack_cancelled'] = True
                 result['messages'].append(f"{attacker_name} cannot attack for the rest of the turn!")
-                self.log(f"{attacker_name} cannot attack for the rest of the turn (Counter Measure)")
+                self.log("%s cannot attack for the rest of the turn (Counter Measure)", attacker_name)
         
         elif trap_id == 'generic_false_step':
             # Cancel attack + exhaust attacker
@@ -366,11 +1981,11 @@ class GameState:
                 self.players[attacker_player]['battlefield_exhausted'][attacker_index] = True
                 
                 attacker_card_id = self.players[attacker_player]['battlefield'][attacker_index]
-                attacker_name = CARDS_BY_ID[attacker_card_id]['name']
+                attacker_name = self.cards.by_id[attacker_card_id]['name']
                 
                 result['attack_cancelled'] = True
                 result['messages'].append(f"{attacker_name} is exhausted and cannot attack!")
-                self.log(f"{attacker_name} exhausted by False Step")
+                self.log("%s exhausted by False Step", attacker_name)
         
         elif trap_id == 'miasma_rot_beneath_the_surface':
             # Reduce attacker's ATK by -1 until end of their turn
@@ -384,11 +1999,11 @@ class GameState:
                 self.players[attacker_player]['battlefield_buff_expires'][attacker_index] = 'end_turn'
                 
                 attacker_card_id = self.players[attacker_player]['battlefield'][attacker_index]
-                attacker_name = CARDS_BY_ID[attacker_card_id]['name']
+                attacker_name = self.cards.by_id[attacker_card_id]['name']
                 
                 result['attack_cancelled'] = False  # Attack still happens
                 result['messages'].append(f"{attacker_name}'s ATK reduced by -1!")
-                self.log(f"{attacker_name} ATK -1 (Rot beneath the Surface)")
+                self.log("%s ATK -1 (Rot beneath the Surface)", attacker_name)
         
         # ============================================
         # BATCH 2: COMPLEX ATTACK TRAPS
@@ -401,7 +2016,7 @@ class GameState:
             
             if attacker_player is not None and attacker_index is not None:
                 attacker_card_id = self.players[attacker_player]['battlefield'][attacker_index]
-                attacker_name = CARDS_BY_ID[attacker_card_id]['name']
+                attacker_name = self.cards.by_id[attacker_card_id]['name']
                 
                 # Return to hand
                 self.players[attacker_player]['hand'].append(attacker_card_id)
@@ -419,7 +2034,7 @@ class GameState:
                 
                 result['attack_cancelled'] = True
                 result['messages'].append(f"{attacker_name} returned to hand!")
-                self.log(f"{attacker_name} returned to hand (Return to Sender)")
+                self.log("%s returned to hand (Return to Sender)", attacker_name)
         
         elif trap_id == 'skyforge_self_destruct':
             # Set a flag that will destroy attacker IF defender is destroyed
@@ -456,7 +2071,7 @@ class GameState:
             original_defender_index = trigger_data.get('defender_index')
             new_defender_index = trigger_data.get('selected_target_index')
             
-            self.log(f"🔀 Decoy Protocol: Redirecting attack from slot {original_defender_index} to slot {new_defender_index}")
+            self.log("🔀 Decoy Protocol: Redirecting attack from slot %s to slot %s", original_defender_index, new_defender_index)
             
             if new_defender_index is not None:
                 # Get unit names for messaging
@@ -465,11 +2080,11 @@ class GameState:
                 new_unit_id = self.players[defender_player]['battlefield'][new_defender_index]
                 
                 if original_unit_id and new_unit_id:
-                    original_name = CARDS_BY_ID[original_unit_id]['name']
-                    new_name = CARDS_BY_ID[new_unit_id]['name']
+                    original_name = self.cards.by_id[original_unit_id]['name']
+                    new_name = self.cards.by_id[new_unit_id]['name']
                     
                     result['messages'].append(f"Attack redirected from {original_name} to {new_name}!")
-                    self.log(f"🔀 Attack redirected to {new_name}")
+                    self.log("🔀 Attack redirected to %s", new_name)
                     
                     # Update pending attack data with new target
                     # The attack will continue with the new defender_index
@@ -477,10 +2092,10 @@ class GameState:
                     result['new_defender_index'] = new_defender_index
                 else:
                     result['messages'].append("Redirect failed - target not found!")
-                    self.log("❌ Decoy Protocol: Redirect target not found")
+                    self.log("❌ Decoy Protocol: Redirect target not found", level=LOG_WARNING)
             else:
                 result['messages'].append("No redirect target selected!")
-                self.log("❌ Decoy Protocol: No target selected")
+                self.log("❌ Decoy Protocol: No target selected", level=LOG_WARNING)
         
         # ============================================
         # BATCH 3: NON-ATTACK TRAPS
@@ -491,16 +2106,16 @@ class GameState:
             deployed_player = trigger_data.get('deployed_player')
             selected_target_index = trigger_data.get('selected_target_index')
             
-            self.log(f"🔒 Lockdown: deployed_player={deployed_player}, selected_target_index={selected_target_index}")
+            self.log("🔒 Lockdown: deployed_player=%s, selected_target_index=%s", deployed_player, selected_target_index, level=LOG_DEBUG)
             
             if deployed_player is not None and selected_target_index is not None:
                 unit_card_id = self.players[deployed_player]['battlefield'][selected_target_index]
                 if unit_card_id is None:
                     result['messages'].append("Target unit not found!")
-                    self.log(f"❌ Lockdown: Unit at index {selected_target_index} is None!")
+                    self.log("❌ Lockdown: Unit at index %s is None!", selected_target_index, level=LOG_WARNING)
                     return result
                     
-                unit_name = CARDS_BY_ID[unit_card_id]['name']
+                unit_name = self.cards.by_id[unit_card_id]['name']
                 
                 # Exhaust the unit
                 self.players[deployed_player]['battlefield_exhausted'][selected_target_index] = True
@@ -513,9 +2128,9 @@ class GameState:
                 self.players[deployed_player]['battlefield_no_attack'][selected_target_index] = True
                 
                 result['messages'].append(f"{unit_name} locked down! (Exhausted + Corrupted + Cannot attack)")
-                self.log(f"{unit_name} locked down (Lockdown)")
+                self.log("%s locked down (Lockdown)", unit_name)
             else:
-                self.log(f"❌ Lockdown: Missing target - deployed_player={deployed_player}, selected_target_index={selected_target_index}")
+                self.log("❌ Lockdown: Missing target - deployed_player=%s, selected_target_index=%s", deployed_player, selected_target_index, level=LOG_WARNING)
         
         elif trap_id == 'miasma_miasma_potion':
             # Apply Corrupt + Wither to deployed unit
@@ -523,18 +2138,18 @@ class GameState:
             selected_target_index = trigger_data.get('selected_target_index')
             available_targets = trigger_data.get('available_targets', [])
             
-            self.log(f"🧪 Miasma Potion: deployed_player={deployed_player}, selected_target_index={selected_target_index}")
-            self.log(f"🧪 Miasma Potion: available_targets={available_targets}")
-            self.log(f"🧪 Miasma Potion: trigger_data keys={list(trigger_data.keys())}")
+            self.log("🧪 Miasma Potion: deployed_player=%s, selected_target_index=%s", deployed_player, selected_target_index, level=LOG_DEBUG)
+            self.log("🧪 Miasma Potion: available_targets=%s", available_targets, level=LOG_DEBUG)
+            self.log("🧪 Miasma Potion: trigger_data keys=%s", list(trigger_data), level=LOG_DEBUG)
             
             if deployed_player is not None and selected_target_index is not None:
                 unit_card_id = self.players[deployed_player]['battlefield'][selected_target_index]
                 if unit_card_id is None:
                     result['messages'].append("Target unit not found!")
-                    self.log(f"❌ Miasma Potion: Unit at index {selected_target_index} is None!")
+                    self.log("❌ Miasma Potion: Unit at index %s is None!", selected_target_index, level=LOG_WARNING)
                     return result
                     
-                unit_name = CARDS_BY_ID[unit_card_id]['name']
+                unit_name = self.cards.by_id[unit_card_id]['name']
                 
                 # Apply Corrupt
                 self.players[deployed_player]['battlefield_corrupt'][selected_target_index] = True
@@ -545,9 +2160,9 @@ class GameState:
                 self.players[deployed_player]['battlefield_wither_applied_turn'][selected_target_index] = self.half_turn
                 
                 result['messages'].append(f"{unit_name} corrupted and withered!")
-                self.log(f"{unit_name} affected by Miasma Potion (Corrupt + Wither)")
+                self.log("%s affected by Miasma Potion (Corrupt + Wither)", unit_name)
             else:
-                self.log(f"❌ Miasma Potion: Missing target - deployed_player={deployed_player}, selected_target_index={selected_target_index}")
+                self.log("❌ Miasma Potion: Missing target - deployed_player=%s, selected_target_index=%s", deployed_player, selected_target_index, level=LOG_WARNING)
         
         elif trap_id == 'generic_flute_of_slumber':
             # Exhaust unit that became ready
@@ -556,13 +2171,13 @@ class GameState:
             
             if readied_player is not None and readied_index is not None:
                 unit_card_id = self.players[readied_player]['battlefield'][readied_index]
-                unit_name = CARDS_BY_ID[unit_card_id]['name']
+                unit_name = self.cards.by_id[unit_card_id]['name']
                 
                 # Exhaust the unit
                 self.players[readied_player]['battlefield_exhausted'][readied_index] = True
                 
                 result['messages'].append(f"{unit_name} falls back asleep!")
-                self.log(f"{unit_name} exhausted by Flute of Slumber")
+                self.log("%s exhausted by Flute of Slumber", unit_name)
         
         elif trap_id == 'miasma_foglash':
             # Negate enemy Technique (discard without effect)
@@ -570,14 +2185,14 @@ class GameState:
             technique_card_id = trigger_data.get('technique_card_id')
             
             if technique_player is not None and technique_card_id:
-                technique_name = CARDS_BY_ID[technique_card_id]['name']
+                technique_name = self.cards.by_id[technique_card_id]['name']
                 
                 # Discard the technique (it was removed from hand but not discarded yet)
                 self.players[technique_player]['discard'].append(technique_card_id)
                 
                 result['technique_negated'] = True
                 result['messages'].append(f"{technique_name} negated and discarded!")
-                self.log(f"{technique_name} negated (Foglash)")
+                self.log("%s negated (Foglash)", technique_name)
         
         elif trap_id == 'generic_earthquake':
             # Destroy enemy Field card
@@ -586,14 +2201,14 @@ class GameState:
             if field_player is not None:
                 field_card_id = self.players[field_player]['field']
                 if field_card_id:
-                    field_name = CARDS_BY_ID[field_card_id]['name']
+                    field_name = self.cards.by_id[field_card_id]['name']
                     
                     # Destroy field
                     self.players[field_player]['discard'].append(field_card_id)
                     self.players[field_player]['field'] = None
                     
                     result['messages'].append(f"{field_name} destroyed by Earthquake!")
-                    self.log(f"{field_name} destroyed (Earthquake)")
+                    self.log("%s destroyed (Earthquake)", field_name)
         
         elif trap_id == 'generic_counter_sigil':
             # Negate enemy Trap (discard it, no effect)
@@ -603,7 +2218,7 @@ class GameState:
             if enemy_trap_player is not None and enemy_trap_name:
                 result['trap_negated'] = True
                 result['messages'].append(f"{enemy_trap_name} negated by Counter-Sigil!")
-                self.log(f"{enemy_trap_name} negated (Counter-Sigil)")
+                self.log("%s negated (Counter-Sigil)", enemy_trap_name)
         
         # TODO: Add more trap effects in future
         
@@ -634,7 +2249,7 @@ class GameState:
         if attacker_player_obj['battlefield_no_attack'][attacker_index]:
             return {'error': 'Unit is petrified and cannot attack this turn'}
         
-        attacker = CARDS_BY_ID[attacker_card_id]
+        attacker = self.cards.by_id[attacker_card_id]
         
         # Check if Unit can attack (must be UNIT type)
         if attacker['type'] != 'UNIT':
@@ -654,7 +2269,7 @@ class GameState:
         if not defender_card_id:
             return {'error': 'No Unit in that slot'}
         
-        defender = CARDS_BY_ID[defender_card_id]
+        defender = self.cards.by_id[defender_card_id]
         
         # Check SPD restrictions
         # NEW RULE: Can only attack equal or lower SPD
@@ -666,7 +2281,8 @@ class GameState:
         defender_spd_actual = defender_spd + defender_player_obj['battlefield_spd_buff'][defender_index]
         
         # Swift bypasses SPD restrictions ONLY on the turn the unit was deployed
-        has_swift = 'Swift' in attacker.get('keywords', [])
+        attacker_flags = self.cards.flags(attacker_card_id)
+        has_swift = attacker_flags & KW_SWIFT
         deployed_this_turn = attacker_player_obj['battlefield_deployed_turn'][attacker_index] == self.half_turn
         swift_active = has_swift and deployed_this_turn
         
@@ -677,18 +2293,18 @@ class GameState:
         # If defender has Guard Units, must attack one of them
         guard_units = []
         for i, unit_id in enumerate(defender_player_obj['battlefield']):
-            if unit_id:
-                unit = CARDS_BY_ID[unit_id]
-                if 'Guard' in unit.get('keywords', []):
-                    guard_units.append(i)
+            if unit_id and self.cards.flags(unit_id) & KW_GUARD:
+                guard_units.append(i)
         
         if guard_units and defender_index not in guard_units:
-            guard_names = [CARDS_BY_ID[defender_player_obj['battlefield'][i]]['name'] for i in guard_units]
+            guard_names = [self.cards.by_id[defender_player_obj['battlefield'][i]]['name'] for i in guard_units]
             return {'error': f'Must attack Guard Unit first: {", ".join(guard_names)}'}
         
         # NEW RULE: Free target choice (no highest DEF requirement)
         # Only Guard restriction applies
         
+        self.emit(AttackDeclared, attacker_player, attacker_index, attacker_card_id, defender_index, defender_card_id)
+        
         # ============================================================
         # PHASE 3B: CHECK FOR TRAP TRIGGERS (Attack Declared)
         # ============================================================
@@ -727,7 +2343,7 @@ class GameState:
                         continue
                     
                     # Check SPD restriction
-                    unit = CARDS_BY_ID[unit_id]
+                    unit = self.cards.by_id[unit_id]
                     unit_spd = unit.get('spd', 0) + defender_player_obj['battlefield_spd_buff'][idx]
                     
                     # Swift only works on first turn - already calculated as swift_active
@@ -741,7 +2357,7 @@ class GameState:
                 
                 # If no valid redirect targets, auto-decline (don't show prompt)
                 if not valid_targets:
-                    self.log(f"🎭 Decoy Protocol detected but no valid redirect targets - trap not activated")
+                    self.log("🎭 Decoy Protocol detected but no valid redirect targets - trap not activated", level=LOG_DEBUG)
                     # Continue with normal attack - fall through to combat resolution
                 else:
                     # Return trap trigger with valid targets
@@ -837,7 +2453,7 @@ class GameState:
                 
                 if attacker_player_obj['battlefield'][attacker_index] is not None:
                     attacker_card_id = attacker_player_obj['battlefield'][attacker_index]
-                    attacker_name = CARDS_BY_ID[attacker_card_id]['name']
+                    attacker_name = self.cards.by_id[attacker_card_id]['name']
                     
                     combat_log.append(f"💥 Self-Destruct detonates!")
                     combat_log.append(f"{attacker_name} destroyed by Self-Destruct!")
@@ -849,6 +2465,7 @@ class GameState:
                     attacker_player_obj['battlefield_wither'][attacker_index] = 0
                     attacker_player_obj['battlefield_corrupt'][attacker_index] = False
                     attacker_destroyed = True
+                    self.emit(UnitDestroyed, attacker_player, attacker_index, attacker_card_id, 'self_destruct')
                 
                 # Clear Self-Destruct flags
                 defender_player_obj['battlefield_self_destruct_armed'][defender_index] = False
@@ -859,6 +2476,7 @@ class GameState:
             defender_player_obj['battlefield_wither'][defender_index] = 0
             defender_player_obj['battlefield_corrupt'][defender_index] = False
             defender_player_obj['discard'].append(defender_card_id)
+            self.emit(UnitDestroyed, defender_player, defender_index, defender_card_id, 'combat')
             
             # Kill Zone: attacker's player has Kill Zone field - gain 1⚡ when ANY unit destroys an enemy
             if attacker_player_obj.get('field') == 'skyforge_kill_zone':
@@ -871,7 +2489,7 @@ class GameState:
             
             # Apply Wither if attacker has Wither keyword
             # Wither is a KEYWORD, not an ability - it works even when Corrupted!
-            if 'Wither' in attacker.get('keywords', []) and not defender_destroyed:
+            if attacker_flags & KW_WITHER and not defender_destroyed:
                 defender_player_obj['battlefield_wither'][defender_index] += 1
                 defender_player_obj['battlefield_wither_applied_turn'][defender_index] = self.half_turn
                 new_wither = defender_player_obj['battlefield_wither'][defender_index]
@@ -879,7 +2497,7 @@ class GameState:
             
             # Apply Corrupt if attacker has Corrupt keyword
             # Corrupt is a KEYWORD, not an ability - it works even when Corrupted!
-            if 'Corrupt' in attacker.get('keywords', []) and not defender_destroyed:
+            if attacker_flags & KW_CORRUPT and not defender_destroyed:
                 if not defender_player_obj['battlefield_corrupt'][defender_index]:
                     defender_player_obj['battlefield_corrupt'][defender_index] = True
                     defender_player_obj['battlefield_corrupt_applied_turn'][defender_index] = self.half_turn
@@ -906,6 +2524,7 @@ class GameState:
                     attacker_player_obj['battlefield_wither'][attacker_index] = 0
                     attacker_player_obj['battlefield_corrupt'][attacker_index] = False
                     attacker_player_obj['discard'].append(attacker_card_id)
+                    self.emit(UnitDestroyed, attacker_player, attacker_index, attacker_card_id, 'retaliation')
                     
                     # Rustfields: attacker's player has Rustfields + attacker is Skyforge
                     if attacker_player_obj.get('field') == 'skyforge_rustfields':
@@ -927,7 +2546,7 @@ class GameState:
         # Pierce keyword (excess damage to another Unit)
         pierce_available = False
         pierce_damage = 0
-        if 'Pierce' in attacker.get('keywords', []) and defender_destroyed and not attacker_destroyed:
+        if attacker_flags & KW_PIERCE and defender_destroyed and not attacker_destroyed:
             excess_damage = attacker_atk_actual - defender_def_actual
             if excess_damage > 0:
                 pierce_available = True
@@ -960,14 +2579,14 @@ class GameState:
         if not attacker_card_id:
             return {'error': 'Attacker no longer exists'}
         
-        attacker = CARDS_BY_ID[attacker_card_id]
+        attacker = self.cards.by_id[attacker_card_id]
         
         # Get Pierce target
         target_card_id = defender_player_obj['battlefield'][pierce_target_index]
         if not target_card_id:
             return {'error': 'No Unit in that slot'}
         
-        target = CARDS_BY_ID[target_card_id]
+        target = self.cards.by_id[target_card_id]
         
         # Pierce damage was calculated in attack, but we need to recalculate
         # For now, we'll need to store it. Let me use a simple approach:
@@ -985,7 +2604,7 @@ class GameState:
         if not target_card_id:
             return {'error': 'No Unit in that slot'}
         
-        target = CARDS_BY_ID[target_card_id]
+        target = self.cards.by_id[target_card_id]
         
         # Get target's DEF (with Wither)
         target_wither = defender_player_obj['battlefield_wither'][pierce_target_index]
@@ -1005,6 +2624,7 @@ class GameState:
             defender_player_obj['battlefield_corrupt'][pierce_target_index] = False
             defender_player_obj['battlefield_corrupt_applied_turn'][pierce_target_index] = 0
             defender_player_obj['discard'].append(target_card_id)
+            self.emit(UnitDestroyed, defender_player, pierce_target_index, target_card_id, 'pierce')
         else:
             pierce_log.append(f"{target['name']} survives Pierce! ({pierce_damage} damage < {target_def_actual} DEF)")
         
@@ -1024,7 +2644,7 @@ class GameState:
         if card_id not in player['hand']:
             return {'error': 'Card not in hand'}
         
-        card = CARDS_BY_ID[card_id]
+        card = self.cards.by_id[card_id]
         
         # Check energy cost (EXCEPT for Traps - they're free to set)
         if card['type'] != 'TRAP':
@@ -1033,11 +2653,11 @@ class GameState:
             if card['type'] == 'UNIT' and card.get('faction') == 'Skyforge':
                 if player.get('field') and player['field'] == 'skyforge_assembly_line':
                     actual_cost = max(1, actual_cost - 1)
-                    self.log(f"⚙️ Assembly Line: {card['name']} costs 1 less ({actual_cost}⚡)")
+                    self.log("⚙️ Assembly Line: %s costs 1 less (%s⚡)", card['name'], actual_cost)
             
             if player['energy'] < actual_cost:
                 return {'error': 'Not enough energy'}
-            player['energy'] -= actual_cost
+            self.change_energy(player, -actual_cost, card_id)
         
         player['hand'].remove(card_id)
         
@@ -1047,18 +2667,19 @@ class GameState:
             for i in range(5):
                 if player['battlefield'][i] is None:
                     player['battlefield'][i] = card_id
+                    self.emit(UnitDeployed, player_idx, i, card_id)
                     
                     # Record when this unit was deployed (use half_turn for precise tracking)
                     player['battlefield_deployed_turn'][i] = self.half_turn
                     
                     # Units enter play exhausted (unless they have Swift)
-                    has_swift = 'Swift' in card.get('keywords', [])
+                    has_swift = self.cards.flags(card_id) & KW_SWIFT
                     if not has_swift:
                         player['battlefield_exhausted'][i] = True
-                        self.log(f"Player {player_idx + 1} deploys {card['name']} (exhausted)")
+                        self.log("Player %s deploys %s (exhausted)", player_idx + 1, card['name'])
                     else:
                         player['battlefield_exhausted'][i] = False
-                        self.log(f"Player {player_idx + 1} deploys {card['name']} (Swift - ready!)")
+                        self.log("Player %s deploys %s (Swift - ready!)", player_idx + 1, card['name'])
                     
                     # Blight Pools: opponent's field - apply Wither to this unit when it enters play
                     opponent_idx = 1 - player_idx
@@ -1066,7 +2687,7 @@ class GameState:
                     if opponent.get('field') == 'miasma_blight_pools':
                         player['battlefield_wither'][i] += 1
                         player['battlefield_wither_applied_turn'][i] = self.half_turn
-                        self.log(f"🌫️ Blight Pools: {card['name']} withers as it enters play! (DEF -1)")
+                        self.log("🌫️ Blight Pools: %s withers as it enters play! (DEF -1)", card['name'])
                     
                     # PHASE 3D BATCH 3: Check for deployment traps (Lockdown, Miasma Potion)
                     deployment_traps = self.check_traps(
@@ -1091,7 +2712,7 @@ class GameState:
                                 unit_deployed_turn = player['battlefield_deployed_turn'][idx]
                                 # CRITICAL: Only include units deployed AFTER trap was placed AND during current turn
                                 if unit_deployed_turn > trap_placed_turn and unit_deployed_turn == self.half_turn:
-                                    unit_card = CARDS_BY_ID[unit_id]
+                                    unit_card = self.cards.by_id[unit_id]
                                     available_targets.append({
                                         'index': idx,
                                         'name': unit_card['name']
@@ -1130,11 +2751,11 @@ class GameState:
         elif card['type'] == 'FIELD':
             # Replace existing field
             if player['field']:
-                old_field = CARDS_BY_ID[player['field']]
+                old_field = self.cards.by_id[player['field']]
                 player['discard'].append(player['field'])
-                self.log(f"Player {player_idx + 1} replaces {old_field['name']}")
+                self.log("Player %s replaces %s", player_idx + 1, old_field['name'])
             player['field'] = card_id
-            self.log(f"Player {player_idx + 1} plays field {card['name']}")
+            self.log("Player %s plays field %s", player_idx + 1, card['name'])
             
             # PHASE 3D BATCH 3: Check for Earthquake trap
             opponent_idx = 1 - player_idx
@@ -1183,7 +2804,7 @@ class GameState:
                 if player['traps'][i] is None:
                     player['traps'][i] = card_id
                     player['traps_placed_turn'][i] = self.half_turn  # Record when trap was placed
-                    self.log(f"Player {player_idx + 1} sets a trap")
+                    self.log("Player %s sets a trap", player_idx + 1)
                     return {'success': True, 'message': 'Trap set'}
             return {'error': 'All trap slots full'}
         
@@ -1244,9 +2865,9 @@ class GameState:
         player = self.players[player_idx]
         opponent_idx = 1 - player_idx
         opponent = self.players[opponent_idx]
-        card = CARDS_BY_ID[card_id]
+        card = self.cards.by_id[card_id]
         
-        self.log(f"Player {player_idx + 1} plays {card['name']}")
+        self.log("Player %s plays %s", player_idx + 1, card['name'])
         
         # PHASE 1 TECHNIQUES (Simple, no targeting)
         
@@ -1258,7 +2879,7 @@ class GameState:
                     opponent['battlefield_wither'][i] += 1
                     opponent['battlefield_wither_applied_turn'][i] = self.half_turn
                     count += 1
-            self.log(f"🥀 Encroaching Fog! Wither applied to {count} enemy Units")
+            self.log("🥀 Encroaching Fog! Wither applied to %s enemy Units", count)
             return {'success': True, 'message': f'Withered {count} enemy Units'}
         
         # Choking Spores - Exhaust all enemy Units
@@ -1268,7 +2889,7 @@ class GameState:
                 if opponent['battlefield'][i] is not None and not opponent['battlefield_exhausted'][i]:
                     opponent['battlefield_exhausted'][i] = True
                     count += 1
-            self.log(f"💤 Choking Spores! {count} enemy Units exhausted")
+            self.log("💤 Choking Spores! %s enemy Units exhausted", count)
             return {'success': True, 'message': f'Exhausted {count} enemy Units'}
         
         # Salvage the Ruins - Draw 1-2 cards
@@ -1280,20 +2901,20 @@ class GameState:
             if not player['field']:
                 self.draw_cards(player, 1)
                 cards_drawn = 2
-                self.log(f"📚 Salvage the Ruins! Drew {cards_drawn} cards (no Field bonus)")
+                self.log("📚 Salvage the Ruins! Drew %s cards (no Field bonus)", cards_drawn)
             else:
-                self.log(f"📚 Salvage the Ruins! Drew {cards_drawn} card")
+                self.log("📚 Salvage the Ruins! Drew %s card", cards_drawn)
             
             return {'success': True, 'message': f'Drew {cards_drawn} card(s)'}
         
         # Arcane Surge - Gain 3⚡, skip next energy gain
         elif card['id'] == 'generic_arcane_surge':
-            player['energy'] += 3
+            self.change_energy(player, 3, card['id'])
             # Mark to skip next energy gain (we'll need to track this)
             if 'skip_next_energy_gain' not in player:
                 player['skip_next_energy_gain'] = False
             player['skip_next_energy_gain'] = True
-            self.log(f"⚡ Arcane Surge! Gained 3⚡ (will skip next energy gain)")
+            self.log("⚡ Arcane Surge! Gained 3⚡ (will skip next energy gain)")
             return {'success': True, 'message': 'Gained 3⚡'}
         
         # PHASE 2 TECHNIQUES (Targeted buffs)
@@ -1354,13 +2975,13 @@ class GameState:
             opponent = self.players[opponent_idx]
             
             if opponent['field']:
-                field_card = CARDS_BY_ID[opponent['field']]
+                field_card = self.cards.by_id[opponent['field']]
                 opponent['discard'].append(opponent['field'])
                 opponent['field'] = None
-                self.log(f"🚶 Travelling Merchant! Destroyed {field_card['name']}")
+                self.log("🚶 Travelling Merchant! Destroyed %s", field_card['name'])
                 return {'success': True, 'message': f"Destroyed {field_card['name']}"}
             else:
-                self.log(f"🚶 Travelling Merchant! No enemy Field to destroy")
+                self.log("🚶 Travelling Merchant! No enemy Field to destroy")
                 return {'success': True, 'message': 'No enemy Field to destroy'}
         
         # Eviction Notice - Destroy opponent's Field (same as Travelling Merchant)
@@ -1369,13 +2990,13 @@ class GameState:
             opponent = self.players[opponent_idx]
             
             if opponent['field']:
-                field_card = CARDS_BY_ID[opponent['field']]
+                field_card = self.cards.by_id[opponent['field']]
                 opponent['discard'].append(opponent['field'])
                 opponent['field'] = None
-                self.log(f"📜 Eviction Notice! Destroyed {field_card['name']}")
+                self.log("📜 Eviction Notice! Destroyed %s", field_card['name'])
                 return {'success': True, 'message': f"Destroyed {field_card['name']}"}
             else:
-                self.log(f"📜 Eviction Notice! No enemy Field to destroy")
+                self.log("📜 Eviction Notice! No enemy Field to destroy")
                 return {'success': True, 'message': 'No enemy Field to destroy'}
         
         # Veil of Binding - Target Unit can't retaliate this turn (enemy only)
@@ -1429,21 +3050,21 @@ class GameState:
         
         # Default for unimplemented techniques
         else:
-            self.log(f"⚠️ {card['name']} effect not yet implemented")
+            self.log("⚠️ %s effect not yet implemented", card['name'], level=LOG_WARNING)
             return {'success': True, 'message': f"Played {card['name']} (effect not implemented)"}
     
     def apply_targeted_technique(self, player_idx, card_id, target_player, target_index):
         """Apply a technique effect to a targeted Unit"""
         player = self.players[player_idx]
         target_player_obj = self.players[target_player]
-        card = CARDS_BY_ID[card_id]
+        card = self.cards.by_id[card_id]
         
         # Check if target slot has a Unit
         target_unit_id = target_player_obj['battlefield'][target_index]
         if not target_unit_id:
             return {'error': 'No Unit in that slot'}
         
-        target_unit = CARDS_BY_ID[target_unit_id]
+        target_unit = self.cards.by_id[target_unit_id]
         
         # Apply technique effect based on card
         
@@ -1451,7 +3072,7 @@ class GameState:
         if card['id'] == 'generic_food_rations':
             target_player_obj['battlefield_def_buff'][target_index] += 1
             target_player_obj['battlefield_buff_expires'][target_index] = 'start_next_turn'
-            self.log(f"🍞 Food Rations! {target_unit['name']} gains +1 DEF")
+            self.log("🍞 Food Rations! %s gains +1 DEF", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} buffed!"}
         
         # Software Update - +1 ATK, -1 DEF until end of turn
@@ -1459,7 +3080,7 @@ class GameState:
             target_player_obj['battlefield_atk_buff'][target_index] += 1
             target_player_obj['battlefield_def_buff'][target_index] -= 1
             target_player_obj['battlefield_buff_expires'][target_index] = 'end_turn'
-            self.log(f"⚙️ Software Update! {target_unit['name']} gains +1 ATK, -1 DEF")
+            self.log("⚙️ Software Update! %s gains +1 ATK, -1 DEF", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} updated!"}
         
         # Emergency Repairs - +2 DEF until start of next turn (friendly only)
@@ -1468,7 +3089,7 @@ class GameState:
                 return {'error': 'Can only target your own Units'}
             target_player_obj['battlefield_def_buff'][target_index] += 2
             target_player_obj['battlefield_buff_expires'][target_index] = 'start_next_turn'
-            self.log(f"🔧 Emergency Repairs! {target_unit['name']} gains +2 DEF")
+            self.log("🔧 Emergency Repairs! %s gains +2 DEF", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} repaired!"}
         
         # Adrenal Rush - Ready unit + +1 ATK until end of turn (friendly only)
@@ -1480,7 +3101,7 @@ class GameState:
             # Add ATK buff
             target_player_obj['battlefield_atk_buff'][target_index] += 1
             target_player_obj['battlefield_buff_expires'][target_index] = 'end_turn'
-            self.log(f"💪 Adrenal Rush! {target_unit['name']} is readied and gains +1 ATK")
+            self.log("💪 Adrenal Rush! %s is readied and gains +1 ATK", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} energized!"}
         
         # Velocity Patch - +2 SPD until end of turn, enters exhausted next turn
@@ -1488,7 +3109,7 @@ class GameState:
             target_player_obj['battlefield_spd_buff'][target_index] += 2
             target_player_obj['battlefield_buff_expires'][target_index] = 'end_turn'
             target_player_obj['battlefield_enter_exhausted_next_turn'][target_index] = True
-            self.log(f"⚡ Velocity Patch! {target_unit['name']} gains +2 SPD (will enter exhausted next turn)")
+            self.log("⚡ Velocity Patch! %s gains +2 SPD (will enter exhausted next turn)", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} accelerated!"}
         
         # Veil of Binding - Target can't retaliate this turn (enemy only)
@@ -1496,13 +3117,13 @@ class GameState:
             if target_player == player_idx:
                 return {'error': 'Must target an enemy Unit'}
             target_player_obj['battlefield_no_retaliate'][target_index] = True
-            self.log(f"🔮 Veil of Binding! {target_unit['name']} cannot retaliate this turn")
+            self.log("🔮 Veil of Binding! %s cannot retaliate this turn", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} bound!"}
         
         # Petrify - Target can't attack during its next turn
         elif card['id'] == 'miasma_petrify':
             target_player_obj['battlefield_no_attack'][target_index] = True
-            self.log(f"🪨 Petrify! {target_unit['name']} cannot attack during its next turn")
+            self.log("🪨 Petrify! %s cannot attack during its next turn", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} petrified!"}
         
         # Toxic Sludge - If target is Corrupted, apply Wither x2
@@ -1513,10 +3134,10 @@ class GameState:
                     target_player_obj['battlefield_wither'][target_index] += 2
                     target_player_obj['battlefield_wither_applied_turn'][target_index] = self.half_turn
                     new_wither = target_player_obj['battlefield_wither'][target_index]
-                    self.log(f"🧪 Toxic Sludge! {target_unit['name']} is Corrupted - gains 2 Wither (now {new_wither})")
+                    self.log("🧪 Toxic Sludge! %s is Corrupted - gains 2 Wither (now %s)", target_unit['name'], new_wither)
                     return {'success': True, 'message': f"{target_unit['name']} withered x2!"}
                 else:
-                    self.log(f"🧪 Toxic Sludge! {target_unit['name']} is not Corrupted - no effect")
+                    self.log("🧪 Toxic Sludge! %s is not Corrupted - no effect", target_unit['name'])
                     return {'success': True, 'message': f"{target_unit['name']} not Corrupted (no effect)"}
             else:
                 return {'error': 'Must target an enemy Unit'}
@@ -1532,7 +3153,7 @@ class GameState:
                 target_player_obj['battlefield_override_expires_turn'] = [0, 0, 0, 0, 0]
             target_player_obj['battlefield_override_expires_turn'][target_index] = self.turn
             
-            self.log(f"⚙️ Override! {target_unit['name']}'s abilities disabled until end of turn")
+            self.log("⚙️ Override! %s's abilities disabled until end of turn", target_unit['name'])
             return {'success': True, 'message': f"{target_unit['name']} overridden!"}
         
         # Reboot - Remove all negative effects
@@ -1568,10 +3189,10 @@ class GameState:
             
             if effects_cleared:
                 effects_str = ", ".join(effects_cleared)
-                self.log(f"🔄 Reboot! Cleared from {target_unit['name']}: {effects_str}")
+                self.log("🔄 Reboot! Cleared from %s: %s", target_unit['name'], effects_str)
                 return {'success': True, 'message': f"Cleared: {effects_str}"}
             else:
-                self.log(f"🔄 Reboot! {target_unit['name']} has no negative effects to clear")
+                self.log("🔄 Reboot! %s has no negative effects to clear", target_unit['name'])
                 return {'success': True, 'message': 'No effects to clear'}
         
         return {'error': 'Unknown targeted technique'}
@@ -1579,112 +3200,498 @@ class GameState:
     def advance_phase(self):
         """Move to next phase"""
         # If it's AI's turn, let AI play
-        if self.active_player == 1:
+        if self.active_player in self.ai_players:
             if self.phase == 'deploy':
                 self.ai_turn()  # AI plays cards
                 # Don't auto-advance if a trap triggered
                 if not (hasattr(self, 'pending_trap_trigger') and self.pending_trap_trigger):
-                    self.phase = 'combat'
+                    self.set_phase('combat')
             elif self.phase == 'combat':
                 self.ai_turn()  # AI attacks
-                self.phase = 'end'
+                self.set_phase('end')
             elif self.phase == 'end':
                 self.end_turn()
             else:  # start
-                self.phase = 'deploy'
+                self.set_phase('deploy')
         else:
             # Human player - normal phase advancement
             if self.phase == 'start':
-                self.phase = 'deploy'
+                self.set_phase('deploy')
             elif self.phase == 'deploy':
-                self.phase = 'combat'
+                self.set_phase('combat')
             elif self.phase == 'combat':
-                self.phase = 'end'
+                self.set_phase('end')
             elif self.phase == 'end':
                 self.end_turn()
     
-    def ai_turn(self):
-        """
-        AI plays its turn
-        Makes intelligent decisions about deploying units and attacking
+    def discard_from_hand(self, card_index):
+        """Discard the active player's hand card at card_index while over the hand limit"""
+        current_player = self.players[self.active_player]
+        
+        if current_player.get('must_discard', 0) == 0:
+            return {'error': 'No need to discard'}
+        
+        if card_index < 0 or card_index >= len(current_player['hand']):
+            return {'error': 'Invalid card index'}
+        
+        # Discard the card
+        discarded_card = current_player['hand'].pop(card_index)
+        current_player['discard'].append(discarded_card)
+        current_player['must_discard'] -= 1
+        
+        self.log("Discarded %s (hand limit: %s/7)", self.cards.by_id[discarded_card]['name'], len(current_player['hand']))
+        
+        # Check if still need to discard more
+        if len(current_player['hand']) > 7:
+            self.log("⚠️ Still %s more to discard", len(current_player['hand']) - 7)
+        else:
+            self.log("✅ Hand at 7 cards. You may end turn now.")
+            current_player['must_discard'] = 0
+        return {'success': True}
+    
+    def rotfall_destroy(self, player_idx, unit_index):
+        """Destroy one of player_idx's Units to satisfy Rotfall Expanse"""
+        current_player = self.players[player_idx]
+        
+        if current_player.get('rotfall_must_destroy', 0) == 0:
+            return {'error': 'No Rotfall destruction required'}
+        
+        if unit_index is None or unit_index < 0 or unit_index >= 5:
+            return {'error': 'Invalid unit index'}
+        
+        if current_player['battlefield'][unit_index] is None:
+            return {'error': 'No unit in that slot'}
+        
+        # Destroy the chosen unit
+        destroyed_id = current_player['battlefield'][unit_index]
+        destroyed_name = self.cards.by_id[destroyed_id]['name']
+        current_player['battlefield'][unit_index] = None
+        current_player['battlefield_exhausted'][unit_index] = False
+        current_player['battlefield_wither'][unit_index] = 0
+        current_player['battlefield_corrupt'][unit_index] = False
+        current_player['discard'].append(destroyed_id)
+        current_player['rotfall_must_destroy'] -= 1
+        self.emit(UnitDestroyed, player_idx, unit_index, destroyed_id, 'rotfall')
+        
+        self.log("🌑 Rotfall Expanse: %s destroyed by Rotfall!", destroyed_name)
+        
+        if current_player['rotfall_must_destroy'] > 0:
+            self.log("🌑 Must destroy %s more Unit(s)", current_player['rotfall_must_destroy'])
+        else:
+            self.log("✅ Rotfall satisfied. You may end turn now.")
+        return {'success': True}
+    
+    def hold_attack_trap(self, attacker_player, attack_result):
+        """Make a trap_trigger that attack() returned wait in pending_trap_trigger for the defender"""
+        self.pending_trap_trigger = {
+            'trap_type': 'attack_trap_trigger',
+            'trap': attack_result['trap'],
+            'trap_slot': attack_result['trap_slot'],
+            'trigger_message': attack_result['trigger_message'],
+            'trigger_data': attack_result['trigger_data'],
+            'trap_owner': 1 - attacker_player,  # Opponent owns the trap
+            'pending_attack': attack_result['pending_attack']
+        }
+    
+    def activate_trap(self, player_idx, trap_slot, trigger_data=None):
         """
-        ai_player = self.active_player
-        ai = self.players[ai_player]
-        opponent = self.players[1 - ai_player]
+        Spring player_idx's trap in trap_slot in answer to pending_trap_trigger
         
-        self.log(f"AI is thinking...")
+        trigger_data is the trigger's data plus the owner's choice
+        (selected_target_index, for traps with available_targets). The trap
+        is paid for first; if the opponent can answer with Counter-Sigil it
+        then waits, and pending_trap_trigger becomes the Counter-Sigil trigger
+        (see answer_counter_sigil()).
+        """
+        player = self.players[player_idx]
+        trap_id = player['traps'][trap_slot]
+        trap = self.cards.by_id[trap_id]
         
-        # Phase 1: DEPLOY PHASE - Play cards from hand
-        if self.phase == 'deploy':
-            # Sort hand by priority: Units > Fields > Techniques > Traps
-            playable_cards = []
+        # Pay energy cost
+        self.change_energy(player, -trap['cost'], trap['id'])
+        self.log("Player %s activates %s (Cost: %s)", player_idx + 1, trap['name'], trap['cost'])
+        
+        # Remove trap from slot
+        player['traps'][trap_slot] = None
+        
+        # Move trap to discard
+        player['discard'].append(trap_id)
+        
+        # PHASE 3D BATCH 3: Check for Counter-Sigil before trap resolves
+        opponent_idx = 1 - player_idx
+        counter_sigil_traps = self.check_traps(
+            opponent_idx,
+            'trap_activated',
+            {
+                'enemy_trap_player': player_idx,
+                'enemy_trap_name': trap['name'],
+                'enemy_trap_id': trap_id
+            }
+        )
+        
+        if counter_sigil_traps:
+            # Pause before the trap resolves
+            result = {
+                'counter_sigil_trigger': True,
+                'trap': counter_sigil_traps[0]['trap'],
+                'trap_slot': counter_sigil_traps[0]['slot'],
+                'trigger_message': counter_sigil_traps[0]['trigger_message'],
+                'trigger_data': {
+                    'enemy_trap_player': player_idx,
+                    'enemy_trap_name': trap['name'],
+                    'enemy_trap_id': trap_id
+                },
+                'trap_owner': opponent_idx,
+                'original_trap_activation': {
+                    'trap': trap,
+                    'trap_id': trap_id,
+                    'player': player_idx,
+                    'trap_slot': trap_slot,
+                    'pending_trigger_data': trigger_data
+                }
+            }
+            self.pending_trap_trigger = dict(result, trap_type='counter_sigil_trigger')
+            return result
+        
+        # PHASE 3D: Resolve trap effect (if not negated by Counter-Sigil)
+        trap_effect_result = self.resolve_trap_effect(trap_id, player_idx, trigger_data)
+        
+        # PHASE 3D BATCH 3: Handle Flute of Slumber - ready all units except the targeted one
+        if trap_id == 'generic_flute_of_slumber' and self.pending_trap_trigger:
+            pending_data = self.pending_trap_trigger.get('trigger_data', {})
+            readied_player = pending_data.get('readied_player')
+            selected_target_index = (trigger_data or {}).get('selected_target_index')
+            available_targets = pending_data.get('available_targets', [])
+            
+            if readied_player is not None and selected_target_index is not None:
+                # Ready all units EXCEPT the selected target
+                for target in available_targets:
+                    if target['index'] != selected_target_index:
+                        self.players[readied_player]['battlefield_exhausted'][target['index']] = False
+                        self.log("%s becomes ready", target['name'])
+                # The selected target stays exhausted (Flute effect)
+                selected_target_name = next((t['name'] for t in available_targets if t['index'] == selected_target_index), 'Unit')
+                self.log("%s remains exhausted (Flute of Slumber)", selected_target_name)
+        
+        # CRITICAL: UNIVERSAL clearing of pending_trap_trigger
+        # Always clear after ANY trap activation to prevent infinite loops
+        if self.pending_trap_trigger:
+            self.log("🧹 Clearing pending_trap_trigger after trap activation (UNIVERSAL)", level=LOG_DEBUG)
+            self.pending_trap_trigger = None
+        
+        return {
+            'success': True,
+            'message': f"Activated {trap['name']}",
+            'trap_activated': True,
+            'trap_id': trap_id,
+            'effect_result': trap_effect_result
+        }
+    
+    def decline_trap(self, player_idx, trap_slot):
+        """Let pending_trap_trigger pass without springing player_idx's trap in trap_slot"""
+        trap_id = self.players[player_idx]['traps'][trap_slot]
+        trap = self.cards.by_id[trap_id]
+        self.log("Player %s did not activate %s", player_idx + 1, trap['name'])
+        
+        # PHASE 3D BATCH 3: Handle Flute of Slumber - ready ALL units if not activated
+        if trap_id == 'generic_flute_of_slumber' and self.pending_trap_trigger:
+            pending_data = self.pending_trap_trigger.get('trigger_data', {})
+            readied_player = pending_data.get('readied_player')
+            available_targets = pending_data.get('available_targets', [])
+            
+            if readied_player is not None:
+                # Ready ALL units
+                for target in available_targets:
+                    self.players[readied_player]['battlefield_exhausted'][target['index']] = False
+                    self.log("%s becomes ready", target['name'])
+        
+        # CRITICAL: UNIVERSAL clearing of pending_trap_trigger
+        # Always clear after declining ANY trap to prevent infinite loops
+        if self.pending_trap_trigger:
+            self.log("🧹 Clearing pending_trap_trigger after declining trap (UNIVERSAL)", level=LOG_DEBUG)
+            self.pending_trap_trigger = None
+        
+        return {
+            'success': True,
+            'message': f"Did not activate {trap['name']}",
+            'trap_activated': False
+        }
+    
+    def answer_counter_sigil(self, player_idx, trap_slot, activate, original_trap_activation=None, trigger_data=None):
+        """
+        Negate the trap waiting on Counter-Sigil, or let it resolve
+        
+        original_trap_activation defaults to the one activate_trap() left in
+        pending_trap_trigger.
+        """
+        if not original_trap_activation and self.pending_trap_trigger:
+            original_trap_activation = self.pending_trap_trigger.get('original_trap_activation')
+        original_trap_activation = original_trap_activation or {}
+        player = self.players[player_idx]
+        trap_id = player['traps'][trap_slot]
+        trap = self.cards.by_id[trap_id]
+        
+        if activate:
+            # Pay cost
+            self.change_energy(player, -trap['cost'], trap['id'])
+            self.log("Player %s activates Counter-Sigil!", player_idx + 1)
+            
+            # Remove Counter-Sigil
+            player['traps'][trap_slot] = None
+            player['discard'].append(trap_id)
             
-            for card_id in ai['hand']:
-                card = CARDS_BY_ID[card_id]
-                priority = 0
+            # Resolve Counter-Sigil (negates the original trap)
+            effect_result = self.resolve_trap_effect(trap_id, player_idx, trigger_data)
+            
+            # CRITICAL: Clear pending trap trigger since the trap was negated!
+            if self.pending_trap_trigger:
+                self.log("🚫 Clearing pending trap trigger (negated by Counter-Sigil)", level=LOG_DEBUG)
+                self.pending_trap_trigger = None
+            
+            return {
+                'success': True,
+                'counter_sigil_activated': True,
+                'effect_result': effect_result
+            }
+        
+        # Don't activate - let original trap resolve
+        self.log("Player %s did not activate Counter-Sigil", player_idx + 1)
+        
+        # Resolve original trap
+        orig_trap_id = original_trap_activation.get('trap_id')
+        orig_player = original_trap_activation.get('player')
+        orig_trigger_data = original_trap_activation.get('pending_trigger_data')
+        
+        effect_result = self.resolve_trap_effect(orig_trap_id, orig_player, orig_trigger_data)
+        
+        # Clear pending trap trigger (original trap has now resolved)
+        if self.pending_trap_trigger:
+            self.log("✅ Clearing pending trap trigger (original trap resolved)", level=LOG_DEBUG)
+            self.pending_trap_trigger = None
+        
+        return {
+            'success': True,
+            'counter_sigil_activated': False,
+            'original_trap_resolved': True,
+            'effect_result': effect_result
+        }
+    
+    # ============================================================
+    # AI DEPLOY PLANNER
+    # ============================================================
+    
+    def plan_deploy(self, player_idx):
+        """
+        Plan which cards to play this deploy phase
+        
+        Searches every affordable combination of the hand instead of playing
+        greedily: each possible field (after Arcane Surge, whose energy can
+        pay for it) is tried as the "setup" for the turn, Assembly Line
+        discounts are applied to the Units that follow it, and the remaining
+        Units/Techniques are packed into the leftover energy and free
+        battlefield slots with a knapsack DP. Traps
+        are free to set, so the best ones simply fill the open trap slots.
+        
+        Plans are memoized per (hand, energy, board) signature.
+        
+        Returns:
+            List of card IDs in the order they should be played
+        """
+        player = self.players[player_idx]
+        opponent = self.players[1 - player_idx]
+        
+        signature = (
+            tuple(sorted(player['hand'])),
+            player['energy'],
+            tuple(u is not None for u in player['battlefield']),
+            tuple(t is not None for t in player['traps']),
+            player['field'],
+            sum(1 for u in opponent['battlefield'] if u is not None),
+            sum(1 for i, u in enumerate(opponent['battlefield'])
+                if u is not None and not opponent['battlefield_exhausted'][i]),
+            opponent['field'] is not None,
+        )
+        signature = ('deploy', self.cards.version) + signature
+        cached = AI_DECISION_CACHE.get(signature)
+        if cached is not None:
+            return list(cached)
+        
+        free_unit_slots = sum(1 for u in player['battlefield'] if u is None)
+        free_trap_slots = sum(1 for t in player['traps'] if t is None)
+        
+        hand_fields = []
+        hand_surges = []
+        hand_traps = []
+        hand_others = []
+        for card_id in player['hand']:
+            card = self.cards.by_id[card_id]
+            if card['type'] == 'FIELD':
+                hand_fields.append(card_id)
+            elif card['type'] == 'TRAP':
+                hand_traps.append(card_id)
+            elif card_id == 'generic_arcane_surge':
+                hand_surges.append(card_id)
+            elif card['type'] in ('UNIT', 'TECHNIQUE'):
+                hand_others.append(card_id)
+        
+        # Setup options: which field to play (only into an empty field slot)
+        # and whether to open with Arcane Surge for extra energy
+        field_options = [None]
+        if player['field'] is None:
+            field_options += sorted(set(hand_fields))
+        surge_options = [False, True] if hand_surges else [False]
+        
+        best_value = None
+        best_plan = []
+        
+        for field_choice in field_options:
+            for use_surge in surge_options:
+                energy = player['energy']
+                setup = []
+                value = 0.0
                 
-                # Prioritize based on card type
-                if card['type'] == 'UNIT':
-                    priority = 100 - card['cost']  # Prefer cheaper units
-                elif card['type'] == 'FIELD':
-                    priority = 50
-                elif card['type'] == 'TRAP':
-                    priority = 30
-                elif card['type'] == 'TECHNIQUE':
-                    priority = 20
+                # Surge goes first so its energy can pay for the field
+                if use_surge:
+                    surge_cost = self.cards.by_id[hand_surges[0]]['cost']
+                    if energy < surge_cost:
+                        continue
+                    # Net energy now, paid back by skipping the next energy gain
+                    energy += 3 - surge_cost
+                    setup.append(hand_surges[0])
+                    value += self._deploy_card_value(hand_surges[0], player_idx)
                 
-                # Check if we can afford it (or if it's a trap - free to set)
-                can_play = (card['type'] == 'TRAP') or (ai['energy'] >= card['cost'])
+                if field_choice:
+                    energy -= self.cards.by_id[field_choice]['cost']
+                    if energy < 0:
+                        continue
+                    setup.append(field_choice)
+                    value += self._deploy_card_value(field_choice, player_idx)
                 
-                if can_play:
-                    playable_cards.append({
-                        'id': card_id,
-                        'card': card,
-                        'priority': priority
-                    })
-            
-            # Sort by priority (highest first)
-            playable_cards.sort(key=lambda x: x['priority'], reverse=True)
-            
-            # Play cards until we run out of energy or board space
-            for item in playable_cards:
-                card = item['card']
+                active_field = field_choice or player['field']
                 
-                # Check if we have space
-                if card['type'] == 'UNIT':
-                    units_count = sum(1 for u in ai['battlefield'] if u is not None)
-                    if units_count >= 5:
-                        continue  # Battlefield full
+                # Knapsack over (energy spent, units deployed)
+                items = []
+                for card_id in hand_others:
+                    card = self.cards.by_id[card_id]
+                    item_value = self._deploy_card_value(card_id, player_idx)
+                    if item_value <= 0:
+                        continue
+                    cost = card['cost']
+                    if (card['type'] == 'UNIT' and card.get('faction') == 'Skyforge'
+                            and active_field == 'skyforge_assembly_line'):
+                        cost = max(1, cost - 1)
+                    items.append((card_id, cost, item_value, card['type'] == 'UNIT'))
                 
-                if card['type'] == 'TRAP':
-                    traps_count = sum(1 for t in ai['traps'] if t is not None)
-                    if traps_count >= 3:
-                        continue  # Trap slots full
+                # table[(spent, units)] = (value, chosen card IDs)
+                table = {(0, 0): (0.0, ())}
+                for card_id, cost, item_value, is_unit in items:
+                    for (spent, units), (current, chosen) in list(table.items()):
+                        new_spent = spent + cost
+                        new_units = units + (1 if is_unit else 0)
+                        if new_spent > energy or new_units > free_unit_slots:
+                            continue
+                        candidate = (current + item_value, chosen + (card_id,))
+                        existing = table.get((new_spent, new_units))
+                        if existing is None or candidate[0] > existing[0]:
+                            table[(new_spent, new_units)] = candidate
                 
-                if card['type'] == 'FIELD' and ai['field'] is not None:
-                    continue  # Already have a field
+                for (spent, units), (packed_value, chosen) in table.items():
+                    # Energy above the end-of-turn cap is lost; anything kept is a small bonus
+                    leftover = min(energy - spent, 5)
+                    total = value + packed_value + 0.1 * leftover
+                    if best_value is None or total > best_value:
+                        best_value = total
+                        # Units before Techniques so buffs/effects see the new board
+                        ordered = sorted(chosen, key=lambda cid: self.cards.by_id[cid]['type'] != 'UNIT')
+                        best_plan = setup + ordered
+        
+        # Traps cost nothing to set - fill open slots with the most valuable ones
+        trap_values = sorted(
+            ((self._deploy_card_value(cid, player_idx), cid) for cid in hand_traps),
+            reverse=True
+        )
+        best_plan = best_plan + [cid for _, cid in trap_values[:free_trap_slots]]
+        
+        AI_DECISION_CACHE.put(signature, tuple(best_plan))
+        return best_plan
+    
+    def _deploy_card_value(self, card_id, player_idx):
+        """Heuristic value of putting a card into play this turn (<= 0 means don't play it)"""
+        card = self.cards.by_id[card_id]
+        opponent = self.players[1 - player_idx]
+        enemy_units = sum(1 for u in opponent['battlefield'] if u is not None)
+        
+        if card['type'] == 'UNIT':
+            table = self.cards
+            i = table.index[card_id]
+            flags = table.keywords[i]
+            value = 2.0 + table.atk[i] + table.defense[i] + 0.5 * table.spd[i]
+            if flags & KW_GUARD:
+                value += 1.0
+            if flags & (KW_SWIFT | KW_WITHER | KW_PIERCE):
+                value += 0.5
+            if flags & KW_CORRUPT:
+                value += 0.5
+            return value
+        
+        if card['type'] == 'FIELD':
+            return 2.5
+        
+        if card['type'] == 'TRAP':
+            return 1.0 + 0.5 * card['cost']
+        
+        # Techniques - only the ones that resolve without a target are useful to the AI
+        if card_id == 'miasma_encroaching_fog':
+            return 1.5 * enemy_units
+        if card_id == 'miasma_choking_spores':
+            return 1.5 * sum(
+                1 for i, u in enumerate(opponent['battlefield'])
+                if u is not None and not opponent['battlefield_exhausted'][i]
+            )
+        if card_id == 'generic_salvage_the_ruins':
+            return 2.0
+        if card_id == 'generic_arcane_surge':
+            return -1.0  # Only worth it for the energy it unlocks
+        if card_id in ('generic_travelling_merchant', 'generic_eviction_notice'):
+            return 4.0 if opponent['field'] else 0
+        return 0
+    
+    def ai_turn(self):
+        """
+        AI plays its turn
+        Makes intelligent decisions about deploying units and attacking
+        """
+        ai_player = self.active_player
+        ai = self.players[ai_player]
+        opponent = self.players[1 - ai_player]
+        
+        self.log("AI is thinking...", level=LOG_DEBUG)
+        
+        # Phase 1: DEPLOY PHASE - Play cards from hand
+        if self.phase == 'deploy':
+            # Ask the planner for the best affordable combination of cards
+            plan = self.plan_deploy(ai_player)
+            
+            for card_id in plan:
+                card = self.cards.by_id[card_id]
                 
                 # Try to play the card
-                result = self.play_card(ai_player, item['id'])
+                result = self.play_card(ai_player, card_id)
                 
                 # PHASE 3D BATCH 3: Handle trap triggers during AI turn
                 if result.get('deployment_trap_trigger'):
                     # Don't pause AI turn for deployment traps - collect them and show once at end
                     # The pending_trap_trigger is already stored in self.pending_trap_trigger
-                    self.log(f"📋 Deployment trap triggered - will resolve after all deployments")
+                    self.log("📋 Deployment trap triggered - will resolve after all deployments", level=LOG_DEBUG)
                     # Continue playing cards - don't return yet
                 
                 elif result.get('field_trap_trigger') or result.get('technique_trap_trigger'):
                     # Non-deployment traps still pause AI turn
-                    self.log(f"⏸️ Trap triggered - AI pauses")
+                    self.log("⏸️ Trap triggered - AI pauses", level=LOG_DEBUG)
                     return  # Exit AI turn, trap needs to be resolved
                 
                 if result.get('success'):
-                    self.log(f"AI plays {card['name']}")
-                    
-                    # Don't play too many cards in one turn
-                    if card['type'] == 'UNIT' and ai['energy'] < 2:
-                        break  # Save some energy
+                    self.log("AI plays %s", card['name'])
         
         # Phase 2: COMBAT PHASE - Attack with units
         if self.phase == 'combat':
@@ -1693,143 +3700,408 @@ class GameState:
                 self.log("AI skips combat (Turn 1 restriction)")
                 return
             
-            self.log("🗡️ AI entering combat phase...")
+            self.log("🗡️ AI entering combat phase...", level=LOG_DEBUG)
             attacks_made = 0
             
-            # Get all ready AI units
-            for ai_index, unit_id in enumerate(ai['battlefield']):
-                if not unit_id:
-                    continue
-                
-                # Skip exhausted units
-                if ai['battlefield_exhausted'][ai_index]:
-                    self.log(f"AI unit at slot {ai_index} is exhausted, skipping")
-                    continue
+            # Plan every attack for the turn at once: search small endgames
+            # a few turns ahead, otherwise work from the trade matrix
+            if self.in_endgame():
+                plan = self.solve_endgame(ai_player)
+            else:
+                plan = self.plan_attacks(ai_player)
+            
+            for ai_index, opp_index, pierce_target in plan:
+                attacker_name = self.cards.by_id[ai['battlefield'][ai_index]]['name']
+                self.log("AI attacks: %s → opponent slot %d", attacker_name, opp_index, level=LOG_DEBUG)
+                attack_result = self.attack(ai_player, ai_index, opp_index)
                 
-                # Skip units with no_attack flag
-                if ai['battlefield_no_attack'][ai_index]:
-                    self.log(f"AI unit at slot {ai_index} has no_attack flag, skipping")
+                if attack_result.get('error'):
+                    self.log("AI attack skipped: %s", attack_result['error'], level=LOG_DEBUG)
                     continue
+                attacks_made += 1
                 
-                attacker = CARDS_BY_ID[unit_id]
-                self.log(f"AI unit {attacker['name']} (slot {ai_index}) looking for targets...")
-                
-                # Find valid targets (units we can actually attack)
-                valid_targets = []
-                
-                # First, check if opponent has any Guard units
-                guard_units = []
-                for opp_index, opp_unit_id in enumerate(opponent['battlefield']):
-                    if not opp_unit_id:
-                        continue
-                    defender = CARDS_BY_ID[opp_unit_id]
-                    if 'Guard' in defender.get('keywords', []):
-                        guard_units.append(opp_index)
-                
-                # If Guard units exist, must attack one of them
-                targets_to_consider = guard_units if guard_units else range(5)
-                
-                # If no Guard, must attack highest DEF
-                if not guard_units:
-                    # Find highest DEF among opponent units
-                    enemy_units = []
-                    for opp_index, opp_unit_id in enumerate(opponent['battlefield']):
-                        if not opp_unit_id:
-                            continue
-                        defender = CARDS_BY_ID[opp_unit_id]
-                        enemy_units.append({
-                            'index': opp_index,
-                            'def': defender.get('def', 0)
-                        })
-                    
-                    if enemy_units:
-                        max_def = max(u['def'] for u in enemy_units)
-                        targets_to_consider = [u['index'] for u in enemy_units if u['def'] == max_def]
-                
-                for opp_index in targets_to_consider:
-                    # Get the unit at this index
-                    opp_unit_id = opponent['battlefield'][opp_index]
-                    if not opp_unit_id:
-                        continue
-                    
-                    defender = CARDS_BY_ID[opp_unit_id]
-                    
-                    # Check SPD restrictions (including Swift)
-                    attacker_spd = attacker.get('spd', 0)
-                    defender_spd = defender.get('spd', 0)
-                    has_swift = 'Swift' in attacker.get('keywords', [])
-                    
-                    # Swift only works on first turn deployed
-                    attacker_deployed_turn = ai['battlefield_deployed_turn'][ai_index]
-                    is_first_turn = attacker_deployed_turn == self.half_turn
-                    swift_active = has_swift and is_first_turn
-                    
-                    if swift_active or attacker_spd >= defender_spd:
-                        # Calculate if this is a good attack
-                        attacker_atk = attacker.get('atk', 0)
-                        defender_def = defender.get('def', 0)
-                        defender_atk = defender.get('atk', 0)
-                        attacker_def = attacker.get('def', 0)
-                        
-                        # We destroy them if our ATK > their DEF
-                        we_destroy = attacker_atk > defender_def
-                        # They destroy us if their ATK > our DEF
-                        they_destroy = defender_atk > attacker_def
-                        
-                        # Calculate value of trade
-                        score = 0
-                        if we_destroy and not they_destroy:
-                            score = 100  # Great trade!
-                        elif we_destroy and they_destroy:
-                            score = 50   # Even trade
-                        elif not we_destroy and not they_destroy:
-                            score = 10   # No one dies, chip damage
-                        else:
-                            score = -50  # Bad trade, we die
-                        
-                        valid_targets.append({
-                            'index': opp_index,
-                            'score': score
-                        })
+                # Check if a trap triggered (e.g., Decoy Protocol)
+                if attack_result.get('trap_trigger'):
+                    # Store the trap trigger for frontend handling
+                    # The frontend will prompt the human and then continue the attack
+                    self.hold_attack_trap(ai_player, attack_result)
+                    self.log("⏸️ Attack trap triggered - AI pauses", level=LOG_DEBUG)
+                    return  # Exit AI turn so trap can be resolved
                 
-                # Attack the best target
-                if valid_targets:
-                    # Sort by score (best first)
-                    valid_targets.sort(key=lambda x: x['score'], reverse=True)
-                    
-                    # Make AI more aggressive - attack even with slightly bad trades
-                    best_target = valid_targets[0]
-                    self.log(f"AI considering attack: {attacker['name']} → opponent slot {best_target['index']} (score: {best_target['score']})")
-                    
-                    if best_target['score'] >= -30:  # More aggressive threshold (was -20)
-                        attack_result = self.attack(ai_player, ai_index, best_target['index'])
-                        attacks_made += 1
-                        
-                        # Check if a trap triggered (e.g., Decoy Protocol)
-                        if attack_result and attack_result.get('trap_trigger'):
-                            # Store the trap trigger for frontend handling
-                            # The frontend will prompt the human and then continue the attack
-                            self.pending_trap_trigger = {
-                                'trap_type': 'attack_trap_trigger',
-                                'trap': attack_result['trap'],
-                                'trap_slot': attack_result['trap_slot'],
-                                'trigger_message': attack_result['trigger_message'],
-                                'trigger_data': attack_result['trigger_data'],
-                                'trap_owner': 1 - ai_player,  # Opponent owns the trap
-                                'pending_attack': attack_result['pending_attack']
-                            }
-                            self.log(f"⏸️ Attack trap triggered - AI pauses")
-                            return  # Exit AI turn so trap can be resolved
-                    else:
-                        self.log(f"AI skips attack (score too low: {best_target['score']})")
-                else:
-                    self.log(f"AI unit {attacker['name']} has no valid targets (SPD restrictions or no enemies)")
+                # Spend Pierce overflow on the planned follow-up target
+                if attack_result.get('pierce_available') and pierce_target is not None:
+                    if opponent['battlefield'][pierce_target] is not None:
+                        self.apply_pierce(pierce_target, attack_result['pierce_damage'], 1 - ai_player)
             
             # End of combat phase summary
             if attacks_made == 0:
-                self.log("⚔️ AI combat complete - no attacks made")
+                self.log("⚔️ AI combat complete - no attacks made", level=LOG_DEBUG)
             else:
-                self.log(f"⚔️ AI combat complete - {attacks_made} attack(s) made")
+                self.log("⚔️ AI combat complete - %d attack(s) made", attacks_made, level=LOG_DEBUG)
+    
+    # ============================================================
+    # AI COMBAT PLANNER
+    # ============================================================
+    
+    def unit_value(self, card_id):
+        """Rough board value of a Unit, used to score trades"""
+        table = self.cards
+        i = table.index[card_id]
+        value = 1.0 + table.atk[i] + table.defense[i] + 0.5 * table.spd[i]
+        if table.keywords[i] & KW_GUARD:
+            value += 1.0
+        return value
+    
+    def build_trade_matrix(self, attacker_player):
+        """
+        Compute the 5x5 attacker-by-defender combat outcome matrix
+        
+        Every entry uses the same actual stats as attack() (ATK/DEF/SPD buffs,
+        Wither, Swift, exhaustion, Veil of Binding, Self-Destruct), so the AI
+        scores the trade that will really happen. Guard is applied per board
+        state by plan_attacks(), since it changes as Guards are destroyed.
+        
+        Returns:
+            dict of 5x5 lists: 'legal', 'kills', 'dies', 'overflow', 'debuffs', plus the
+            per-slot 'can_attack', 'guard', 'pierce_def' and 'value' vectors
+        """
+        ai = self.players[attacker_player]
+        opp = self.players[1 - attacker_player]
+        
+        table = self.cards
+        
+        def slot_stats(player_obj, i):
+            c = table.index[player_obj['battlefield'][i]]
+            return (
+                table.atk[c] + player_obj['battlefield_atk_buff'][i],
+                max(1, table.defense[c] + player_obj['battlefield_def_buff'][i] - player_obj['battlefield_wither'][i]),
+                table.spd[c] + player_obj['battlefield_spd_buff'][i],
+                table.keywords[c],
+            )
+        
+        empty = [[False] * 5 for _ in range(5)]
+        matrix = {
+            'legal': [row[:] for row in empty],
+            'kills': [row[:] for row in empty],
+            'dies': [row[:] for row in empty],
+            'overflow': [[0] * 5 for _ in range(5)],
+            'debuffs': [row[:] for row in empty],
+            'can_attack': [False] * 5,
+            'guard': [False] * 5,
+            'pierce_def': [0] * 5,
+            'value': [0.0] * 5,
+        }
+        
+        defenders = {}
+        for d in range(5):
+            if opp['battlefield'][d] is not None:
+                defenders[d] = slot_stats(opp, d)
+                matrix['guard'][d] = bool(defenders[d][3] & KW_GUARD)
+                # apply_pierce() checks base DEF less Wither, without DEF buffs
+                c = table.index[opp['battlefield'][d]]
+                matrix['pierce_def'][d] = max(1, table.defense[c] - opp['battlefield_wither'][d])
+                matrix['value'][d] = self.unit_value(opp['battlefield'][d])
+        
+        for a in range(5):
+            if ai['battlefield'][a] is None:
+                continue
+            if ai['battlefield_exhausted'][a] or ai['battlefield_no_attack'][a]:
+                continue
+            matrix['can_attack'][a] = True
+            atk, def_, spd, keywords = slot_stats(ai, a)
+            swift_active = keywords & KW_SWIFT and ai['battlefield_deployed_turn'][a] == self.half_turn
+            
+            for d, (d_atk, d_def, d_spd, _) in defenders.items():
+                if not swift_active and spd < d_spd:
+                    continue
+                matrix['legal'][a][d] = True
+                kills = atk > d_def
+                matrix['kills'][a][d] = kills
+                if kills:
+                    # Self-Destruct takes the attacker down with the defender
+                    armed = opp.get('battlefield_self_destruct_armed')
+                    matrix['dies'][a][d] = bool(armed and armed[d])
+                    if keywords & KW_PIERCE and not matrix['dies'][a][d]:
+                        matrix['overflow'][a][d] = atk - d_def
+                else:
+                    can_retaliate = not opp['battlefield_exhausted'][d] and not opp['battlefield_no_retaliate'][d]
+                    matrix['dies'][a][d] = can_retaliate and d_atk > def_
+                    # Wither/Corrupt still land on a surviving defender
+                    matrix['debuffs'][a][d] = bool(keywords & (KW_WITHER | KW_CORRUPT))
+        
+        return matrix
+    
+    def plan_attacks(self, attacker_player):
+        """
+        Choose the whole turn's attacks jointly
+        
+        Searches attack orderings over the trade matrix (memoized on which
+        attackers are spent and which defenders remain) so the AI can, for
+        example, clear a Guard with one Unit before another Unit hits the
+        target behind it, or route Pierce overflow into a second kill.
+        
+        Returns:
+            List of (attacker_index, defender_index, pierce_target_index or None)
+        """
+        signature = ('attack', self.cards.version, self.combat_signature(attacker_player))
+        cached = AI_DECISION_CACHE.get(signature)
+        if cached is not None:
+            return [tuple(step) for step in cached]
+        
+        ai = self.players[attacker_player]
+        m = self.build_trade_matrix(attacker_player)
+        own_value = [
+            self.unit_value(uid) if uid is not None else 0.0
+            for uid in ai['battlefield']
+        ]
+        attackers = [a for a in range(5) if m['can_attack'][a]]
+        memo = {}
+        
+        def best_from(spent, alive):
+            key = (spent, alive)
+            if key in memo:
+                return memo[key]
+            
+            # Stopping here is always an option; wiping the board forces Control Loss
+            best = (5.0 if alive == 0 and any(m['value']) else 0.0, ())
+            
+            guards = [d for d in range(5) if alive & (1 << d) and m['guard'][d]]
+            targets = guards if guards else [d for d in range(5) if alive & (1 << d)]
+            
+            for a in attackers:
+                if spent & (1 << a):
+                    continue
+                for d in targets:
+                    if not m['legal'][a][d]:
+                        continue
+                    score = -0.5  # Exhausted attackers can't retaliate next turn
+                    new_alive = alive
+                    pierce_target = None
+                    if m['kills'][a][d]:
+                        score += m['value'][d]
+                        new_alive &= ~(1 << d)
+                        overflow = m['overflow'][a][d]
+                        if overflow:
+                            # Same DEF apply_pierce() checks: base DEF less Wither
+                            options = [
+                                t for t in range(5)
+                                if new_alive & (1 << t) and overflow >= m['pierce_def'][t]
+                            ]
+                            if options:
+                                pierce_target = max(options, key=lambda t: m['value'][t])
+                                score += m['value'][pierce_target]
+                                new_alive &= ~(1 << pierce_target)
+                    elif m['debuffs'][a][d]:
+                        score += 0.75
+                    if m['dies'][a][d]:
+                        score -= own_value[a]
+                    
+                    rest_score, rest_plan = best_from(spent | (1 << a), new_alive)
+                    total = score + rest_score
+                    if total > best[0]:
+                        best = (total, ((a, d, pierce_target),) + rest_plan)
+            
+            memo[key] = best
+            return best
+        
+        alive = sum(1 << d for d in range(5) if m['value'][d])
+        score, plan = best_from(0, alive)
+        self.log("AI combat plan: %d attack(s), expected value %.1f", len(plan), score, level=LOG_DEBUG)
+        AI_DECISION_CACHE.put(signature, plan)
+        return list(plan)
+    
+    def combat_signature(self, attacker_player):
+        """Canonical description of everything build_trade_matrix() reads"""
+        def side(p, swift_turn):
+            return tuple(
+                (
+                    uid,
+                    p['battlefield_exhausted'][i],
+                    p['battlefield_no_attack'][i],
+                    p['battlefield_no_retaliate'][i],
+                    p['battlefield_atk_buff'][i],
+                    p['battlefield_def_buff'][i],
+                    p['battlefield_spd_buff'][i],
+                    p['battlefield_wither'][i],
+                    bool(p.get('battlefield_self_destruct_armed') and p['battlefield_self_destruct_armed'][i]),
+                    swift_turn and p['battlefield_deployed_turn'][i] == self.half_turn,
+                ) if uid is not None else None
+                for i, uid in enumerate(p['battlefield'])
+            )
+        
+        return (
+            side(self.players[attacker_player], True),
+            side(self.players[1 - attacker_player], False),
+        )
+    
+    # ============================================================
+    # AI ENDGAME SOLVER
+    # ============================================================
+    
+    def in_endgame(self):
+        """True once the position is close to decided and small enough to search"""
+        units = sum(
+            1 for p in self.players for u in p['battlefield'] if u is not None
+        )
+        if units > ENDGAME_MAX_UNITS:
+            return False
+        thin_decks = min(len(p['deck']) for p in self.players) <= ENDGAME_DECK_THRESHOLD
+        near_loss = max(p['control_loss'] for p in self.players) >= ENDGAME_CONTROL_LOSS_THRESHOLD
+        return thin_decks or near_loss
+    
+    def solve_endgame(self, player_idx):
+        """
+        Plan this turn's attacks with a bounded alpha-beta search
+        
+        This is a heuristic lookahead, not a solver. The position is reduced
+        to each side's Units (actual ATK/DEF/SPD, Guard, ready state),
+        Control Loss tokens and deck size. Each turn the side to move makes
+        any sequence of legal attacks, then ends the turn: Control Loss is
+        scored, the next player readies (Wither and expiring buffs clear) and
+        draws, losing on an empty deck. Search stops ENDGAME_SEARCH_TURNS
+        turns deep and scores the horizon with _endgame_evaluate(). Not
+        modeled: cards in hand, Swift, Pierce and Self-Destruct. A
+        transposition table is shared across calls.
+        
+        Returns:
+            List of (attacker_index, defender_index, None) for this turn,
+            in the same shape as plan_attacks()
+        """
+        table = self.cards
+        
+        def abstract_side(p_idx):
+            p = self.players[p_idx]
+            units = []
+            for i, uid in enumerate(p['battlefield']):
+                if uid is None:
+                    continue
+                c = table.index[uid]
+                atk_buff = p['battlefield_atk_buff'][i]
+                def_buff = p['battlefield_def_buff'][i]
+                spd_buff = p['battlefield_spd_buff'][i]
+                # Stats once readied: Wither and expiring buffs are gone
+                if p['battlefield_buff_expires'][i]:
+                    ready = (table.atk[c], max(1, table.defense[c]), table.spd[c])
+                else:
+                    ready = (table.atk[c] + atk_buff, max(1, table.defense[c] + def_buff), table.spd[c] + spd_buff)
+                units.append((
+                    i,
+                    table.atk[c] + atk_buff,
+                    max(1, table.defense[c] + def_buff - p['battlefield_wither'][i]),
+                    table.spd[c] + spd_buff,
+                    bool(table.keywords[c] & KW_GUARD),
+                    not p['battlefield_exhausted'][i] and not p['battlefield_no_attack'][i],
+                    not p['battlefield_no_retaliate'][i],
+                    ready,
+                ))
+            return (tuple(units), p['control_loss'], len(p['deck']))
+        
+        me = abstract_side(player_idx)
+        them = abstract_side(1 - player_idx)
+        
+        best_value, line = self._endgame_search(me, them, ENDGAME_SEARCH_TURNS, -ENDGAME_WIN_SCORE - 1, ENDGAME_WIN_SCORE + 1)
+        self.log("AI endgame search: value %s, %d attack(s)", best_value, len(line), level=LOG_DEBUG)
+        
+        if len(ENDGAME_TRANSPOSITION_TABLE) > ENDGAME_TRANSPOSITION_TABLE_LIMIT:
+            ENDGAME_TRANSPOSITION_TABLE.clear()
+        return [(a, d, None) for a, d in line]
+    
+    def _endgame_search(self, me, them, turns_left, alpha, beta):
+        """
+        Negamax with alpha-beta over the abstract endgame state
+        
+        Returns (value for the side to move, this turn's attacks as a list of
+        (attacker_slot, defender_slot)). A move is either one attack (the
+        same side keeps moving) or ending the turn.
+        """
+        key = (me, them, turns_left)
+        entry = ENDGAME_TRANSPOSITION_TABLE.get(key)
+        if entry is not None:
+            value, flag, line = entry
+            if flag == 'exact':
+                return value, line
+            if flag == 'lower' and value >= beta:
+                return value, line
+            if flag == 'upper' and value <= alpha:
+                return value, line
+        alpha_start = alpha
+        
+        my_units, my_cl, my_deck = me
+        their_units, their_cl, their_deck = them
+        
+        # Ending the turn: score Control Loss, then the opponent readies and draws
+        if my_units:
+            new_cl = 0
+        else:
+            new_cl = my_cl + 1
+        if new_cl >= 3:
+            best = (-ENDGAME_WIN_SCORE, [])
+        elif their_deck == 0:
+            best = (ENDGAME_WIN_SCORE, [])  # Opponent can't draw and loses
+        elif turns_left <= 1:
+            best = (self._endgame_evaluate(my_units, new_cl, their_units, their_cl), [])
+        else:
+            readied = tuple(
+                (slot, ready[0], ready[1], ready[2], guard, True, True, ready)
+                for slot, _, _, _, guard, _, _, ready in their_units
+            )
+            value, _ = self._endgame_search(
+                (readied, their_cl, their_deck - 1),
+                (my_units, new_cl, my_deck),
+                turns_left - 1, -beta, -alpha
+            )
+            best = (-value, [])
+        alpha = max(alpha, best[0])
+        
+        # Each legal attack keeps the move with the same side
+        guards = [u for u in their_units if u[4]]
+        targets = guards if guards else their_units
+        for attacker in my_units:
+            if alpha >= beta:
+                break
+            a_slot, a_atk, a_def, a_spd, _, a_ready, _, _ = attacker
+            if not a_ready:
+                continue
+            for defender in targets:
+                d_slot, d_atk, d_def, d_spd, _, d_ready, d_retaliates, _ = defender
+                if a_spd < d_spd:
+                    continue
+                
+                new_mine = [u for u in my_units if u[0] != a_slot]
+                new_theirs = [u for u in their_units if u[0] != d_slot]
+                exhausted = attacker[:5] + (False,) + attacker[6:]
+                if a_atk > d_def:
+                    new_mine.append(exhausted)
+                elif not (d_ready and d_retaliates and d_atk > a_def):
+                    new_mine.append(exhausted)
+                    new_theirs.append(defender)
+                else:
+                    new_theirs.append(defender)
+                
+                value, line = self._endgame_search(
+                    (tuple(sorted(new_mine)), my_cl, my_deck),
+                    (tuple(sorted(new_theirs)), their_cl, their_deck),
+                    turns_left, alpha, beta
+                )
+                if value > best[0]:
+                    best = (value, [(a_slot, d_slot)] + line)
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        
+        if best[0] <= alpha_start:
+            flag = 'upper'
+        elif best[0] >= beta:
+            flag = 'lower'
+        else:
+            flag = 'exact'
+        ENDGAME_TRANSPOSITION_TABLE[key] = (best[0], flag, best[1])
+        return best
+    
+    def _endgame_evaluate(self, my_units, my_cl, their_units, their_cl):
+        """Static score at the search horizon (material and Control Loss)"""
+        material = sum(u[7][0] + u[7][1] for u in my_units) - sum(u[7][0] + u[7][1] for u in their_units)
+        return material + 20 * (their_cl - my_cl)
     
     def end_turn(self):
         """End current turn and start next"""
@@ -1842,7 +4114,7 @@ class GameState:
                 if opponent['battlefield'][i] is not None:
                     if opponent['battlefield_override_expires_turn'][i] == self.turn:
                         if opponent['battlefield_corrupt'][i]:
-                            self.log(f"{CARDS_BY_ID[opponent['battlefield'][i]]['name']}'s Override expires")
+                            self.log("%s's Override expires", self.cards.by_id[opponent['battlefield'][i]]['name'])
                             opponent['battlefield_corrupt'][i] = False
                             opponent['battlefield_override_expires_turn'][i] = 0
         
@@ -1855,14 +4127,14 @@ class GameState:
                 corrupt_turn = current_player['battlefield_corrupt_applied_turn'][i]
                 if corrupt_turn > 0 and self.half_turn > corrupt_turn:
                     if current_player['battlefield_corrupt'][i]:
-                        self.log(f"{CARDS_BY_ID[current_player['battlefield'][i]]['name']}'s Corrupt expires")
+                        self.log("%s's Corrupt expires", self.cards.by_id[current_player['battlefield'][i]]['name'])
                         current_player['battlefield_corrupt'][i] = False
                         current_player['battlefield_corrupt_applied_turn'][i] = 0
                 
                 # Clear buffs that expire at end of turn
                 if current_player['battlefield_buff_expires'][i] == 'end_turn':
                     if current_player['battlefield_atk_buff'][i] or current_player['battlefield_def_buff'][i] or current_player['battlefield_spd_buff'][i]:
-                        self.log(f"{CARDS_BY_ID[current_player['battlefield'][i]]['name']}'s buffs expire")
+                        self.log("%s's buffs expire", self.cards.by_id[current_player['battlefield'][i]]['name'])
                         current_player['battlefield_atk_buff'][i] = 0
                         current_player['battlefield_def_buff'][i] = 0
                         current_player['battlefield_spd_buff'][i] = 0
@@ -1870,29 +4142,29 @@ class GameState:
                 
                 # Clear Veil of Binding (no retaliate) at end of turn
                 if current_player['battlefield_no_retaliate'][i]:
-                    self.log(f"{CARDS_BY_ID[current_player['battlefield'][i]]['name']}'s Veil of Binding expires")
+                    self.log("%s's Veil of Binding expires", self.cards.by_id[current_player['battlefield'][i]]['name'])
                     current_player['battlefield_no_retaliate'][i] = False
                 
                 # Clear Counter Measure (no attack) at end of turn
                 if current_player['battlefield_no_attack'][i]:
-                    unit_name = CARDS_BY_ID[current_player['battlefield'][i]]['name']
-                    self.log(f"{unit_name} can attack again (Counter Measure expired)")
+                    unit_name = self.cards.by_id[current_player['battlefield'][i]]['name']
+                    self.log("%s can attack again (Counter Measure expired)", unit_name)
                     current_player['battlefield_no_attack'][i] = False
         
         # Check Control Loss
         has_units = any(u is not None for u in current_player['battlefield'])
         if not has_units:
             current_player['control_loss'] += 1
-            self.log(f"Player {self.active_player + 1} gains Control Loss token ({current_player['control_loss']}/3)")
+            self.log("Player %s gains Control Loss token (%s/3)", self.active_player + 1, current_player['control_loss'])
             
             if current_player['control_loss'] >= 3:
                 self.winner = 1 - self.active_player
-                self.log(f"Player {self.active_player + 1} loses! Three Control Loss tokens!")
+                self.log("Player %s loses! Three Control Loss tokens!", self.active_player + 1)
                 return
         else:
             # Has units - clear Control Loss
             if current_player['control_loss'] > 0:
-                self.log(f"Player {self.active_player + 1} clears Control Loss tokens")
+                self.log("Player %s clears Control Loss tokens", self.active_player + 1)
                 current_player['control_loss'] = 0
         
         # Rotfall Expanse: check BOTH players at end of turn
@@ -1907,33 +4179,34 @@ class GameState:
                 unit_count = sum(1 for u in p['battlefield'] if u is not None)
                 if unit_count > 3:
                     must_destroy = unit_count - 3
-                    if p_idx == 0:
+                    if p_idx not in self.ai_players:
                         # Human player - set flag and block turn
                         p['rotfall_must_destroy'] = must_destroy
-                        self.log(f"🌑 Rotfall Expanse: You have {unit_count} Units - must destroy {must_destroy}!")
+                        self.log("🌑 Rotfall Expanse: You have %s Units - must destroy %s!", unit_count, must_destroy)
                         return  # Block turn end - frontend shows modal
                     else:
                         # AI player - auto-destroy weakest units (lowest ATK)
-                        self.log(f"🌑 Rotfall Expanse: Opponent has {unit_count} Units - destroying {must_destroy}!")
+                        self.log("🌑 Rotfall Expanse: Opponent has %s Units - destroying %s!", unit_count, must_destroy)
                         for _ in range(must_destroy):
                             # Find weakest unit (lowest ATK) to auto-destroy
                             weakest_i = None
                             weakest_atk = 999
                             for i in range(5):
                                 if p['battlefield'][i] is not None:
-                                    unit_atk = CARDS_BY_ID[p['battlefield'][i]].get('atk', 0)
+                                    unit_atk = self.cards.by_id[p['battlefield'][i]].get('atk', 0)
                                     if unit_atk < weakest_atk:
                                         weakest_atk = unit_atk
                                         weakest_i = i
                             if weakest_i is not None:
-                                destroyed_name = CARDS_BY_ID[p['battlefield'][weakest_i]]['name']
+                                destroyed_name = self.cards.by_id[p['battlefield'][weakest_i]]['name']
                                 p['discard'].append(p['battlefield'][weakest_i])
+                                self.emit(UnitDestroyed, p_idx, weakest_i, p['battlefield'][weakest_i], 'rotfall')
                                 p['battlefield'][weakest_i] = None
-                                self.log(f"🌑 Rotfall: AI destroys {destroyed_name}")
+                                self.log("🌑 Rotfall: AI destroys %s", destroyed_name)
         
         # Apply energy cap
         if current_player['energy'] > 5:
-            current_player['energy'] = 5
+            self.change_energy(current_player, 5 - current_player['energy'], 'energy_cap')
         
         # Check hand size limit (max 7 cards) - BLOCK turn from ending
         if len(current_player['hand']) > 7:
@@ -1941,7 +4214,7 @@ class GameState:
             if current_player.get('must_discard', 0) == 0:
                 # First time - set flag
                 current_player['must_discard'] = over_limit
-                self.log(f"⚠️ You have {len(current_player['hand'])} cards! Discard {over_limit} before ending turn.")
+                self.log("⚠️ You have %s cards! Discard %s before ending turn.", len(current_player['hand']), over_limit)
             return  # BLOCK - don't end turn until hand size is 7 or less
         
         # Clear must_discard flag if it was set
@@ -1955,7 +4228,7 @@ class GameState:
             self.turn += 1
         
         # Start phase
-        self.phase = 'start'
+        self.set_phase('start')
         self.start_turn()
     
     def start_turn(self):
@@ -1970,8 +4243,8 @@ class GameState:
         for i in range(5):
             if current_player['battlefield'][i] is not None:
                 if current_player['battlefield_wither'][i] > 0:
-                    unit_name = CARDS_BY_ID[current_player['battlefield'][i]]['name']
-                    self.log(f"{unit_name}'s Wither expires")
+                    unit_name = self.cards.by_id[current_player['battlefield'][i]]['name']
+                    self.log("%s's Wither expires", unit_name)
                     current_player['battlefield_wither'][i] = 0
                     current_player['battlefield_wither_applied_turn'][i] = 0
         
@@ -1981,8 +4254,8 @@ class GameState:
             for i in range(5):
                 if self.players[p]['battlefield'][i] is not None:
                     if self.players[p]['battlefield_enter_exhausted_next_turn'][i]:
-                        unit_name = CARDS_BY_ID[self.players[p]['battlefield'][i]]['name']
-                        self.log(f"{unit_name} enters exhausted (Velocity Patch)")
+                        unit_name = self.cards.by_id[self.players[p]['battlefield'][i]]['name']
+                        self.log("%s enters exhausted (Velocity Patch)", unit_name)
                         self.players[p]['battlefield_exhausted'][i] = True
                         self.players[p]['battlefield_enter_exhausted_next_turn'][i] = False
         
@@ -1994,7 +4267,7 @@ class GameState:
             if current_player['battlefield'][i] is not None:
                 if current_player['battlefield_buff_expires'][i] == 'start_next_turn':
                     if current_player['battlefield_atk_buff'][i] or current_player['battlefield_def_buff'][i] or current_player['battlefield_spd_buff'][i]:
-                        self.log(f"{CARDS_BY_ID[current_player['battlefield'][i]]['name']}'s buffs expire")
+                        self.log("%s's buffs expire", self.cards.by_id[current_player['battlefield'][i]]['name'])
                         current_player['battlefield_atk_buff'][i] = 0
                         current_player['battlefield_def_buff'][i] = 0
                         current_player['battlefield_spd_buff'][i] = 0
@@ -2005,15 +4278,15 @@ class GameState:
         
         # Gain energy (check for Arcane Surge skip)
         if current_player.get('skip_next_energy_gain', False):
-            self.log(f"⚡ Arcane Surge effect: No energy gained this turn")
+            self.log("⚡ Arcane Surge effect: No energy gained this turn")
             current_player['skip_next_energy_gain'] = False
         else:
-            current_player['energy'] += 2
+            self.change_energy(current_player, 2, 'turn_start')
         
         # Apply pending energy from Kill Zone / Rustfields
         if current_player.get('pending_energy', 0) > 0:
-            current_player['energy'] += current_player['pending_energy']
-            self.log(f"⚡ Gained {current_player['pending_energy']}⚡ from field effect!")
+            self.change_energy(current_player, current_player['pending_energy'], current_player.get('field'))
+            self.log("⚡ Gained %s⚡ from field effect!", current_player['pending_energy'])
             current_player['pending_energy'] = 0
         
         # Relay Node: gain 1⚡ if you have a Skyforge Unit deployed AND energy < 5 (max 1 per turn)
@@ -2021,15 +4294,15 @@ class GameState:
         if current_player.get('field') == 'skyforge_relay_node':
             if current_player['energy'] < 5:
                 has_skyforge_unit = any(
-                    uid and CARDS_BY_ID[uid].get('faction') == 'Skyforge'
+                    uid and self.cards.by_id[uid].get('faction') == 'Skyforge'
                     for uid in current_player['battlefield']
                 )
                 if has_skyforge_unit:
-                    current_player['energy'] += 1
+                    self.change_energy(current_player, 1, 'skyforge_relay_node')
                     current_player['relay_node_gained'] = True
-                    self.log(f"⚡ Relay Node: Gained 1⚡ (Skyforge Unit deployed)")
+                    self.log("⚡ Relay Node: Gained 1⚡ (Skyforge Unit deployed)")
             else:
-                self.log(f"⚡ Relay Node: Energy already at max (5⚡)")
+                self.log("⚡ Relay Node: Energy already at max (5⚡)")
         
         # Lowlands Mist: apply Wither to all ENEMY units at start of YOUR turn
         # Wither will expire at start of ENEMY's next turn automatically
@@ -2040,8 +4313,8 @@ class GameState:
                 if opponent['battlefield'][i] is not None:
                     opponent['battlefield_wither'][i] += 1
                     opponent['battlefield_wither_applied_turn'][i] = self.half_turn
-                    unit_name = CARDS_BY_ID[opponent['battlefield'][i]]['name']
-                    self.log(f"🌫️ Lowlands Mist: {unit_name} withers (DEF -1 until their next turn)")
+                    unit_name = self.cards.by_id[opponent['battlefield'][i]]['name']
+                    self.log("🌫️ Lowlands Mist: %s withers (DEF -1 until their next turn)", unit_name)
         
         # Ready all units (remove exhaustion) - CHECK FOR Flute of Slumber first
         opponent_idx = 1 - self.active_player
@@ -2051,7 +4324,7 @@ class GameState:
             if current_player['battlefield'][i] is not None and current_player['battlefield_exhausted'][i]:
                 # This unit is about to become ready - check for Flute of Slumber
                 unit_card_id = current_player['battlefield'][i]
-                unit_name = CARDS_BY_ID[unit_card_id]['name']
+                unit_name = self.cards.by_id[unit_card_id]['name']
                 
                 flute_traps = self.check_traps(
                     opponent_idx,
@@ -2092,121 +4365,650 @@ class GameState:
                 'trap_owner': flute_triggered_units[0]['trap_owner']
             }
             # Don't ready units yet - wait for trap resolution
-            self.log(f"⏸️ Unit readying paused - trap triggered")
+            self.log("⏸️ Unit readying paused - trap triggered", level=LOG_DEBUG)
         else:
             # No Flute traps - ready all units normally
             for i in range(5):
                 if current_player['battlefield'][i] is not None:
                     current_player['battlefield_exhausted'][i] = False
             
-            self.log(f"Turn {self.turn} - Player {self.active_player + 1}'s turn begins")
+            self.log("Turn %s - Player %s's turn begins", self.turn, self.active_player + 1)
         
         # Auto-advance to deploy phase
-        self.phase = 'deploy'
+        self.set_phase('deploy')
 
-def create_starter_deck(faction):
-    """Create a 42-card starter deck for a faction"""
-    
-    # Skyforge 42-card starter deck (EXACT list with duplicates)
-    if faction == 'Skyforge':
-        deck = []
-        
-        # All cards with quantities (including duplicates to reach 42)
-        deck_list = {
-            'skyforge_skyforge_drone': 3,
-            'skyforge_skyforge_scout': 3,
-            'skyforge_skyforge_gunner': 2,
-            'skyforge_skyforge_interceptor': 1,
-            'skyforge_skyforge_bulwark': 1,
-            'skyforge_skyforge_overseer': 1,
-            'human_scrapland_scavenger': 2,  # Added +1 for 42nd card
-            'hybrid_ashfang_hound': 1,
-            'ancient_wasteland_sentinel': 1,
-            'beast_carrion_drifter': 1,
-            'human_dustrunner_nomad': 1,
-            'mutant_ironhide_behemoth': 1,
-            'mutant_signal_leech': 1,
-            'undead_gravefield_lurker': 1,
-            'undead_wanderer_of_ash': 1,
-            'skyforge_override': 1,
-            'skyforge_software_update': 1,
-            'skyforge_velocity_patch': 1,
-            'skyforge_reboot': 1,
-            'generic_arcane_surge': 2,  # Duplicate (+1)
-            'generic_veil_of_binding': 1,
-            'generic_food_rations': 1,
-            'generic_travelling_merchant': 1,
-            'skyforge_lockdown': 1,
-            'skyforge_counter_measure': 2,  # Duplicate (+1)
-            'skyforge_self_destruct': 1,
-            'skyforge_decoy_protocol': 1,
-            'generic_flute_of_slumber': 1,
-            'generic_return_to_sender': 1,
-            'skyforge_assembly_line': 2,  # Duplicate (+1)
-            'skyforge_relay_node': 1,
-            'skyforge_kill_zone': 1,
-            'skyforge_rustfields': 1,
-        }
-        
-        for card_id, count in deck_list.items():
-            if card_id in CARDS_BY_ID:
-                for _ in range(count):
-                    deck.append(card_id)
-            else:
-                print(f"Warning: Card not found: {card_id}")
+def _advance_phase_job(snapshot):
+    """Worker-process entry point: run one AI phase on a binary snapshot and send it back with its events"""
+    game = GameState.from_snapshot(decode_snapshot(snapshot))
+    # Subscribers live in the web process, so the worker only collects the events
+    events = []
+    game.event_bus = EventBus()
+    game.event_bus.subscribe(events.append)
+    game.advance_phase()
+    return encode_snapshot(game.snapshot()), events
+
+
+class AIExecutor:
+    """
+    Runs AI phases in a process pool so request threads never do the thinking
+    
+    The request thread hands over a binary GameState snapshot (see
+    encode_snapshot()) and gets back a job ID. It can wait up to a timeout
+    for the result or let the client poll /api/ai_jobs/<job_id>. Finished snapshots are applied to the live game by
+    whichever request collects them first, and the events the AI produced
+    are published on the live game's bus at that point.
+    """
+    
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.pool = None
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.failed = 0
+    
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+    
+    def submit(self, game):
+        """Start an AI phase for a game and return its job ID"""
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            job_id = new_owned_id()
+            self.jobs[job_id] = {
+                'game_id': game.game_id,
+                'future': self.pool.submit(_advance_phase_job, encode_snapshot(game.snapshot())),
+            }
+            game.ai_job_id = job_id
+            self.submitted += 1
+        return job_id
+    
+    def collect(self, job_id, game, timeout=0):
+        """
+        Wait up to `timeout` seconds for a job and apply its result to the game
         
-        return deck
+        Returns:
+            'done', 'pending', 'failed' or 'unknown'
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return 'unknown'
+        try:
+            snapshot, events = job['future'].result(timeout=timeout)
+        except FutureTimeoutError:
+            if timeout:
+                self.timeouts += 1
+            return 'pending'
+        except Exception as e:
+            with self.lock:
+                if self.jobs.pop(job_id, None) is not None:
+                    self.failed += 1
+                    game.ai_job_id = None
+                    game.log("⚠️ AI failed to move: %s", e, level=LOG_WARNING)
+            return 'failed'
+        
+        with self.lock:
+            if self.jobs.pop(job_id, None) is not None:
+                game.restore(decode_snapshot(snapshot))
+                game.ai_job_id = None
+                self.completed += 1
+                for event in events:
+                    game.event_bus.publish(event)
+        return 'done'
+    
+    def restart(self):
+        """Replace the worker processes (running jobs still finish on the old ones)"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+                self.pool = None
     
-    # Miasma 42-card starter deck (EXACT list with duplicates)
-    elif faction == 'Miasma':
-        deck = []
-        
-        # All cards with quantities (including duplicates to reach 42)
-        deck_list = {
-            'miasma_miasma_drifter': 3,
-            'miasma_miasma_husk': 3,
-            'miasma_miasma_stalker': 2,
-            'miasma_miasma_spore_swarm': 1,
-            'miasma_miasma_blightcrawler': 1,
-            'miasma_miasma_corruptor': 1,
-            'miasma_miasma_rot_titan': 1,
-            'miasma_the_living_miasma': 1,
-            'gnome_knoxx_the_engineer': 2,  # Added +1 for 42nd card
-            'undead_fog_walker_guide': 1,
-            'undead_ashara_the_bone_seer': 1,
-            'human_edda_the_thief': 1,
-            'human_scrap_gladiator': 1,
-            'human_kalzar_of_the_scribes': 1,
-            'human_beast_tamer_tarn': 1,
-            'miasma_encroaching_fog': 1,
-            'miasma_toxic_sludge': 1,
-            'miasma_petrify': 1,
-            'miasma_choking_spores': 1,
-            'generic_eviction_notice': 1,
-            'generic_emergency_repairs': 2,  # Duplicate (+1)
-            'generic_adrenal_rush': 1,
-            'generic_salvage_the_ruins': 2,  # Duplicate (+1)
-            'miasma_miasma_potion': 2,  # Duplicate (+1)
-            'miasma_rot_beneath_the_surface': 1,
-            'miasma_foglash': 1,
-            'generic_earthquake': 1,
-            'generic_counter_sigil': 1,
-            'generic_false_step': 1,
-            'miasma_lowlands_mist': 1,
-            'miasma_blight_pools': 2,  # Duplicate (+1)
-            'miasma_rotfall_expanse': 1,
+    def stats(self):
+        """Job counters for /api/metrics"""
+        return {
+            'workers': self.max_workers,
+            'pending': len(self.jobs),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'failed': self.failed,
         }
-        
-        for card_id, count in deck_list.items():
-            if card_id in CARDS_BY_ID:
-                for _ in range(count):
-                    deck.append(card_id)
+
+
+# AI_WORKERS=0 (default) keeps the AI inline in the request thread
+AI_EXECUTOR = AIExecutor(int(os.environ.get('AI_WORKERS', 0)))
+AI_JOB_TIMEOUT = float(os.environ.get('AI_JOB_TIMEOUT', 2.0))
+
+
+def resume_ai_job(game):
+    """
+    Pick up the AI job of a game loaded from storage (game lock held)
+    
+    A job this process still runs stays attached. One lost with an earlier
+    process starts again from the stored state, which is from before the
+    AI's move; without a worker pool the job is dropped so the next
+    advance_phase runs the AI inline.
+    """
+    if game.ai_job_id is None or game.ai_job_id in AI_EXECUTOR.jobs:
+        return
+    game.ai_job_id = None
+    if AI_EXECUTOR.enabled:
+        AI_EXECUTOR.submit(game)
+    games.mark_dirty(game.game_id, game)
+
+# Perspective for get_state() that sees neither hand
+SPECTATOR = 'spectator'
+SPECTATOR_STATS = {'renders': 0, 'served': 0}
+
+# Long-poll (/api/game/<id>/wait) timeouts in seconds
+LONG_POLL_TIMEOUT = 25.0
+LONG_POLL_MAX_TIMEOUT = 60.0  # shard_router.SHARD_TIMEOUT has to stay above this
+
+
+class Matchmaker:
+    """
+    Rating-bucketed queue that pairs waiting players into PvP games
+
+    Waiting tickets are filed in buckets of `bucket_size` rating points, so
+    finding an opponent only visits the buckets inside the ticket's search
+    window instead of the whole queue. The window starts at `base_window`
+    and widens by `widen_per_second` while the ticket waits (up to
+    `max_window`); a sweeper thread re-runs the search for tickets still
+    waiting so they pick up matches as their window grows. Tickets that
+    stop polling for `abandon_after` seconds are dropped from the queue.
+    """
+
+    def __init__(self, bucket_size=100, base_window=50, widen_per_second=10, max_window=1000,
+                 sweep_interval=1.0, abandon_after=30.0, ticket_ttl=300.0, latency_samples=1000):
+        self.bucket_size = bucket_size
+        self.base_window = base_window
+        self.widen_per_second = widen_per_second
+        self.max_window = max_window
+        self.sweep_interval = sweep_interval
+        self.abandon_after = abandon_after
+        self.ticket_ttl = ticket_ttl
+        self.buckets = {}  # bucket index -> OrderedDict of waiting tickets, oldest first
+        self.tickets = {}  # ticket_id -> ticket (waiting or matched)
+        self.lock = threading.Lock()
+        self.sweeper = None
+        self.wait_times = deque(maxlen=latency_samples)  # Seconds from join to match
+        self.matched = 0
+        self.left = 0
+        self.abandoned = 0
+
+    def bucket_of(self, rating):
+        return int(rating // self.bucket_size)
+
+    def window(self, ticket, now):
+        """Rating distance this ticket currently accepts"""
+        waited = now - ticket['joined_at']
+        return min(self.max_window, self.base_window + self.widen_per_second * waited)
+
+    def join(self, rating, faction):
+        """Queue a player and try to match them straight away; returns their ticket"""
+        self.start_sweeper()
+        now = time.time()
+        ticket = {
+            'ticket_id': new_owned_id(),
+            'rating': rating,
+            'faction': faction,
+            'joined_at': now,
+            'seen_at': now,
+            'status': 'waiting',
+            'game_id': None,
+            'player': None,
+        }
+        with self.lock:
+            self.tickets[ticket['ticket_id']] = ticket
+            self.buckets.setdefault(self.bucket_of(rating), OrderedDict())[ticket['ticket_id']] = ticket
+            self.try_match(ticket, now)
+        return ticket
+
+    def status(self, ticket_id):
+        """Current ticket (marking it as still polled), or None"""
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is not None:
+                ticket['seen_at'] = time.time()
+            return ticket
+
+    def leave(self, ticket_id):
+        """Take a waiting ticket out of the queue; False if it was unknown or already matched"""
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None or ticket['status'] != 'waiting':
+                return False
+            self.unqueue(ticket)
+            del self.tickets[ticket_id]
+            self.left += 1
+            return True
+
+    def unqueue(self, ticket):
+        bucket_index = self.bucket_of(ticket['rating'])
+        bucket = self.buckets[bucket_index]
+        del bucket[ticket['ticket_id']]
+        if not bucket:
+            del self.buckets[bucket_index]
+
+    def try_match(self, ticket, now):
+        """Pair a waiting ticket with the closest-rated opponent in its window (lock held)"""
+        window = self.window(ticket, now)
+        best = None
+        best_distance = None
+        for bucket_index in range(self.bucket_of(ticket['rating'] - window),
+                                  self.bucket_of(ticket['rating'] + window) + 1):
+            for other in self.buckets.get(bucket_index, {}).values():
+                if other is ticket:
+                    continue
+                distance = abs(other['rating'] - ticket['rating'])
+                # Buckets are oldest-first, so ties go to the longest wait
+                if distance <= window and (best is None or distance < best_distance):
+                    best = other
+                    best_distance = distance
+        if best is None:
+            return False
+
+        # The player who waited longer moves first
+        first, second = sorted((ticket, best), key=lambda t: t['joined_at'])
+        self.unqueue(first)
+        self.unqueue(second)
+        game, _ = GAME_POOL.take(first['faction'], second['faction'], pvp=True)
+        games[game.game_id] = game
+        # The sweeper thread has no request to flush the store for it
+        games.mark_dirty(game.game_id, game)
+        if hasattr(games, 'flush'):
+            games.flush()
+        if ACTION_LOG is not None:
+            ACTION_LOG.start(game)
+
+        for player, matched in enumerate((first, second)):
+            matched.update(status='matched', game_id=game.game_id, player=player,
+                           token=game.seat_tokens[player], matched_at=now)
+            self.wait_times.append(now - matched['joined_at'])
+        self.matched += 1
+        return True
+
+    def sweep(self):
+        """Re-run matching with widened windows and drop abandoned or stale tickets"""
+        now = time.time()
+        with self.lock:
+            for ticket in sorted(self.tickets.values(), key=lambda t: t['joined_at']):
+                if ticket['status'] != 'waiting':
+                    if now - ticket['matched_at'] > self.ticket_ttl:
+                        del self.tickets[ticket['ticket_id']]
+                elif now - ticket['seen_at'] > self.abandon_after:
+                    self.unqueue(ticket)
+                    del self.tickets[ticket['ticket_id']]
+                    self.abandoned += 1
+                else:
+                    self.try_match(ticket, now)
+
+    def start_sweeper(self):
+        """Start the background sweeper thread (once per process)"""
+        if self.sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.sweep()
+
+        self.sweeper = threading.Thread(target=run, name='matchmaker-sweeper', daemon=True)
+        self.sweeper.start()
+
+    def stats(self):
+        """Queue counters and wait-time percentiles for /api/metrics"""
+        with self.lock:
+            waits = sorted(self.wait_times)
+            waiting = sum(len(bucket) for bucket in self.buckets.values())
+            buckets = len(self.buckets)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return round(1000 * waits[min(len(waits) - 1, int(p / 100 * len(waits)))], 1)
+
+        return {
+            'waiting': waiting,
+            'buckets': buckets,
+            'matched': self.matched,
+            'left': self.left,
+            'abandoned': self.abandoned,
+            'wait_p50_ms': percentile(50),
+            'wait_p90_ms': percentile(90),
+            'wait_p99_ms': percentile(99),
+        }
+
+
+MATCHMAKER = Matchmaker(
+    bucket_size=int(os.environ.get('MATCHMAKING_BUCKET_SIZE', 100)),
+    base_window=int(os.environ.get('MATCHMAKING_BASE_WINDOW', 50)),
+    widen_per_second=float(os.environ.get('MATCHMAKING_WIDEN_PER_SECOND', 10)),
+    max_window=int(os.environ.get('MATCHMAKING_MAX_WINDOW', 1000)),
+)
+
+
+def create_starter_deck(faction):
+    """Create a 42-card starter deck for a faction (empty for unknown factions)"""
+    return list(CARD_TABLE.starter_deck(faction))
+
+
+STARTER_FACTIONS = tuple(STARTER_DECKLISTS)
+
+
+class GamePool:
+    """
+    Pre-built, pre-shuffled games waiting to be handed out
+
+    Building a game (two starter decks, shuffles, opening hands and the first
+    get_state() render) happens ahead of time on a background thread, so
+    starting one is a pop from a deque. Every (faction1, faction2, pvp)
+    pairing of the starter factions keeps up to `size` games ready; taking
+    one wakes the refiller. Anything else, or an empty pool, is built inline.
+    """
+
+    def __init__(self, size, factions):
+        self.size = size
+        self.pools = {
+            (faction1, faction2, pvp): deque()
+            for faction1 in factions for faction2 in factions for pvp in (False, True)
+        }
+        self.lock = threading.Lock()
+        self.wanted = threading.Event()
+        self.refiller = None
+        self.hits = 0
+        self.misses = 0
+        self.built = 0
+
+    @staticmethod
+    def build(key):
+        """A new game and its opening state from player 1's perspective"""
+        faction1, faction2, pvp = key
+        table = CARD_TABLE
+        game = GameState(
+            list(table.starter_deck(faction1)),
+            list(table.starter_deck(faction2)),
+            ai_players=() if pvp else (1,),
+            cards=table
+        )
+        return game, game.get_state(0)
+
+    def take(self, faction1, faction2, pvp=False):
+        """Hand out a ready game; returns (game, opening state for player 1)"""
+        key = (faction1, faction2, bool(pvp))
+        entry = None
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool and pool[0][0].cards is CARD_TABLE:
+                entry = pool.popleft()
+                self.hits += 1
             else:
-                print(f"Warning: Card not found: {card_id}")
-        
-        return deck
+                self.misses += 1
+        if pool is not None and self.size:
+            self.wanted.set()
+        return entry or self.build(key)
+
+    def drain(self):
+        """Drop every ready game (after a card reload) and build fresh ones"""
+        with self.lock:
+            for pool in self.pools.values():
+                pool.clear()
+        if self.size:
+            self.wanted.set()
+
+    def refill(self):
+        while True:
+            self.wanted.wait()
+            self.wanted.clear()
+            for key, pool in self.pools.items():
+                while len(pool) < self.size:
+                    entry = self.build(key)
+                    with self.lock:
+                        if entry[0].cards is not CARD_TABLE:
+                            break  # Cards reloaded mid-build; drain() asks again
+                        pool.append(entry)
+                        self.built += 1
+
+    def start(self):
+        """Start the refiller thread and fill every pool (once per process)"""
+        if self.refiller is not None or not self.size:
+            return
+        self.refiller = threading.Thread(target=self.refill, name='game-pool', daemon=True)
+        self.refiller.start()
+        self.wanted.set()
+
+    def stats(self):
+        """Pool counters for /api/metrics"""
+        return {
+            'size': self.size,
+            'ready': sum(len(pool) for pool in self.pools.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'built': self.built,
+        }
+
+
+# GAME_POOL_SIZE=0 builds every game inline
+GAME_POOL = GamePool(int(os.environ.get('GAME_POOL_SIZE', 2)), STARTER_FACTIONS)
+GAME_POOL.start()
+
+# Shared secret for /api/admin/* (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+CARD_RELOAD_LOCK = threading.Lock()
+CARD_RELOADS = {'reloads': 0, 'failed': 0, 'last_error': None}
+
+
+def reload_card_table():
+    """
+    Load card_database.json again and swap it in for new games
+    
+    The new file is validated and compiled into a complete CardTable before
+    the single assignment that publishes it, so requests see either the old
+    table or the new one. Games already running keep the table they started
+    with; ready-made games are rebuilt and the AI worker pool is restarted
+    so both pick up the new cards.
     
-    return []
+    Returns:
+        The CardTable now in use (raises ValueError if the file is invalid)
+    """
+    global CARD_TABLE
+    with CARD_RELOAD_LOCK:
+        try:
+            table = load_card_table(CARD_DATABASE_PATH)
+        except (OSError, ValueError) as e:
+            CARD_RELOADS['failed'] += 1
+            CARD_RELOADS['last_error'] = str(e)
+            raise ValueError(str(e))
+        if table.version == CARD_TABLE.version:
+            return CARD_TABLE
+        CARD_TABLES[table.version] = table
+        CARD_TABLE = table
+        CARD_RELOADS['reloads'] += 1
+        CARD_RELOADS['last_error'] = None
+    
+    print(f"Card database reloaded: version {table.version} ({len(table.ids)} cards)")
+    GAME_POOL.drain()
+    AI_EXECUTOR.restart()
+    return table
+
+
+def reload_cards_on_signal(signum, frame):
+    """SIGHUP handler: reload off the signal handler, in its own thread"""
+    def run():
+        try:
+            reload_card_table()
+        except ValueError as e:
+            print(f"Card database reload failed: {e}")
+    threading.Thread(target=run, name='card-reload', daemon=True).start()
+
+
+# `kill -HUP <pid>` reloads the cards (POSIX only, and only from the main thread)
+if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, reload_cards_on_signal)
+
+
+# ============================================================
+# DECK BUILDER
+# ============================================================
+
+DECK_SIZE = 42
+DECK_MAX_COPIES = 3
+DECK_MAX_MYTHIC_COPIES = 1
+OPENING_HAND_SIZE = 5
+DRAW_STATS_TURNS = 10
+
+
+@lru_cache(maxsize=4096)
+def draw_probability(deck_size, copies, seen):
+    """
+    Chance of at least one of `copies` cards among the top `seen` of a shuffled deck
+
+    Exact hypergeometric: 1 - C(N-K, n) / C(N, n). Memoized, since a deck
+    editor asks for the same handful of (N, K, n) over and over.
+    """
+    seen = min(seen, deck_size)
+    if copies <= 0 or seen <= 0:
+        return 0.0
+    return 1.0 - comb(deck_size - copies, seen) / comb(deck_size, seen)
+
+
+def encode_deck_code(faction, counts):
+    """Shareable deck code: the decklist itself, compressed (no server-side storage)"""
+    payload = json.dumps([faction, sorted(counts.items())], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(zlib.compress(payload, 9)).decode('ascii').rstrip('=')
+
+
+def decode_deck_code(code):
+    """Inverse of encode_deck_code(); returns (faction, counts) or raises ValueError"""
+    try:
+        padded = code + '=' * (-len(code) % 4)
+        faction, items = json.loads(zlib.decompress(base64.urlsafe_b64decode(padded)))
+        cards = {str(card_id): count for card_id, count in items}
+    except (ValueError, TypeError, zlib.error):
+        raise ValueError('Invalid deck code')
+    # Same count checks as a posted decklist (a crafted code can't hide negative counts)
+    return faction, parse_decklist(cards)
+
+
+def parse_decklist(cards):
+    """Card counts from {card_id: count} or a list of card IDs (raises ValueError)"""
+    if isinstance(cards, dict):
+        counts = {}
+        for card_id, count in cards.items():
+            if not isinstance(count, int) or count < 0:
+                raise ValueError(f'Invalid count for {card_id}')
+            if count:
+                counts[card_id] = count
+        return counts
+    if isinstance(cards, list) and all(isinstance(card_id, str) for card_id in cards):
+        counts = {}
+        for card_id in cards:
+            counts[card_id] = counts.get(card_id, 0) + 1
+        return counts
+    raise ValueError('cards must be {card_id: count} or a list of card IDs')
+
+
+def validate_deck(faction, counts, table):
+    """
+    Check a decklist against the deck rules
+
+    A deck has exactly DECK_SIZE cards, at most DECK_MAX_COPIES of any card
+    (DECK_MAX_MYTHIC_COPIES for Mythics), and may not use cards from
+    another playable faction. Generic cards and the unaligned races
+    (Human, Undead, ...) go in any deck.
+
+    Returns:
+        List of error strings (empty when the deck is legal)
+    """
+    errors = []
+    playable = [name for name in table.database.get('factions', []) if name != 'Generic']
+    if faction not in playable:
+        errors.append(f"Unknown faction: {faction} (choose from {', '.join(playable)})")
+
+    size = sum(counts.values())
+    if size != DECK_SIZE:
+        errors.append(f'Deck has {size} cards (must be exactly {DECK_SIZE})')
+
+    for card_id, count in counts.items():
+        card = table.by_id.get(card_id)
+        if card is None:
+            errors.append(f'Unknown card: {card_id}')
+            continue
+        mythic = card['type'].endswith('MYTHIC') or card.get('rarity') == 'Mythic'
+        limit = DECK_MAX_MYTHIC_COPIES if mythic else DECK_MAX_COPIES
+        if count > limit:
+            errors.append(f"{card['name']}: {count} copies (max {limit})")
+        card_faction = card.get('faction')
+        if card_faction in playable and card_faction != faction:
+            errors.append(f"{card['name']} is a {card_faction} card")
+    return errors
+
+
+def deck_stats(counts, table, track=(), going_second=False):
+    """
+    Cost curve and exact draw odds for a decklist
+
+    Odds are for seeing at least one copy in the opening hand and by each
+    of your first DRAW_STATS_TURNS turns. The player going first doesn't
+    draw on their first turn. `track` picks the cards to report; every
+    cost bucket of the curve is always reported.
+    """
+    size = sum(counts.values())
+    # Cards seen by the start of each of your turns
+    seen_by_turn = [OPENING_HAND_SIZE + turn - (0 if going_second else 1) for turn in range(1, DRAW_STATS_TURNS + 1)]
+
+    def odds(copies):
+        return {
+            'count': copies,
+            'opening_hand': round(draw_probability(size, copies, OPENING_HAND_SIZE), 4),
+            'by_turn': [round(draw_probability(size, copies, seen), 4) for seen in seen_by_turn],
+        }
+
+    curve = {}
+    types = {}
+    total_cost = 0
+    for card_id, count in counts.items():
+        i = table.index.get(card_id)
+        if i is None:
+            continue
+        cost = table.cost[i]
+        curve[cost] = curve.get(cost, 0) + count
+        card_type = table.types[table.type_code[i]]
+        types[card_type] = types.get(card_type, 0) + count
+        total_cost += cost * count
+
+    return {
+        'size': size,
+        'average_cost': round(total_cost / size, 2) if size else 0.0,
+        'types': types,
+        'cost_curve': {str(cost): odds(curve[cost]) for cost in sorted(curve)},
+        'cards': {card_id: odds(counts.get(card_id, 0)) for card_id in track if card_id in table.index},
+    }
+
+
+def deck_from_request(value, table):
+    """
+    Card ID list for a custom deck given as a deck code or {'faction', 'cards'}
+
+    Raises:
+        ValueError: with the first rule the deck breaks
+    """
+    if isinstance(value, str):
+        faction, counts = decode_deck_code(value)
+    elif isinstance(value, dict):
+        faction, counts = value.get('faction', ''), parse_decklist(value.get('cards'))
+    else:
+        raise ValueError('A deck is a deck code or {"faction": ..., "cards": ...}')
+    faction = str(faction).capitalize()
+    errors = validate_deck(faction, counts, table)
+    if errors:
+        raise ValueError(errors[0])
+    return [card_id for card_id, count in counts.items() for _ in range(count)]
 
 @app.route('/')
 def index():
@@ -2220,16 +5022,31 @@ def new_game():
     faction1 = data.get('faction1', 'Skyforge')
     faction2 = data.get('faction2', 'Miasma')
     
-    deck1 = create_starter_deck(faction1)
-    deck2 = create_starter_deck(faction2)
-    
-    game = GameState(deck1, deck2)
+    # Custom decks (deck codes from /api/decks) skip the ready-made pool
+    if data.get('deck1') or data.get('deck2'):
+        table = CARD_TABLE
+        try:
+            deck1 = deck_from_request(data['deck1'], table) if data.get('deck1') else list(table.starter_deck(faction1))
+            deck2 = deck_from_request(data['deck2'], table) if data.get('deck2') else list(table.starter_deck(faction2))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        game = GameState(deck1, deck2, ai_players=() if data.get('pvp') else (1,), cards=table)
+        state = game.get_state(0)
+    else:
+        # pvp: both seats are human (e.g. hotseat); otherwise the AI plays player 2
+        game, state = GAME_POOL.take(faction1, faction2, pvp=data.get('pvp'))
     games[game.game_id] = game
+    if ACTION_LOG is not None:
+        ACTION_LOG.start(game)
     
-    return jsonify({
+    response = {
         'game_id': game.game_id,
-        'state': game.get_state(0)
-    })
+        'state': state
+    }
+    if game.seat_tokens:
+        # Hotseat: one client plays both seats, so it gets both tokens
+        response['tokens'] = game.seat_tokens
+    return jsonify(response)
 
 @app.route('/api/game/new', methods=['POST'])
 def new_game_with_factions():
@@ -2238,11 +5055,10 @@ def new_game_with_factions():
     player_faction = data.get('player_faction', 'skyforge').capitalize()
     opponent_faction = data.get('opponent_faction', 'miasma').capitalize()
     
-    deck1 = create_starter_deck(player_faction)
-    deck2 = create_starter_deck(opponent_faction)
-    
-    game = GameState(deck1, deck2)
+    game, _ = GAME_POOL.take(player_faction, opponent_faction)
     games[game.game_id] = game
+    if ACTION_LOG is not None:
+        ACTION_LOG.start(game)
     
     return jsonify({
         'game_id': game.game_id
@@ -2255,10 +5071,136 @@ def get_game_state(game_id):
     if not game:
         return jsonify({'error': 'Game not found'}), 404
     
-    player = int(request.args.get('player', 0))
+    try:
+        player = perspective_arg(request.args.get('player', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    error = seat_error(game, player)
+    if error:
+        return error
     return jsonify(game.get_state(player))
 
+def long_poll_args(default_since):
+    """
+    Parse the ?since= and ?timeout= arguments of a long-poll
+    
+    Returns:
+        (since, timeout) with timeout clamped to [0, LONG_POLL_MAX_TIMEOUT]
+    
+    Raises:
+        ValueError: if either isn't a number
+    """
+    try:
+        since = int(request.args.get('since', default_since))
+    except ValueError:
+        raise ValueError('since must be an integer') from None
+    try:
+        timeout = float(request.args.get('timeout', LONG_POLL_TIMEOUT))
+    except ValueError:
+        raise ValueError('timeout must be a number') from None
+    if isnan(timeout):
+        raise ValueError('timeout must be a number')
+    return since, max(0.0, min(timeout, LONG_POLL_MAX_TIMEOUT))
+
+@app.route('/api/game/<game_id>/wait', methods=['GET'])
+def wait_for_change(game_id):
+    """Long-poll: block until the game's version passes `since` or the timeout hits"""
+    game = games.get(game_id)
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+    
+    try:
+        since, timeout = long_poll_args(0)
+        player = perspective_arg(request.args.get('player', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    error = seat_error(game, player)
+    if error:
+        return error
+    
+    condition = games.condition_for(game_id)
+    with condition:
+        if not condition.wait_for(lambda: game.version > since, timeout):
+            return jsonify({'changed': False, 'version': game.version})
+        return jsonify({'changed': True, 'version': game.version, 'state': game.get_state(player)})
+
+@app.route('/api/game/<game_id>/spectate', methods=['GET'])
+def spectate(game_id):
+    """
+    Spectator feed: long-poll like /wait, but every viewer shares one render
+    
+    Returns the spectator state as soon as the game's version passes `since`
+    (immediately when `since` is behind), or {changed: false} on timeout.
+    """
+    game = games.get(game_id)
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
+    
+    try:
+        since, timeout = long_poll_args(-1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    condition = games.condition_for(game_id)
+    with condition:
+        if not condition.wait_for(lambda: game.version > since, timeout):
+            return jsonify({'changed': False, 'version': game.version})
+        payload = game.spectator_payload()
+    return app.response_class(payload, mimetype='application/json')
+
+def seat_token_ok(game, seat, token):
+    """True when `token` is `seat`'s secret, or the game has no seat tokens"""
+    tokens = getattr(game, 'seat_tokens', None)
+    if not tokens:
+        return True
+    if seat not in (0, 1) or not isinstance(token, str):
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), tokens[seat].encode('utf-8'))
+
+def seat_error(game, player):
+    """
+    403 reply when a request names a PvP seat without that seat's token, else None
+    
+    The token comes from 'token' in a POST body or ?token= otherwise, and is
+    handed out with the game (new_game, or the matched matchmaking ticket).
+    Spectators need none; replays from the action log aren't checked.
+    """
+    if player == SPECTATOR or request.environ.get('sanctum.replay'):
+        return None
+    if request.method == 'POST':
+        token = (request.get_json(silent=True) or {}).get('token')
+    else:
+        token = request.args.get('token')
+    try:
+        seat = int(player)
+    except (TypeError, ValueError):
+        seat = None
+    if not seat_token_ok(game, seat, token):
+        return jsonify({'error': 'Invalid seat token'}), 403
+    return None
+
+def pvp_turn_error(game, player, responder=None):
+    """
+    403 reply when a PvP request isn't from the seat it names, or that seat acts out of turn, else None
+    
+    In PvP only the active player may act, except for `responder`: the
+    seat a view lets answer out of turn (a trap's owner, a player owing
+    Rotfall destroys). Games against the AI are not checked.
+    """
+    if game.ai_players:
+        return None
+    error = seat_error(game, player)
+    if error:
+        return error
+    allowed = game.active_player if responder is None else responder
+    if int(player) != allowed:
+        return jsonify({'error': 'Not your turn'}), 403
+    return None
+
 @app.route('/api/game/<game_id>/play_card', methods=['POST'])
+@game_action
 def play_card(game_id):
     """Play a card from hand"""
     game = games.get(game_id)
@@ -2269,6 +5211,10 @@ def play_card(game_id):
     player = data.get('player', 0)
     card_id = data.get('card_id')
     
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
+    
     result = game.play_card(player, card_id)
     
     return jsonify({
@@ -2277,6 +5223,7 @@ def play_card(game_id):
     })
 
 @app.route('/api/game/<game_id>/attack', methods=['POST'])
+@game_action
 def attack(game_id):
     """Declare an attack"""
     game = games.get(game_id)
@@ -2288,6 +5235,10 @@ def attack(game_id):
     attacker_index = data.get('attacker_index')
     defender_index = data.get('defender_index')
     
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
+    
     result = game.attack(player, attacker_index, defender_index)
     
     return jsonify({
@@ -2300,6 +5251,7 @@ def attack(game_id):
 # ============================================================
 
 @app.route('/api/game/<game_id>/activate_trap', methods=['POST'])
+@game_action
 def activate_trap(game_id):
     """Activate a trap"""
     game = games.get(game_id)
@@ -2311,6 +5263,11 @@ def activate_trap(game_id):
     trap_slot = data.get('trap_slot')
     activate = data.get('activate', False)  # True = YES, False = NO
     
+    # Traps trigger on the opponent's actions, so their owner answers out of turn
+    error = pvp_turn_error(game, player, responder=1 - game.active_player)
+    if error:
+        return error
+    
     # Get trap from player's trap slots
     trap_id = game.players[player]['traps'][trap_slot]
     if not trap_id:
@@ -2318,139 +5275,31 @@ def activate_trap(game_id):
         # Clear pending trigger and return error
         if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
             if game.pending_trap_trigger.get('trap_slot') == trap_slot:
-                game.log(f"⚠️ Trap already removed - clearing pending trigger")
+                game.log("⚠️ Trap already removed - clearing pending trigger", level=LOG_DEBUG)
                 game.pending_trap_trigger = None
         
         return jsonify({
             'error': 'No trap in that slot',
             'trap_already_removed': True,
-            'state': game.get_state(0)
+            'state': game.get_state(game.viewer_for(player))
         }), 404
     
-    trap = CARDS_BY_ID[trap_id]
+    trap = game.cards.by_id[trap_id]
     
     if activate:
-        # Player chose YES - activate the trap
-        
-        # Check energy cost
+        # Player chose YES - check energy cost
         if game.players[player]['energy'] < trap['cost']:
             return jsonify({'error': 'Not enough energy'}), 400
-        
-        # Pay energy cost
-        game.players[player]['energy'] -= trap['cost']
-        game.log(f"Player {player + 1} activates {trap['name']} (Cost: {trap['cost']})")
-        
-        # Remove trap from slot
-        game.players[player]['traps'][trap_slot] = None
-        
-        # Move trap to discard
-        game.players[player]['discard'].append(trap_id)
-        
-        # PHASE 3D BATCH 3: Check for Counter-Sigil before trap resolves
-        opponent_idx = 1 - player
-        counter_sigil_traps = game.check_traps(
-            opponent_idx,
-            'trap_activated',
-            {
-                'enemy_trap_player': player,
-                'enemy_trap_name': trap['name'],
-                'enemy_trap_id': trap_id
-            }
-        )
-        
-        if counter_sigil_traps:
-            # Return Counter-Sigil trigger (pause before trap resolves)
-            return jsonify({
-                'counter_sigil_trigger': True,
-                'trap': counter_sigil_traps[0]['trap'],
-                'trap_slot': counter_sigil_traps[0]['slot'],
-                'trigger_message': counter_sigil_traps[0]['trigger_message'],
-                'trigger_data': {
-                    'enemy_trap_player': player,
-                    'enemy_trap_name': trap['name'],
-                    'enemy_trap_id': trap_id
-                },
-                'trap_owner': opponent_idx,
-                'original_trap_activation': {
-                    'trap': trap,
-                    'trap_id': trap_id,
-                    'player': player,
-                    'trap_slot': trap_slot,
-                    'pending_trigger_data': data.get('trigger_data')
-                },
-                'state': game.get_state(0)
-            })
-        
-        # PHASE 3D: Resolve trap effect (if not negated by Counter-Sigil)
-        trap_effect_result = game.resolve_trap_effect(trap_id, player, data.get('trigger_data'))
-        
-        # PHASE 3D BATCH 3: Handle Flute of Slumber - ready all units except the targeted one
-        if trap_id == 'generic_flute_of_slumber' and hasattr(game, 'pending_trap_trigger'):
-            trigger_data = game.pending_trap_trigger.get('trigger_data', {})
-            readied_player = trigger_data.get('readied_player')
-            selected_target_index = data.get('trigger_data', {}).get('selected_target_index')
-            available_targets = trigger_data.get('available_targets', [])
-            
-            if readied_player is not None and selected_target_index is not None:
-                # Ready all units EXCEPT the selected target
-                for target in available_targets:
-                    if target['index'] != selected_target_index:
-                        game.players[readied_player]['battlefield_exhausted'][target['index']] = False
-                        game.log(f"{target['name']} becomes ready")
-                # The selected target stays exhausted (Flute effect)
-                selected_target_name = next((t['name'] for t in available_targets if t['index'] == selected_target_index), 'Unit')
-                game.log(f"{selected_target_name} remains exhausted (Flute of Slumber)")
-            
-            # Clear pending trigger
-            game.pending_trap_trigger = None
-        
-        # CRITICAL: UNIVERSAL clearing of pending_trap_trigger
-        # Always clear after ANY trap activation to prevent infinite loops
-        if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
-            game.log(f"🧹 Clearing pending_trap_trigger after trap activation (UNIVERSAL)")
-            game.pending_trap_trigger = None
-        
-        return jsonify({
-            'success': True,
-            'message': f"Activated {trap['name']}",
-            'trap_activated': True,
-            'trap_id': trap_id,
-            'effect_result': trap_effect_result,
-            'state': game.get_state(0)  # ALWAYS return from human's perspective
-        })
+        result = game.activate_trap(player, trap_slot, data.get('trigger_data'))
     else:
-        # Player chose NO - don't activate
-        game.log(f"Player {player + 1} did not activate {trap['name']}")
-        
-        # PHASE 3D BATCH 3: Handle Flute of Slumber - ready ALL units if not activated
-        if trap_id == 'generic_flute_of_slumber' and hasattr(game, 'pending_trap_trigger'):
-            trigger_data = game.pending_trap_trigger.get('trigger_data', {})
-            readied_player = trigger_data.get('readied_player')
-            available_targets = trigger_data.get('available_targets', [])
-            
-            if readied_player is not None:
-                # Ready ALL units
-                for target in available_targets:
-                    game.players[readied_player]['battlefield_exhausted'][target['index']] = False
-                    game.log(f"{target['name']} becomes ready")
-            
-            # Clear pending trigger
-            game.pending_trap_trigger = None
-        
-        # CRITICAL: UNIVERSAL clearing of pending_trap_trigger
-        # Always clear after declining ANY trap to prevent infinite loops
-        if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
-            game.log(f"🧹 Clearing pending_trap_trigger after declining trap (UNIVERSAL)")
-            game.pending_trap_trigger = None
-        
-        return jsonify({
-            'success': True,
-            'message': f"Did not activate {trap['name']}",
-            'trap_activated': False,
-            'state': game.get_state(0)  # ALWAYS return from human's perspective
-        })
+        result = game.decline_trap(player, trap_slot)
+    
+    # ALWAYS return from a human's perspective
+    result['state'] = game.get_state(game.viewer_for(player))
+    return jsonify(result)
 
 @app.route('/api/game/<game_id>/activate_counter_sigil', methods=['POST'])
+@game_action
 def activate_counter_sigil(game_id):
     """Activate Counter-Sigil trap"""
     game = games.get(game_id)
@@ -2463,57 +5312,17 @@ def activate_counter_sigil(game_id):
     activate = data.get('activate', False)
     original_trap_activation = data.get('original_trap_activation', {})
     
-    trap_id = game.players[player]['traps'][trap_slot]
-    trap = CARDS_BY_ID[trap_id]
+    # Counter-Sigil answers the opponent's trap, which answered the active player
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
     
-    if activate:
-        # Pay cost
-        game.players[player]['energy'] -= trap['cost']
-        game.log(f"Player {player + 1} activates Counter-Sigil!")
-        
-        # Remove Counter-Sigil
-        game.players[player]['traps'][trap_slot] = None
-        game.players[player]['discard'].append(trap_id)
-        
-        # Resolve Counter-Sigil (negates the original trap)
-        effect_result = game.resolve_trap_effect(trap_id, player, data.get('trigger_data'))
-        
-        # CRITICAL: Clear pending trap trigger since the trap was negated!
-        if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
-            game.log(f"🚫 Clearing pending trap trigger (negated by Counter-Sigil)")
-            game.pending_trap_trigger = None
-        
-        return jsonify({
-            'success': True,
-            'counter_sigil_activated': True,
-            'effect_result': effect_result,
-            'state': game.get_state(0)
-        })
-    else:
-        # Don't activate - let original trap resolve
-        game.log(f"Player {player + 1} did not activate Counter-Sigil")
-        
-        # Resolve original trap
-        orig_trap_id = original_trap_activation.get('trap_id')
-        orig_player = original_trap_activation.get('player')
-        orig_trigger_data = original_trap_activation.get('pending_trigger_data')
-        
-        effect_result = game.resolve_trap_effect(orig_trap_id, orig_player, orig_trigger_data)
-        
-        # Clear pending trap trigger (original trap has now resolved)
-        if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
-            game.log(f"✅ Clearing pending trap trigger (original trap resolved)")
-            game.pending_trap_trigger = None
-        
-        return jsonify({
-            'success': True,
-            'counter_sigil_activated': False,
-            'original_trap_resolved': True,
-            'effect_result': effect_result,
-            'state': game.get_state(0)
-        })
+    result = game.answer_counter_sigil(player, trap_slot, activate, original_trap_activation, data.get('trigger_data'))
+    result['state'] = game.get_state(game.viewer_for(player))
+    return jsonify(result)
 
 @app.route('/api/game/<game_id>/pierce', methods=['POST'])
+@game_action
 def apply_pierce(game_id):
     """Apply Pierce overflow damage to a target"""
     game = games.get(game_id)
@@ -2524,16 +5333,20 @@ def apply_pierce(game_id):
     defender_player = data.get('defender_player')
     pierce_target_index = data.get('pierce_target_index')
     pierce_damage = data.get('pierce_damage')
+    player = int(data.get('player', 0))
     
-    result = game.apply_pierce(pierce_target_index, pierce_damage, defender_player)
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
     
-    player = int(data.get('player', 0))
+    result = game.apply_pierce(pierce_target_index, pierce_damage, defender_player)
     return jsonify({
         'result': result,
         'state': game.get_state(player)
     })
 
 @app.route('/api/game/<game_id>/target_technique', methods=['POST'])
+@game_action
 def target_technique(game_id):
     """Apply a targeted technique effect"""
     game = games.get(game_id)
@@ -2546,6 +5359,10 @@ def target_technique(game_id):
     target_player = int(data.get('target_player'))
     target_index = int(data.get('target_index'))
     
+    error = pvp_turn_error(game, player_idx)
+    if error:
+        return error
+    
     result = game.apply_targeted_technique(player_idx, card_id, target_player, target_index)
     
     return jsonify({
@@ -2553,64 +5370,108 @@ def target_technique(game_id):
         'state': game.get_state(player_idx)
     })
 
-@app.route('/api/game/<game_id>/advance_phase', methods=['POST'])
-def advance_phase(game_id):
-    """Advance to next phase"""
-    game = games.get(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
-    
-    game.advance_phase()
-    
+def perspective_arg(value):
+    """Parse a ?player= argument: 0, 1 or 'spectator'"""
+    if value == SPECTATOR:
+        return SPECTATOR
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('player must be 0, 1 or spectator') from None
+
+def advance_phase_response(game, player):
+    """Build the advance_phase reply: a pending trap trigger or the new state"""
     # Check for pending trap triggers (Flute of Slumber, Counter-Sigil, etc.)
     if hasattr(game, 'pending_trap_trigger') and game.pending_trap_trigger:
         trap_trigger_data = game.pending_trap_trigger
         # Don't clear it yet - will be cleared when trap is resolved
-        player = int(request.json.get('player', 0))
         
         # Add state and return trap trigger
         trap_trigger_data['state'] = game.get_state(player)
         return jsonify(trap_trigger_data)
     
-    player = int(request.json.get('player', 0))
     return jsonify(game.get_state(player))
 
-@app.route('/api/game/<game_id>/discard', methods=['POST'])
-def discard_card(game_id):
-    """Discard a card from hand (hand limit)"""
+@app.route('/api/game/<game_id>/advance_phase', methods=['POST'])
+@game_action
+def advance_phase(game_id):
+    """Advance to next phase"""
     game = games.get(game_id)
     if not game:
         return jsonify({'error': 'Game not found'}), 404
     
-    data = request.json
-    card_index = data.get('card_index')
-    
-    current_player = game.players[game.active_player]
+    data = request.json or {}
+    player = int(data.get('player', 0))
     
-    if current_player.get('must_discard', 0) == 0:
-        return jsonify({'error': 'No need to discard'})
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
     
-    if card_index < 0 or card_index >= len(current_player['hand']):
-        return jsonify({'error': 'Invalid card index'})
+    # AI deploy/combat phases run in the worker pool when one is configured
+    # (action log replays run them inline, see ActionLog)
+    if (AI_EXECUTOR.enabled and not request.environ.get('sanctum.replay')
+            and game.active_player in game.ai_players and game.phase in ('deploy', 'combat')):
+        job_id = AI_EXECUTOR.submit(game)
+        timeout = AI_JOB_TIMEOUT if data.get('wait', True) else 0
+        if AI_EXECUTOR.collect(job_id, game, timeout) == 'pending':
+            return jsonify({'ai_job': job_id, 'status': 'pending'}), 202
+        # Tell game_action to snapshot the result after logging this action
+        request.environ['sanctum.ai_result'] = True
+        return advance_phase_response(game, player)
     
-    # Discard the card
-    discarded_card = current_player['hand'].pop(card_index)
-    current_player['discard'].append(discarded_card)
-    current_player['must_discard'] -= 1
+    game.advance_phase()
+    return advance_phase_response(game, player)
+
+@app.route('/api/ai_jobs/<job_id>', methods=['GET'])
+def get_ai_job(job_id):
+    """Poll an AI phase started by advance_phase"""
+    job = AI_EXECUTOR.jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
     
-    game.log(f"Discarded {CARDS_BY_ID[discarded_card]['name']} (hand limit: {len(current_player['hand'])}/7)")
+    game = games.get(job['game_id'])
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
     
-    # Check if still need to discard more
-    if len(current_player['hand']) > 7:
-        game.log(f"⚠️ Still {len(current_player['hand']) - 7} more to discard")
-    else:
-        game.log(f"✅ Hand at 7 cards. You may end turn now.")
-        current_player['must_discard'] = 0
+    player = int(request.args.get('player', 0))
+    with games.locked(game.game_id):
+        status = AI_EXECUTOR.collect(job_id, game)
+        if status == 'pending':
+            return jsonify({'ai_job': job_id, 'status': 'pending'}), 202
+        if ACTION_LOG is not None and status in ('done', 'failed'):
+            events = ACTION_LOG.take_events(game.game_id)
+            ACTION_LOG.append(game, 'ai_result', {'job_id': job_id, 'status': status}, None, events)
+            ACTION_LOG.checkpoint(game)
+        games.mark_dirty(game.game_id, game)
+        if hasattr(games, 'flush'):
+            games.flush()
+        notify_game_changed(game.game_id)
+        return advance_phase_response(game, player)
+
+@app.route('/api/game/<game_id>/discard', methods=['POST'])
+@game_action
+def discard_card(game_id):
+    """Discard a card from hand (hand limit)"""
+    game = games.get(game_id)
+    if not game:
+        return jsonify({'error': 'Game not found'}), 404
     
+    data = request.json
     player = int(data.get('player', 0))
+    
+    # Only the active player is ever over the hand limit
+    error = pvp_turn_error(game, player)
+    if error:
+        return error
+    
+    result = game.discard_from_hand(data.get('card_index'))
+    if 'error' in result:
+        return jsonify(result)
+    
     return jsonify(game.get_state(player))
 
 @app.route('/api/game/<game_id>/rotfall_destroy', methods=['POST'])
+@game_action
 def rotfall_destroy(game_id):
     """Destroy a unit due to Rotfall Expanse (player chooses)"""
     game = games.get(game_id)
@@ -2618,43 +5479,182 @@ def rotfall_destroy(game_id):
         return jsonify({'error': 'Game not found'}), 404
     
     data = request.json
-    unit_index = data.get('unit_index')
     player_idx = int(data.get('player', 0))
     
-    current_player = game.players[player_idx]
+    # Rotfall can leave both players owing destroys, each answered by its owner
+    owes = game.players[player_idx].get('rotfall_must_destroy', 0)
+    error = pvp_turn_error(game, player_idx, responder=player_idx if owes else None)
+    if error:
+        return error
     
-    if current_player.get('rotfall_must_destroy', 0) == 0:
-        return jsonify({'error': 'No Rotfall destruction required'})
+    result = game.rotfall_destroy(player_idx, data.get('unit_index'))
+    if 'error' in result:
+        return jsonify(result)
     
-    if unit_index is None or unit_index < 0 or unit_index >= 5:
-        return jsonify({'error': 'Invalid unit index'})
+    return jsonify(game.get_state(player_idx))
+
+@app.route('/api/decks/validate', methods=['POST'])
+def check_deck():
+    """
+    Live deck-builder feedback: rule errors, cost curve and draw odds
     
-    if current_player['battlefield'][unit_index] is None:
-        return jsonify({'error': 'No unit in that slot'})
+    Body: {"faction": "Skyforge", "cards": {card_id: count} or [card_id, ...],
+    "track": [card_id, ...], "going_second": false}. Stats are returned
+    even for an illegal deck; deck_code only once it is legal.
+    """
+    data = request.json or {}
+    faction = str(data.get('faction', '')).capitalize()
+    try:
+        counts = parse_decklist(data.get('cards', {}))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    track = data.get('track') or list(counts)
+    if not isinstance(track, list) or not all(isinstance(card_id, str) for card_id in track):
+        return jsonify({'error': 'track must be a list of card IDs'}), 400
     
-    # Destroy the chosen unit
-    destroyed_id = current_player['battlefield'][unit_index]
-    destroyed_name = CARDS_BY_ID[destroyed_id]['name']
-    current_player['battlefield'][unit_index] = None
-    current_player['battlefield_exhausted'][unit_index] = False
-    current_player['battlefield_wither'][unit_index] = 0
-    current_player['battlefield_corrupt'][unit_index] = False
-    current_player['discard'].append(destroyed_id)
-    current_player['rotfall_must_destroy'] -= 1
+    table = CARD_TABLE
+    errors = validate_deck(faction, counts, table)
+    response = {
+        'valid': not errors,
+        'errors': errors,
+        'stats': deck_stats(counts, table, track, going_second=bool(data.get('going_second'))),
+    }
+    if not errors:
+        response['deck_code'] = encode_deck_code(faction, counts)
+    return jsonify(response)
+
+@app.route('/api/decks', methods=['POST'])
+def submit_deck():
+    """Submit a finished deck; returns the deck code to start games with"""
+    data = request.json or {}
+    faction = str(data.get('faction', '')).capitalize()
+    try:
+        counts = parse_decklist(data.get('cards', {}))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    game.log(f"🌑 Rotfall Expanse: {destroyed_name} destroyed by Rotfall!")
+    errors = validate_deck(faction, counts, CARD_TABLE)
+    if errors:
+        return jsonify({'error': 'Deck is not legal', 'errors': errors}), 400
+    return jsonify({'success': True, 'deck_code': encode_deck_code(faction, counts), 'size': sum(counts.values())})
+
+@app.route('/api/decks/<deck_code>', methods=['GET'])
+def get_deck(deck_code):
+    """Decklist, legality and stats for a deck code"""
+    try:
+        faction, counts = decode_deck_code(deck_code)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    table = CARD_TABLE
+    errors = validate_deck(faction, counts, table)
+    return jsonify({
+        'faction': faction,
+        'cards': counts,
+        'valid': not errors,
+        'errors': errors,
+        'stats': deck_stats(counts, table, list(counts), going_second=request.args.get('going_second') == '1'),
+    })
+
+@app.route('/api/matchmaking/join', methods=['POST'])
+def join_matchmaking():
+    """Queue for a PvP game; poll the returned ticket until it is matched"""
+    data = request.json or {}
+    faction = data.get('faction', 'skyforge').capitalize()
+    try:
+        rating = float(data.get('rating', 1000))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid rating'}), 400
+    if not create_starter_deck(faction):
+        return jsonify({'error': f'Unknown faction: {faction}'}), 400
     
-    if current_player['rotfall_must_destroy'] > 0:
-        game.log(f"🌑 Must destroy {current_player['rotfall_must_destroy']} more Unit(s)")
-    else:
-        game.log(f"✅ Rotfall satisfied. You may end turn now.")
+    ticket = MATCHMAKER.join(rating, faction)
+    return jsonify(matchmaking_ticket_response(ticket))
+
+@app.route('/api/matchmaking/<ticket_id>', methods=['GET'])
+def get_matchmaking_ticket(ticket_id):
+    """Matchmaking status: waiting, or matched with a game_id and seat"""
+    ticket = MATCHMAKER.status(ticket_id)
+    if ticket is None:
+        return jsonify({'error': 'Ticket not found'}), 404
+    return jsonify(matchmaking_ticket_response(ticket))
+
+@app.route('/api/matchmaking/<ticket_id>', methods=['DELETE'])
+def leave_matchmaking(ticket_id):
+    """Leave the queue before being matched"""
+    if not MATCHMAKER.leave(ticket_id):
+        return jsonify({'error': 'Ticket not waiting'}), 404
+    return jsonify({'success': True})
+
+def matchmaking_ticket_response(ticket):
+    response = {
+        'ticket_id': ticket['ticket_id'],
+        'status': ticket['status'],
+        'waited': round(ticket.get('matched_at', time.time()) - ticket['joined_at'], 3),
+    }
+    if ticket['status'] == 'matched':
+        response['game_id'] = ticket['game_id']
+        response['player'] = ticket['player']
+        response['token'] = ticket['token']
+    return response
+
+@app.route('/api/admin/reload_cards', methods=['POST'])
+def admin_reload_cards():
+    """Reload card_database.json without a restart (needs ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled (set ADMIN_TOKEN)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'error': 'Invalid admin token'}), 403
     
-    return jsonify(game.get_state(player_idx))
+    previous = CARD_TABLE.version
+    try:
+        table = reload_card_table()
+    except ValueError as e:
+        return jsonify({'error': f'Card database rejected: {e}', 'version': previous}), 400
+    return jsonify({
+        'success': True,
+        'version': table.version,
+        'previous_version': previous,
+        'changed': table.version != previous,
+        'total_cards': len(table.ids),
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Server-side counters for monitoring"""
+    return jsonify({
+        'ai_decision_cache': AI_DECISION_CACHE.stats(),
+        'ai_executor': AI_EXECUTOR.stats(),
+        'game_store': games.stats(),
+        'action_log': ACTION_LOG.stats() if ACTION_LOG is not None else None,
+        'spectators': dict(SPECTATOR_STATS),
+        'matchmaking': MATCHMAKER.stats(),
+        'game_pool': GAME_POOL.stats(),
+        'cards': dict(CARD_RELOADS, version=CARD_TABLE.version, loaded_versions=len(CARD_TABLES)),
+        'events': EVENT_BUS.stats(),
+    })
 
 @app.route('/api/cards', methods=['GET'])
 def get_cards():
-    """Get all cards"""
-    return jsonify(CARD_DATABASE)
+    """
+    Get all cards, or only those matching ?faction=, ?type=, ?cost= and ?keyword=
+    
+    Filters combine (AND) and are case-insensitive:
+    /api/cards?faction=Miasma&type=TRAP
+    """
+    cost = request.args.get('cost')
+    if cost is not None:
+        try:
+            cost = int(cost)
+        except ValueError:
+            return jsonify({'error': 'cost must be an integer'}), 400
+    
+    body = CARD_TABLE.cards_response(
+        faction=request.args.get('faction'),
+        card_type=request.args.get('type'),
+        cost=cost,
+        keyword=request.args.get('keyword'),
+    )
+    return app.response_class(body, mimetype='application/json')
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,442 @@
+"""
+The Seventh Sanctum - Observation and Action Encoders
+Fixed-shape numeric views of a GameState for learning agents
+
+ObservationEncoder writes one player's view of a game into a flat float32
+buffer of OBSERVATION_SIZE values (see OBSERVATION_LAYOUT for where each
+part starts). Only what that player may see is encoded: their own hand and
+traps, both boards and fields, and counts for everything hidden.
+
+    global           phase one-hot (start/deploy/combat/end), turn,
+                     my turn, trap trigger pending
+    me / opponent    energy, Control Loss, deck, hand, discard, traps set,
+                     must discard, Rotfall destroys owed, pending energy
+    my / their slots per battlefield slot: the card's features, then
+                     exhausted, Wither, Corrupt, petrified, can't retaliate,
+                     actual ATK, DEF and SPD, deployed this turn
+    hand             per hand slot: the card's features
+    traps            per trap slot (own only): the card's features
+    fields           my field, their field: the card's features
+
+A card's features are: present, card index + 1, cost, ATK, DEF, SPD, one
+flag per keyword (Guard, Swift, Wither, Corrupt, Pierce, Retreat) and a
+one-hot of UNIT/TECHNIQUE/TRAP/FIELD. They are precomputed per card, so
+encoding copies one slice per card and writes a handful of statuses.
+Values are raw game numbers; scale them in the model if needed.
+
+Actions are flat indices: ACTION_ADVANCE, ACTION_PLAY + hand slot (any
+card type), ACTION_ATTACK + attacker slot * 5 + defender slot,
+ACTION_DISCARD + hand slot (over the hand limit), ACTION_DESTROY + slot
+(Rotfall Expanse) and the answers to a pending trap trigger:
+ACTION_TRAP_DECLINE, ACTION_TRAP_ACTIVATE, or ACTION_TRAP_TARGET + slot for
+traps that pick one of the trigger's available_targets (e.g. which unit
+Flute of Slumber keeps exhausted). The first three share their layout with
+unit_vec_env, but that environment only ever plays Units, so its policies
+have not seen most of the moves and rules here. ActionEncoder.legal_actions()
+derives the mask from the same rules the engine and the game client
+enforce, and apply() plays an index on a game. Techniques that need a target
+(TARGETED_TECHNIQUES) are never legal, since the target is a second choice
+outside this space. While a trap trigger waits, only its owner has legal
+actions (the trap answers), whichever seat is active.
+
+Both encoders write into buffers the caller allocates once (new_buffer(),
+or any writable buffer of the right type such as a NumPy row), so an
+agent loop makes no per-step allocations for observations or masks.
+
+Usage:
+    observations = ObservationEncoder()
+    actions = ActionEncoder()
+    obs, mask = observations.new_buffer(), actions.new_buffer()
+    observations.encode(game, 0, obs)
+    actions.legal_actions(game, 0, mask)
+    actions.apply(game, 0, chosen_index)
+"""
+
+from array import array
+
+import app as game_app
+SLOTS = 5
+HAND_SLOTS = 10
+TRAP_SLOTS = 3
+
+PHASES = ('start', 'deploy', 'combat', 'end')
+CARD_KINDS = ('UNIT', 'TECHNIQUE', 'TRAP', 'FIELD')
+KEYWORD_ORDER = (
+    game_app.KW_GUARD, game_app.KW_SWIFT, game_app.KW_WITHER,
+    game_app.KW_CORRUPT, game_app.KW_PIERCE, game_app.KW_RETREAT,
+)
+
+# resolve_technique() answers these with needs_target instead of an effect
+TARGETED_TECHNIQUES = frozenset({
+    'generic_food_rations', 'skyforge_software_update', 'generic_emergency_repairs',
+    'generic_adrenal_rush', 'skyforge_velocity_patch', 'generic_veil_of_binding',
+    'miasma_petrify', 'miasma_toxic_sludge', 'skyforge_override', 'skyforge_reboot',
+})
+
+# Flat action space: advance, play hand slot h, attack slot a -> enemy slot d,
+# discard hand slot h, destroy own slot s, or answer a pending trap trigger
+ACTION_ADVANCE = 0
+ACTION_PLAY = 1  # + hand slot
+ACTION_ATTACK = ACTION_PLAY + HAND_SLOTS  # + attacker slot * SLOTS + defender slot
+ACTION_DISCARD = ACTION_ATTACK + SLOTS * SLOTS  # + hand slot
+ACTION_DESTROY = ACTION_DISCARD + HAND_SLOTS  # + battlefield slot
+ACTION_TRAP_DECLINE = ACTION_DESTROY + SLOTS
+ACTION_TRAP_ACTIVATE = ACTION_TRAP_DECLINE + 1
+ACTION_TRAP_TARGET = ACTION_TRAP_ACTIVATE + 1  # + battlefield slot from the trigger's available_targets
+ACTION_COUNT = ACTION_TRAP_TARGET + SLOTS
+
+CARD_FEATURES = 6 + len(KEYWORD_ORDER) + len(CARD_KINDS)
+SLOT_STATUS = 9
+SLOT_FEATURES = CARD_FEATURES + SLOT_STATUS
+GLOBAL_FEATURES = len(PHASES) + 3
+PLAYER_FEATURES = 9
+
+
+def build_layout(parts):
+    """(name, size) pairs -> ({name: (start, size)}, total size)"""
+    layout = {}
+    offset = 0
+    for name, size in parts:
+        layout[name] = (offset, size)
+        offset += size
+    return layout, offset
+
+
+OBSERVATION_LAYOUT, OBSERVATION_SIZE = build_layout((
+    ('global', GLOBAL_FEATURES),
+    ('me', PLAYER_FEATURES),
+    ('opponent', PLAYER_FEATURES),
+    ('my_slots', SLOTS * SLOT_FEATURES),
+    ('their_slots', SLOTS * SLOT_FEATURES),
+    ('hand', HAND_SLOTS * CARD_FEATURES),
+    ('traps', TRAP_SLOTS * CARD_FEATURES),
+    ('my_field', CARD_FEATURES),
+    ('their_field', CARD_FEATURES),
+))
+
+
+def writable_view(buffer, size, formats):
+    """1-D memoryview over a caller's buffer, checked once instead of every write"""
+    view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+    if view.readonly or view.ndim != 1 or len(view) < size or view.format not in formats:
+        raise ValueError(f'Expected a writable 1-D buffer of {size} values with format {formats[0]!r}')
+    return view
+
+
+class ObservationEncoder:
+    """Writes one player's view of a GameState into a float32 buffer"""
+
+    def __init__(self, cards=None):
+        """
+        Args:
+            cards: CardTable to precompute card features for (default: the
+                live one; games from another table switch it on first use)
+        """
+        self.zeros = memoryview(array('f', bytes(4 * OBSERVATION_SIZE)))
+        self.views = {}  # id(buffer) -> (buffer, view), so repeat buffers are checked once
+        self.use_cards(cards or game_app.CARD_TABLE)
+
+    def use_cards(self, table):
+        """Precompute the feature slice of every card in `table`"""
+        features = array('f', bytes(4 * CARD_FEATURES * len(table.ids)))
+        for c in range(len(table.ids)):
+            kind = table.types[table.type_code[c]].split(' ')[0]  # 'UNIT - MYTHIC' is a Unit
+            row = [1, c + 1, table.cost[c], table.atk[c], table.defense[c], table.spd[c]]
+            row += [1 if table.keywords[c] & flag else 0 for flag in KEYWORD_ORDER]
+            row += [1 if kind == name else 0 for name in CARD_KINDS]
+            features[c * CARD_FEATURES:(c + 1) * CARD_FEATURES] = array('f', row)
+        self.cards = table
+        self.features = memoryview(features)
+
+    def new_buffer(self):
+        """A zeroed buffer of OBSERVATION_SIZE float32 values to encode into"""
+        return array('f', bytes(4 * OBSERVATION_SIZE))
+
+    def view_of(self, buffer):
+        cached = self.views.get(id(buffer))
+        if cached is not None and cached[0] is buffer:
+            return cached[1]
+        view = writable_view(buffer, OBSERVATION_SIZE, ('f',))
+        if len(self.views) >= 64:
+            self.views.clear()
+        self.views[id(buffer)] = (buffer, view)
+        return view
+
+    def encode(self, game, player, out):
+        """
+        Write `player`'s view of `game` into `out`
+
+        Args:
+            game: GameState
+            player: Seat (0 or 1) whose view to encode
+            out: Writable float32 buffer of at least OBSERVATION_SIZE values
+                (array('f'), a NumPy float32 row, or a memoryview of one)
+
+        Returns:
+            out
+        """
+        if game.cards is not self.cards:
+            self.use_cards(game.cards)
+        view = self.view_of(out)
+        view[:OBSERVATION_SIZE] = self.zeros
+        me = game.players[player]
+        opp = game.players[1 - player]
+
+        if game.phase in PHASES:
+            view[PHASES.index(game.phase)] = 1
+        base = len(PHASES)
+        view[base] = game.turn
+        view[base + 1] = game.active_player == player
+        view[base + 2] = bool(getattr(game, 'pending_trap_trigger', None))
+
+        self.encode_player(me, view, OBSERVATION_LAYOUT['me'][0])
+        self.encode_player(opp, view, OBSERVATION_LAYOUT['opponent'][0])
+        self.encode_slots(game, me, view, OBSERVATION_LAYOUT['my_slots'][0])
+        self.encode_slots(game, opp, view, OBSERVATION_LAYOUT['their_slots'][0])
+
+        offset = OBSERVATION_LAYOUT['hand'][0]
+        for card_id in me['hand'][:HAND_SLOTS]:
+            self.write_card(card_id, view, offset)
+            offset += CARD_FEATURES
+        offset = OBSERVATION_LAYOUT['traps'][0]
+        for card_id in me['traps']:
+            if card_id is not None:
+                self.write_card(card_id, view, offset)
+            offset += CARD_FEATURES
+        if me['field']:
+            self.write_card(me['field'], view, OBSERVATION_LAYOUT['my_field'][0])
+        if opp['field']:
+            self.write_card(opp['field'], view, OBSERVATION_LAYOUT['their_field'][0])
+        return out
+
+    def write_card(self, card_id, view, offset):
+        c = self.cards.index[card_id] * CARD_FEATURES
+        view[offset:offset + CARD_FEATURES] = self.features[c:c + CARD_FEATURES]
+
+    @staticmethod
+    def encode_player(player_obj, view, offset):
+        view[offset] = player_obj['energy']
+        view[offset + 1] = player_obj['control_loss']
+        view[offset + 2] = len(player_obj['deck'])
+        view[offset + 3] = len(player_obj['hand'])
+        view[offset + 4] = len(player_obj['discard'])
+        view[offset + 5] = sum(trap is not None for trap in player_obj['traps'])
+        view[offset + 6] = player_obj.get('must_discard', 0)
+        view[offset + 7] = player_obj.get('rotfall_must_destroy', 0)
+        view[offset + 8] = player_obj.get('pending_energy', 0)
+
+    def encode_slots(self, game, player_obj, view, offset):
+        """Card features plus statuses and actual stats (same as attack()) per slot"""
+        table = self.cards
+        for i, card_id in enumerate(player_obj['battlefield']):
+            if card_id is not None:
+                c = table.index[card_id]
+                self.write_card(card_id, view, offset)
+                o = offset + CARD_FEATURES
+                view[o] = player_obj['battlefield_exhausted'][i]
+                view[o + 1] = player_obj['battlefield_wither'][i]
+                view[o + 2] = player_obj['battlefield_corrupt'][i]
+                view[o + 3] = player_obj['battlefield_no_attack'][i]
+                view[o + 4] = player_obj['battlefield_no_retaliate'][i]
+                view[o + 5] = table.atk[c] + player_obj['battlefield_atk_buff'][i]
+                view[o + 6] = max(1, table.defense[c] + player_obj['battlefield_def_buff'][i]
+                                  - player_obj['battlefield_wither'][i])
+                view[o + 7] = table.spd[c] + player_obj['battlefield_spd_buff'][i]
+                view[o + 8] = player_obj['battlefield_deployed_turn'][i] == game.half_turn
+            offset += SLOT_FEATURES
+
+
+class ActionEncoder:
+    """Legality masks over the flat action space, and playing an action index on a GameState"""
+
+    def __init__(self):
+        self.views = {}  # id(buffer) -> (buffer, view)
+
+    def new_buffer(self):
+        """A buffer of ACTION_COUNT bytes (0/1) for legal_actions()"""
+        return bytearray(ACTION_COUNT)
+
+    def view_of(self, buffer):
+        cached = self.views.get(id(buffer))
+        if cached is not None and cached[0] is buffer:
+            return cached[1]
+        view = writable_view(buffer, ACTION_COUNT, ('B', '?', 'b'))
+        if len(self.views) >= 64:
+            self.views.clear()
+        self.views[id(buffer)] = (buffer, view)
+        return view
+
+    def legal_actions(self, game, player, out):
+        """
+        Write a 0/1 legality mask for `player` into `out`
+
+        Args:
+            game: GameState
+            player: Seat (0 or 1) choosing the action
+            out: Writable buffer of ACTION_COUNT bytes or bools (bytearray,
+                a NumPy bool/uint8 row, or a memoryview of one)
+
+        Returns:
+            Number of legal actions (0 when the player has nothing to do)
+        """
+        view = self.view_of(out)
+        for i in range(ACTION_COUNT):
+            view[i] = False
+        if game.winner is not None:
+            return 0
+        trigger = getattr(game, 'pending_trap_trigger', None)
+        if trigger:
+            return self.trap_answers(game, player, trigger, view)
+
+        me = game.players[player]
+        opp = game.players[1 - player]
+        table = game.cards
+        legal = 0
+
+        # Rotfall Expanse holds the turn until its destroys are made (by either seat)
+        if me.get('rotfall_must_destroy', 0):
+            for s in range(SLOTS):
+                if me['battlefield'][s] is not None:
+                    view[ACTION_DESTROY + s] = True
+                    legal += 1
+            return legal
+        if game.active_player != player or opp.get('rotfall_must_destroy', 0):
+            return 0
+
+        if me.get('must_discard', 0):
+            for h in range(min(len(me['hand']), HAND_SLOTS)):
+                view[ACTION_DISCARD + h] = True
+                legal += 1
+            return legal
+
+        view[ACTION_ADVANCE] = True
+        legal += 1
+
+        if game.phase == 'deploy':
+            free_slot = None in me['battlefield']
+            free_trap = None in me['traps']
+            assembly_line = me.get('field') == 'skyforge_assembly_line'
+            for h, card_id in enumerate(me['hand'][:HAND_SLOTS]):
+                card = table.by_id[card_id]
+                kind = card['type']
+                cost = card.get('cost', 0)
+                if kind == 'UNIT':
+                    if assembly_line and card.get('faction') == 'Skyforge':
+                        cost = max(1, cost - 1)
+                    playable = free_slot and cost <= me['energy']
+                elif kind == 'TRAP':
+                    playable = free_trap
+                elif kind == 'FIELD':
+                    playable = cost <= me['energy']
+                elif kind == 'TECHNIQUE':
+                    playable = cost <= me['energy'] and card_id not in TARGETED_TECHNIQUES
+                else:
+                    playable = False
+                if playable:
+                    view[ACTION_PLAY + h] = True
+                    legal += 1
+
+        elif game.phase == 'combat' and game.turn > 1:
+            # The checks attack() makes, in the same order
+            guards = [d for d in range(SLOTS)
+                      if opp['battlefield'][d] is not None
+                      and table.keywords[table.index[opp['battlefield'][d]]] & game_app.KW_GUARD]
+            for a in range(SLOTS):
+                attacker_id = me['battlefield'][a]
+                if attacker_id is None or me['battlefield_exhausted'][a] or me['battlefield_no_attack'][a]:
+                    continue
+                c = table.index[attacker_id]
+                spd = table.spd[c] + me['battlefield_spd_buff'][a]
+                swift_active = (table.keywords[c] & game_app.KW_SWIFT
+                                and me['battlefield_deployed_turn'][a] == game.half_turn)
+                for d in (guards or range(SLOTS)):
+                    defender_id = opp['battlefield'][d]
+                    if defender_id is None:
+                        continue
+                    if swift_active or spd >= table.spd[table.index[defender_id]] + opp['battlefield_spd_buff'][d]:
+                        view[ACTION_ATTACK + a * SLOTS + d] = True
+                        legal += 1
+        return legal
+
+    @staticmethod
+    def trap_answers(game, player, trigger, view):
+        """Mask the answers to a pending trap trigger; only the trap's owner has any"""
+        if trigger.get('trap_owner') != player:
+            return 0
+        view[ACTION_TRAP_DECLINE] = True
+        me = game.players[player]
+        trap_id = me['traps'][trigger['trap_slot']]
+        if trap_id is None or game.cards.by_id[trap_id]['cost'] > me['energy']:
+            # Declining is all that's left (a removed trap just clears the trigger)
+            return 1
+        targets = (trigger.get('trigger_data') or {}).get('available_targets')
+        if targets and trigger.get('trap_type') != 'counter_sigil_trigger':
+            for target in targets:
+                view[ACTION_TRAP_TARGET + target['index']] = True
+            return 1 + len(targets)
+        view[ACTION_TRAP_ACTIVATE] = True
+        return 2
+
+    @staticmethod
+    def apply(game, player, action):
+        """
+        Play flat action index `action` for `player`
+
+        Legality is not checked here (use legal_actions()); the engine's own
+        checks still apply and come back as {'error': ...}. Advancing for a
+        seat in game.ai_players lets the server AI play that seat's phase, so
+        create agent games with ai_players=() or only the opponent's seat.
+        An attack that springs a trap waits for the defender's answer as the
+        server AI's attacks do, and is not carried out afterwards.
+
+        Returns:
+            The engine's result dict
+        """
+        action = int(action)
+        if action == ACTION_ADVANCE:
+            game.advance_phase()
+            return {'success': True}
+        if ACTION_PLAY <= action < ACTION_ATTACK:
+            hand = game.players[player]['hand']
+            h = action - ACTION_PLAY
+            if h >= len(hand):
+                return {'error': 'No card in that hand slot'}
+            return game.play_card(player, hand[h])
+        if ACTION_ATTACK <= action < ACTION_DISCARD:
+            result = game.attack(player, *divmod(action - ACTION_ATTACK, SLOTS))
+            if result.get('trap_trigger'):
+                game.hold_attack_trap(player, result)
+            return result
+        if ACTION_DISCARD <= action < ACTION_DESTROY:
+            if game.active_player != player:
+                return {'error': 'Not your turn'}
+            return game.discard_from_hand(action - ACTION_DISCARD)
+        if ACTION_DESTROY <= action < ACTION_TRAP_DECLINE:
+            return game.rotfall_destroy(player, action - ACTION_DESTROY)
+        if ACTION_TRAP_DECLINE <= action < ACTION_COUNT:
+            return ActionEncoder.answer_trap(game, player, action)
+        return {'error': f'Unknown action {action}'}
+
+    @staticmethod
+    def answer_trap(game, player, action):
+        """Decline, activate or target with the trap waiting on `player` (as the activate_trap routes do)"""
+        trigger = getattr(game, 'pending_trap_trigger', None)
+        if not trigger or trigger.get('trap_owner') != player:
+            return {'error': 'No trap waiting on this player'}
+        slot = trigger['trap_slot']
+        trap_id = game.players[player]['traps'][slot]
+        if trap_id is None:
+            # Trap was already removed (likely by Counter-Sigil)
+            game.pending_trap_trigger = None
+            return {'error': 'No trap in that slot', 'trap_already_removed': True}
+        activate = action != ACTION_TRAP_DECLINE
+        if activate and game.players[player]['energy'] < game.cards.by_id[trap_id]['cost']:
+            return {'error': 'Not enough energy'}
+        if trigger.get('trap_type') == 'counter_sigil_trigger':
+            return game.answer_counter_sigil(player, slot, activate, trigger_data=trigger.get('trigger_data'))
+        if not activate:
+            return game.decline_trap(player, slot)
+        trigger_data = dict(trigger.get('trigger_data') or {})
+        if action >= ACTION_TRAP_TARGET:
+            trigger_data['selected_target_index'] = action - ACTION_TRAP_TARGET
+        return game.activate_trap(player, slot, trigger_data)
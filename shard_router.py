@@ -0,0 +1,244 @@
+"""
+The Seventh Sanctum - Sharded Deployment
+Front router that spreads games over several game server processes
+
+Every game lives in exactly one worker process, chosen by hashing its
+game_id. Workers only ever create game IDs (and AI job IDs) that hash to
+themselves, so the router can forward any request to the right owner
+without a lookup table, and a restarted worker keeps owning the same games.
+
+Usage:
+    python shard_router.py --workers 4 --port 5000
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import re
+import select
+import signal
+import sys
+import threading
+import time
+import zlib
+
+from flask import Flask, Response, jsonify, request
+
+
+def shard_for(key, shard_count):
+    """Stable shard index for a game or job ID"""
+    return zlib.crc32(key.encode('utf-8')) % shard_count
+
+
+# /api/game/<game_id>/... and /api/ai_jobs/<job_id> belong to one shard
+OWNED_PATH = re.compile(r'^/api/(?:game|ai_jobs)/([0-9a-f-]{36})(?:/|$)')
+
+# The matchmaking queue has to be shared, so it lives on shard 0 (which also
+# hosts the games it creates)
+MATCHMAKING_PREFIX = '/api/matchmaking/'
+
+# Seconds to wait for a shard's reply. Long-polls hold a request for up to
+# app.LONG_POLL_MAX_TIMEOUT (60s), so this has to stay well above it
+SHARD_TIMEOUT = 90.0
+
+# What forward() raises when a shard can't be reached or answers garbage
+SHARD_ERRORS = (OSError, http.client.HTTPException)
+
+
+def run_worker(shard_index, shard_count, port):
+    """Worker process entry point: serve the normal game app for one shard"""
+    os.environ['SHARD_INDEX'] = str(shard_index)
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    import app as game_app  # Reads the shard settings at import time
+    game_app.app.run(host='127.0.0.1', port=port, threaded=True, use_reloader=False)
+
+
+class ShardRouter:
+    """Starts the shard workers, restarts them if they die and forwards requests"""
+
+    def __init__(self, worker_count, base_port):
+        self.worker_count = worker_count
+        self.ports = [base_port + i for i in range(worker_count)]
+        self.processes = [None] * worker_count
+        self.context = multiprocessing.get_context('spawn')
+        self.connections = threading.local()
+        self.next_worker = 0
+        self.forwarded = [0] * worker_count
+        self.restarts = 0
+
+    def start(self):
+        for i in range(self.worker_count):
+            self.start_worker(i)
+        threading.Thread(target=self.monitor, name='shard-monitor', daemon=True).start()
+
+    def start_worker(self, i):
+        process = self.context.Process(
+            target=run_worker,
+            args=(i, self.worker_count, self.ports[i]),
+            name=f'shard-{i}',
+            daemon=True
+        )
+        process.start()
+        self.processes[i] = process
+
+    def monitor(self):
+        """Bring crashed workers back on the same port"""
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(self.processes):
+                if not process.is_alive():
+                    print(f"Shard {i} exited ({process.exitcode}), restarting")
+                    self.start_worker(i)
+                    self.restarts += 1
+
+    def shard_for_path(self, path):
+        """Owning shard for a request path; new games and shared data go round-robin"""
+        match = OWNED_PATH.match(path)
+        if match:
+            return shard_for(match.group(1), self.worker_count)
+        if path.startswith(MATCHMAKING_PREFIX):
+            return 0
+        shard = self.next_worker
+        self.next_worker = (shard + 1) % self.worker_count
+        return shard
+
+    def connection(self, shard):
+        """Keep-alive connection to a shard, one per router thread"""
+        pool = getattr(self.connections, 'pool', None)
+        if pool is None:
+            pool = self.connections.pool = {}
+        conn = pool.get(shard)
+        if conn is not None and conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # An idle keep-alive socket only turns readable when the worker closed it
+            self.drop_connection(shard)
+            conn = None
+        if conn is None:
+            conn = pool[shard] = http.client.HTTPConnection('127.0.0.1', self.ports[shard], timeout=SHARD_TIMEOUT)
+        return conn
+
+    def drop_connection(self, shard):
+        self.connections.pool.pop(shard).close()
+
+    def forward(self, shard, method, path, body, headers):
+        """
+        Send one request to a shard; returns (status, headers, body)
+        
+        A request that couldn't be sent is retried once on a new connection.
+        Once it went out it is never sent again, since the worker may already
+        have applied it: failures after that raise one of SHARD_ERRORS.
+        """
+        for attempt in range(2):
+            conn = self.connection(shard)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+            except SHARD_ERRORS:
+                # Stale keep-alive or restarting worker - reconnect once
+                self.drop_connection(shard)
+                if attempt:
+                    raise
+                continue
+            try:
+                response = conn.getresponse()
+                data = response.read()
+            except SHARD_ERRORS:
+                self.drop_connection(shard)
+                raise
+            self.forwarded[shard] += 1
+            return response.status, response.getheaders(), data
+
+    def signal_workers(self, signum):
+        """Pass a signal on to every live worker (SIGHUP reloads their cards)"""
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signum)
+    
+    def stats(self):
+        return {
+            'workers': self.worker_count,
+            'forwarded': list(self.forwarded),
+            'restarts': self.restarts,
+        }
+
+
+def create_router_app(router):
+    """Flask app that forwards every request to the owning shard"""
+    router_app = Flask(__name__)
+    passthrough_headers = (
+        'Content-Type', 'Accept', 'X-Admin-Token',
+        # CORS requests and preflights are answered by the worker (flask_cors)
+        'Origin', 'Access-Control-Request-Method', 'Access-Control-Request-Headers',
+        # Conditional GETs, so a worker can answer 304
+        'If-None-Match', 'If-Modified-Since',
+    )
+    response_headers_kept = ('content-type', 'cache-control', 'etag', 'last-modified', 'vary')
+
+    @router_app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        """Metrics from every shard plus the router's own counters"""
+        shards = []
+        for shard in range(router.worker_count):
+            try:
+                status, _, data = router.forward(shard, 'GET', '/api/metrics', None, {})
+                shards.append(Response(data).get_json(force=True) if status == 200 else None)
+            except SHARD_ERRORS:
+                shards.append(None)
+        return jsonify({'router': router.stats(), 'shards': shards})
+
+    @router_app.route('/api/admin/reload_cards', methods=['POST'])
+    def reload_cards():
+        """Card reloads go to every shard, not just one"""
+        headers = {name: request.headers[name] for name in passthrough_headers if name in request.headers}
+        shards = []
+        status = 200
+        for shard in range(router.worker_count):
+            try:
+                shard_status, _, data = router.forward(shard, 'POST', request.path, request.get_data(), headers)
+                shards.append(Response(data).get_json(force=True))
+            except SHARD_ERRORS:
+                shard_status = 503
+                shards.append({'error': f'Shard {shard} unavailable'})
+            status = max(status, shard_status)
+        return jsonify({'shards': shards}), status
+
+    @router_app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+    @router_app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+    def proxy(path):
+        shard = router.shard_for_path(request.path)
+        target = request.full_path if request.query_string else request.path
+        headers = {name: request.headers[name] for name in passthrough_headers if name in request.headers}
+        try:
+            status, response_headers, data = router.forward(
+                shard, request.method, target, request.get_data(), headers
+            )
+        except SHARD_ERRORS:
+            return jsonify({'error': f'Shard {shard} unavailable'}), 503
+
+        response = Response(data, status=status)
+        response.headers.pop('Content-Type')
+        for name, value in response_headers:
+            lower = name.lower()
+            if lower in response_headers_kept or lower.startswith('access-control-'):
+                # add(), not assignment: Vary may come more than once
+                response.headers.add(name, value)
+        return response
+
+    return router_app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run The Seventh Sanctum as several sharded workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--base-port', type=int, default=5100, help='First local port for the workers')
+    args = parser.parse_args()
+
+    # Exit cleanly on SIGTERM so the daemon workers are stopped with us
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    router = ShardRouter(args.workers, args.base_port)
+    router.start()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: router.signal_workers(signum))
+    create_router_app(router).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,108 @@
+"""
+The Seventh Sanctum - Snapshot Benchmark
+Size and speed of binary game snapshots against JSON
+
+Plays games with random legal moves, snapshots them along the way and
+times every encoding the server could use for the same snapshots:
+
+    json          json.dumps / json.loads (what the API and old logs used)
+    json+zlib     what SQLite stores held before binary snapshots
+    binary        encode_snapshot() - AI worker hand-off
+    binary+zlib   encode_snapshot(compress=True) - SQLite and action logs
+
+Snapshots are also checked to decode back equal to the original.
+
+Usage:
+    python snapshot_benchmark.py --games 50 --seed 0
+"""
+
+import argparse
+import json
+import random
+import time
+import zlib
+
+import app as game_app
+from encoders import ACTION_COUNT, ActionEncoder
+
+
+def sample_snapshots(game_count, seed, every=10, max_steps=3000):
+    """Snapshots of `game_count` random legal-move games, one every `every` moves"""
+    rng = random.Random(seed)
+    random.seed(seed)  # Deck shuffles
+    actions = ActionEncoder()
+    mask = actions.new_buffer()
+    snapshots = []
+    for _ in range(game_count):
+        game = game_app.GameState(
+            game_app.create_starter_deck(rng.choice(game_app.STARTER_FACTIONS)),
+            game_app.create_starter_deck(rng.choice(game_app.STARTER_FACTIONS)),
+            ai_players=(), log_sink=game_app.RingBufferSink(), event_bus=game_app.EventBus()
+        )
+        for step in range(max_steps):
+            if game.winner is not None:
+                break
+            if step % every == 0:
+                # snapshot() shares the live player dicts, so keep a copy
+                snapshots.append(json.loads(json.dumps(game.snapshot())))
+            player = game.active_player
+            if not actions.legal_actions(game, player, mask):
+                player = 1 - player  # Waiting on the other seat (a trap answer or Rotfall)
+                actions.legal_actions(game, player, mask)
+            actions.apply(game, player, rng.choice([i for i in range(ACTION_COUNT) if mask[i]]))
+        snapshots.append(json.loads(json.dumps(game.snapshot())))
+    return snapshots
+
+
+CODECS = {
+    'json': (
+        lambda s: json.dumps(s, separators=(',', ':')).encode('utf-8'),
+        json.loads,
+    ),
+    'json+zlib': (
+        lambda s: zlib.compress(json.dumps(s, separators=(',', ':')).encode('utf-8')),
+        lambda b: json.loads(zlib.decompress(b)),
+    ),
+    'binary': (game_app.encode_snapshot, game_app.decode_snapshot),
+    'binary+zlib': (
+        lambda s: game_app.encode_snapshot(s, compress=True),
+        game_app.decode_snapshot,
+    ),
+}
+
+
+def benchmark(snapshots):
+    """{codec: (mean bytes, mean encode us, mean decode us)}"""
+    results = {}
+    for name, (encode, decode) in CODECS.items():
+        start = time.perf_counter()
+        blobs = [encode(s) for s in snapshots]
+        encoded = time.perf_counter()
+        for blob in blobs:
+            decode(blob)
+        finished = time.perf_counter()
+        if any(decode(blob) != s for blob, s in zip(blobs, snapshots)):
+            raise AssertionError(f'{name} did not round-trip')
+        n = len(snapshots)
+        results[name] = (
+            sum(len(b) for b in blobs) / n,
+            (encoded - start) / n * 1e6,
+            (finished - encoded) / n * 1e6,
+        )
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare binary game snapshots with JSON')
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshots = sample_snapshots(args.games, args.seed)
+    binary_count = sum(not game_app.encode_snapshot(s)[3] & game_app.SNAPSHOT_JSON for s in snapshots)
+    print(f'{len(snapshots)} snapshots from {args.games} games ({binary_count} binary, the rest JSON fallback)')
+    results = benchmark(snapshots)
+    json_size = results['json'][0]
+    print(f"{'':12} {'bytes':>8} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+    for name, (size, encode_us, decode_us) in results.items():
+        print(f'{name:12} {size:8.0f} {size / json_size:8.2f} {encode_us:10.1f} {decode_us:10.1f}')
@@ -0,0 +1,83 @@
+"""Random legal-move games through ActionEncoder"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from encoders import ACTION_COUNT, ACTION_TRAP_DECLINE, ACTION_TRAP_TARGET, ActionEncoder
+
+
+def new_game(rng):
+    return app.GameState(
+        app.create_starter_deck(rng.choice(app.STARTER_FACTIONS)),
+        app.create_starter_deck(rng.choice(app.STARTER_FACTIONS)),
+        ai_players=(), log_sink=app.RingBufferSink(), event_bus=app.EventBus()
+    )
+
+
+class ActionEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.actions = ActionEncoder()
+        self.mask = self.actions.new_buffer()
+
+    def legal(self, game, player):
+        self.actions.legal_actions(game, player, self.mask)
+        return [i for i in range(ACTION_COUNT) if self.mask[i]]
+
+    def play_out(self, game, rng, max_steps=5000):
+        """Play random legal actions until someone wins; returns the trap answers made"""
+        trap_answers = 0
+        for _ in range(max_steps):
+            if game.winner is not None:
+                return trap_answers
+            legal = self.legal(game, game.active_player)
+            player = game.active_player
+            if not legal:
+                # Waiting on the other seat (a trap answer or Rotfall)
+                player = 1 - player
+                legal = self.legal(game, player)
+            self.assertTrue(legal, f'No seat can move in phase {game.phase} of turn {game.turn}')
+            action = rng.choice(legal)
+            trap_answers += action >= ACTION_TRAP_DECLINE
+            result = self.actions.apply(game, player, action)
+            self.assertNotIn('error', result or {}, f'Legal action {action} failed')
+        self.fail(f'No winner after {max_steps} actions')
+
+    def test_random_games_finish(self):
+        rng = random.Random(0)
+        random.seed(0)  # Deck shuffles
+        trap_answers = 0
+        for _ in range(100):
+            trap_answers += self.play_out(new_game(rng), rng)
+        # Enough games for the trap prompts to come up
+        self.assertGreater(trap_answers, 0)
+
+    def test_only_the_trap_owner_answers(self):
+        rng = random.Random(1)
+        random.seed(1)
+        game = new_game(rng)
+        game.players[1]['traps'][0] = 'generic_flute_of_slumber'
+        game.players[1]['energy'] = 10
+        game.pending_trap_trigger = {
+            'trap_type': 'ready_trap_trigger',
+            'trap': game.cards.by_id['generic_flute_of_slumber'],
+            'trap_slot': 0,
+            'trigger_message': '',
+            'trigger_data': {'readied_player': 0, 'available_targets': [{'index': 2, 'name': 'Unit'}]},
+            'trap_owner': 1,
+        }
+        self.assertEqual(self.legal(game, 0), [])
+        self.assertEqual(self.legal(game, 1), [ACTION_TRAP_DECLINE, ACTION_TRAP_TARGET + 2])
+
+        self.actions.apply(game, 1, ACTION_TRAP_TARGET + 2)
+        self.assertIsNone(game.pending_trap_trigger)
+        self.assertIsNone(game.players[1]['traps'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
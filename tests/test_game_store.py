@@ -0,0 +1,89 @@
+"""Round trips through SQLiteGameStore"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+def new_game():
+    return app.GameState(
+        list(app.CARD_TABLE.starter_deck('Skyforge')),
+        list(app.CARD_TABLE.starter_deck('Miasma')),
+        cards=app.CARD_TABLE
+    )
+
+
+class SQLiteGameStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'games.db')
+        self.store = app.SQLiteGameStore(self.path)
+
+    def tearDown(self):
+        self.store.db.close()
+        self.tmp.cleanup()
+
+    def reopen(self):
+        """A fresh store on the same database, as after a restart"""
+        self.store.db.close()
+        self.store = app.SQLiteGameStore(self.path)
+        return self.store
+
+    def test_game_round_trip(self):
+        game = new_game()
+        game.advance_phase()
+        self.store.write([(game.game_id, game)])
+
+        loaded = self.reopen().load(game.game_id)
+        self.assertEqual(loaded.snapshot(), game.snapshot())
+
+    def test_ai_job_id_is_stored(self):
+        game = new_game()
+        game.ai_job_id = 'job-1'
+        self.store.write([(game.game_id, game)])
+
+        loaded = self.reopen().load(game.game_id)
+        self.assertEqual(loaded.ai_job_id, 'job-1')
+
+    def test_lost_ai_job_is_dropped_without_workers(self):
+        game = new_game()
+        game.ai_job_id = 'job-from-before-a-restart'
+        self.store.write([(game.game_id, game)])
+
+        store = self.reopen()
+        self.assertFalse(app.AI_EXECUTOR.enabled)
+        loaded = store.get(game.game_id)
+        # The next advance_phase runs the AI inline instead of answering 409
+        self.assertIsNone(loaded.ai_job_id)
+
+    def test_running_ai_job_stays_attached(self):
+        game = new_game()
+        game.ai_job_id = 'job-2'
+        self.store.write([(game.game_id, game)])
+
+        app.AI_EXECUTOR.jobs['job-2'] = {'game_id': game.game_id, 'future': None}
+        try:
+            loaded = self.reopen().get(game.game_id)
+        finally:
+            del app.AI_EXECUTOR.jobs['job-2']
+        self.assertEqual(loaded.ai_job_id, 'job-2')
+
+    def test_format_1_snapshots_still_load(self):
+        game = new_game()
+        data = game.snapshot()
+        blob = bytearray(app.encode_snapshot(data))
+        # Format 1 is the same layout without the trailing extras
+        blob[2] = 1
+        extras_at = len(blob) - app.SNAPSHOT_BLOB.size
+        self.assertEqual(blob[extras_at:], app.SNAPSHOT_BLOB.pack(0))
+        self.assertEqual(app.decode_snapshot(bytes(blob[:extras_at])), app.decode_snapshot(app.encode_snapshot(data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,450 @@
+"""
+The Seventh Sanctum - Vectorized Units-Only Environment
+Steps a batch of simplified, Units-only games in lockstep on NumPy arrays,
+for RL and balance research
+
+This is NOT the full game. It keeps GameState's Unit combat and turn
+structure and drops everything else, so a policy trained here learns a
+different, smaller game than the one the server runs.
+
+Every game in the batch lives in the same set of arrays (boards, hands,
+decks, energy, statuses), indexed [env, player, ...], and each mechanic is
+one array operation over all games that need it: drawing, readying,
+Wither expiry, combat and Control Loss. There is no per-game Python object,
+so the cost of a game step shrinks as the batch grows. Steps are several
+times cheaper than driving GameState, partly because the games are simpler
+(run this file to measure it).
+
+What is modelled:
+
+- 5 battlefield slots, 5 starting energy, +2 energy at the start of each
+  turn and a cap of 5 at the end of it, a 7 card hand limit
+- Units cost energy and enter exhausted unless they have Swift
+- No attacks on turn 1; attackers need SPD >= the defender's SPD unless
+  they have Swift and were deployed this turn; Guard Units must be
+  attacked first
+- ATK > DEF (minus Wither, minimum 1) destroys; a surviving, ready
+  defender retaliates the same way; Wither stacks on survivors and clears
+  at the start of their owner's turn; attackers become exhausted
+- Three Control Loss tokens or drawing from an empty deck loses
+
+What is not: techniques, traps and fields are dealt and drawn as normal
+but can never be played, so their effects (Corrupt, buffs, field energy,
+trap triggers) never happen. Two choices that GameState leaves to a player
+are made automatically: Pierce overflow hits the enemy Unit with the lowest
+DEF, and cards over the hand limit are discarded from the last hand slots.
+To train or evaluate against the real rules, drive GameState through
+encoders.py instead.
+
+Actions are flat indices (see ACTION_COUNT): advance the phase (deploy ->
+combat -> end of turn), deploy the Unit in a hand slot, or attack with
+slot a into enemy slot d. action_masks() gives the legal ones; an illegal
+action advances the phase. Observations are dicts of arrays from the
+point of view of the player to move (side 0 = that player, side 1 = the
+opponent).
+
+Usage:
+    env = UnitVecEnv(1024, seed=0)
+    obs = env.reset()
+    obs, rewards, dones, infos = env.step(actions)
+
+    python unit_vec_env.py --envs 1024 --steps 2000   # Throughput benchmark
+"""
+
+import argparse
+import time
+from types import MappingProxyType
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency - only this module needs it
+    np = None
+
+import app as game_app
+
+SLOTS = 5
+HAND_SLOTS = 10
+HAND_LIMIT = 7
+OPENING_HAND = 5
+STARTING_ENERGY = 5
+TURN_ENERGY = 2
+ENERGY_CAP = 5
+CONTROL_LOSS_LIMIT = 3
+
+PHASE_DEPLOY = 0
+PHASE_COMBAT = 1
+
+# Flat action space: advance, deploy hand slot h, or attack slot a -> enemy slot d
+ACTION_ADVANCE = 0
+ACTION_PLAY = 1  # + hand slot
+ACTION_ATTACK = ACTION_PLAY + HAND_SLOTS  # + attacker slot * SLOTS + defender slot
+ACTION_COUNT = ACTION_ATTACK + SLOTS * SLOTS
+
+EMPTY = -1
+NO_INFO = MappingProxyType({})  # infos entry for games that did not finish this step
+
+
+class UnitVecEnv:
+    """
+    num_envs Units-only games stepped together, in the style of a gym VecEnv
+
+    With opponent=None both seats are played by the caller (self-play):
+    each step moves the player to move in each game and the reward is from
+    that player's point of view. With opponent='random' (uniform legal
+    moves) or a callable opponent(env) -> actions, the caller always plays
+    seat 0 and the opponent's moves are made inside step().
+
+    Finished games are reset automatically; their last observation is in
+    infos[i]['terminal_observation'].
+    """
+
+    def __init__(self, num_envs, factions=None, opponent=None, max_half_turns=200, seed=None, cards=None):
+        """
+        Args:
+            num_envs: Games in the batch
+            factions: (faction1, faction2) for every game, or None for a
+                random starter pairing per game
+            opponent: None (self-play), 'random' or a callable
+            max_half_turns: Games still running after this many player
+                turns end as a draw (truncated)
+            seed: Seed for shuffling and the random opponent
+            cards: CardTable to play with (default: the live one)
+        """
+        if np is None:
+            raise RuntimeError('UnitVecEnv needs NumPy: pip install numpy')
+        self.num_envs = num_envs
+        self.opponent = opponent
+        self.max_half_turns = max_half_turns
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(num_envs)
+
+        table = cards or game_app.CARD_TABLE
+        self.cards = table
+        # Per-card lookup tables with one extra entry at the end, so an EMPTY
+        # (-1) slot indexes a harmless blank card instead of needing a check
+        blank = np.zeros(1, dtype=np.int16)
+        keywords = np.array(table.keywords + (0,), dtype=np.int32)
+        is_unit = np.array(table.type_code + (-1,)) == table.types.index('UNIT')
+        self.atk = np.concatenate([np.array(table.atk, dtype=np.int16), blank])
+        self.defense = np.concatenate([np.array(table.defense, dtype=np.int16), blank])
+        self.spd = np.concatenate([np.array(table.spd, dtype=np.int16), blank])
+        self.cost = np.concatenate([np.array(table.cost, dtype=np.int16), blank])
+        self.deploy_cost = np.where(is_unit, self.cost, np.iinfo(np.int16).max)  # Only Units can be played
+        self.guard = (keywords & game_app.KW_GUARD) != 0
+        self.swift = (keywords & game_app.KW_SWIFT) != 0
+        self.wither_kw = (keywords & game_app.KW_WITHER) != 0
+        self.pierce_kw = (keywords & game_app.KW_PIERCE) != 0
+
+        # Starter decks as a padded (faction, card) array of card indices
+        self.factions = game_app.STARTER_FACTIONS
+        decks = [[table.index[card_id] for card_id in table.starter_deck(f)] for f in self.factions]
+        self.deck_width = max(len(deck) for deck in decks)
+        self.starter_decks = np.full((len(decks), self.deck_width), EMPTY, dtype=np.intp)
+        for i, deck in enumerate(decks):
+            self.starter_decks[i, :len(deck)] = deck
+        self.fixed_factions = None
+        if factions is not None:
+            self.fixed_factions = np.array([self.factions.index(f) for f in factions])
+
+        # Per-player arrays are [env, side, ...] where side 0 is always the
+        # player to move: end_turn() swaps the sides, so the rules and the
+        # observations read plain slices instead of gathering by seat.
+        # `active` records which seat side 0 is.
+        # Card indices are intp so table lookups need no conversion.
+        shape = (num_envs, 2)
+        self.deck = np.full(shape + (self.deck_width,), EMPTY, dtype=np.intp)
+        self.deck_size = np.zeros(shape, dtype=np.int16)  # Top of deck is deck[deck_size - 1]
+        self.hand = np.full(shape + (HAND_SLOTS,), EMPTY, dtype=np.intp)
+        self.battlefield = np.full(shape + (SLOTS,), EMPTY, dtype=np.intp)
+        self.exhausted = np.zeros(shape + (SLOTS,), dtype=bool)
+        self.wither = np.zeros(shape + (SLOTS,), dtype=np.int16)
+        self.deployed_turn = np.zeros(shape + (SLOTS,), dtype=np.int32)  # half_turn, for Swift
+        self.energy = np.zeros(shape, dtype=np.int16)
+        self.control_loss = np.zeros(shape, dtype=np.int16)
+        self.sided = (
+            'deck', 'deck_size', 'hand', 'battlefield', 'exhausted', 'wither',
+            'deployed_turn', 'energy', 'control_loss',
+        )
+        self.active = np.zeros(num_envs, dtype=np.int8)
+        self.phase = np.zeros(num_envs, dtype=np.int8)
+        self.turn = np.ones(num_envs, dtype=np.int32)
+        self.half_turn = np.ones(num_envs, dtype=np.int32)
+        self.winner = np.full(num_envs, EMPTY, dtype=np.int8)
+        self.masks = np.zeros((num_envs, ACTION_COUNT), dtype=bool)
+        self.masks[:, ACTION_ADVANCE] = True
+        self.masks_current = False
+        self.pair_attacker = np.repeat(np.arange(SLOTS), SLOTS)  # Attack action k is slot pair_attacker[k]
+        self.pair_defender = np.tile(np.arange(SLOTS), SLOTS)  # into enemy slot pair_defender[k]
+
+    # ============================================================
+    # GYM INTERFACE
+    # ============================================================
+
+    def reset(self):
+        """Start a new game in every env and return the first observations"""
+        self.reset_envs(self.rows)
+        return self.observe()
+
+    def step(self, actions):
+        """
+        Play one action in every game
+
+        Returns:
+            (observations, rewards, dones, infos) like gym's VecEnv.step()
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        seat = self.active.copy() if self.opponent is None else np.zeros(self.num_envs, dtype=np.int8)
+        self.apply(self.rows, actions)
+
+        if self.opponent is not None:
+            opponent_moves = (self.active == 1) & (self.winner == EMPTY) & (self.half_turn <= self.max_half_turns)
+            while opponent_moves.any():
+                rows = np.flatnonzero(opponent_moves)
+                if self.opponent == 'random':
+                    moves = self.random_actions()
+                else:
+                    moves = np.asarray(self.opponent(self))
+                self.apply(rows, moves[rows])
+                opponent_moves = (self.active == 1) & (self.winner == EMPTY) & (self.half_turn <= self.max_half_turns)
+
+        finished = self.winner != EMPTY
+        truncated = ~finished & (self.half_turn > self.max_half_turns)
+        rewards = np.where(finished, np.where(self.winner == seat, 1.0, -1.0), 0.0).astype(np.float32)
+        dones = finished | truncated
+
+        infos = [NO_INFO] * self.num_envs
+        done_rows = np.flatnonzero(dones)
+        if done_rows.size:
+            final = self.observe()
+            for i in done_rows:
+                infos[i] = {
+                    'winner': int(self.winner[i]),
+                    'turns': int(self.turn[i]),
+                    'TimeLimit.truncated': bool(truncated[i]),
+                    'terminal_observation': {key: value[i] for key, value in final.items()},
+                }
+            self.reset_envs(done_rows)
+        return self.observe(), rewards, dones, infos
+
+    def action_masks(self):
+        """
+        (num_envs, ACTION_COUNT) bool array of the legal actions for the player to move
+
+        The array is reused: it is overwritten once the games move on.
+        """
+        masks = self.masks
+        if self.masks_current:
+            return masks
+        self.masks_current = True
+        hand = self.hand[:, 0]
+        mine = self.battlefield[:, 0]
+        theirs = self.battlefield[:, 1]
+
+        # Deploy: a Unit in hand, enough energy and a free slot
+        can_deploy = (self.phase == PHASE_DEPLOY) & (mine == EMPTY).any(axis=1)
+        np.logical_and(
+            self.deploy_cost[hand] <= self.energy[:, 0, None], can_deploy[:, None],
+            out=masks[:, ACTION_PLAY:ACTION_ATTACK]
+        )
+
+        # Attack: ready attacker, SPD (or fresh Swift), Guard first, never on turn 1.
+        # Per-slot facts are spread over the (attacker, defender) pairs with
+        # pair_attacker/pair_defender, which is much faster than broadcasting
+        # over two axes of length 5.
+        ready = (mine != EMPTY) & ~self.exhausted[:, 0]
+        ready &= ((self.phase == PHASE_COMBAT) & (self.turn > 1))[:, None]
+        swift_now = self.swift[mine] & (self.deployed_turn[:, 0] == self.half_turn[:, None])
+        guards = self.guard[theirs]
+        targets = (theirs != EMPTY) & (guards | ~guards.any(axis=1)[:, None])
+        attacks = self.spd[mine][:, self.pair_attacker] >= self.spd[theirs][:, self.pair_defender]
+        attacks |= swift_now[:, self.pair_attacker]
+        attacks &= ready[:, self.pair_attacker]
+        attacks &= targets[:, self.pair_defender]
+        masks[:, ACTION_ATTACK:] = attacks
+        return masks
+
+    def random_actions(self):
+        """A uniformly random legal action for every game"""
+        scores = self.rng.random((self.num_envs, ACTION_COUNT))
+        scores[~self.action_masks()] = -1.0
+        return scores.argmax(axis=1)
+
+    def observe(self):
+        """Observations from the point of view of each game's player to move (side 0)"""
+        return {
+            'battlefield': self.battlefield.copy(),
+            'exhausted': self.exhausted.copy(),
+            'wither': self.wither.copy(),
+            'hand': self.hand[:, 0].copy(),
+            'hand_size': (self.hand != EMPTY).sum(axis=2),
+            'deck_size': self.deck_size.copy(),
+            'energy': self.energy.copy(),
+            'control_loss': self.control_loss.copy(),
+            'phase': self.phase.copy(),
+            'turn': self.turn.copy(),
+            'player': self.active.copy(),
+        }
+
+    # ============================================================
+    # RULES (each takes the env rows it applies to)
+    # ============================================================
+
+    def reset_envs(self, rows):
+        """Shuffle, deal and start a new game in the given envs"""
+        n = len(rows)
+        if self.fixed_factions is not None:
+            factions = np.broadcast_to(self.fixed_factions, (n, 2))
+        else:
+            factions = self.rng.integers(len(self.factions), size=(n, 2))
+        decks = self.starter_decks[factions]
+        # Shuffle the real cards and push the padding to the bottom (the end)
+        keys = self.rng.random(decks.shape)
+        keys[decks == EMPTY] = 2.0
+        decks = np.take_along_axis(decks, np.argsort(keys, axis=2), axis=2)
+        sizes = (decks != EMPTY).sum(axis=2)
+
+        self.deck[rows] = decks
+        self.hand[rows] = EMPTY
+        draw = sizes[:, :, None] - 1 - np.arange(OPENING_HAND)
+        self.hand[rows, :, :OPENING_HAND] = np.take_along_axis(decks, draw, axis=2)
+        self.deck_size[rows] = sizes - OPENING_HAND
+        self.battlefield[rows] = EMPTY
+        self.exhausted[rows] = False
+        self.wither[rows] = 0
+        self.deployed_turn[rows] = 0
+        self.energy[rows] = STARTING_ENERGY
+        self.control_loss[rows] = 0
+        self.active[rows] = 0
+        self.phase[rows] = PHASE_DEPLOY
+        self.turn[rows] = 1
+        self.half_turn[rows] = 1
+        self.winner[rows] = EMPTY
+        self.masks_current = False
+
+    def apply(self, rows, actions):
+        """Play one action per given row (illegal actions advance the phase)"""
+        legal = self.action_masks()[rows, actions]
+        actions = np.where(legal, actions, ACTION_ADVANCE)
+        self.masks_current = False
+        play = (actions >= ACTION_PLAY) & (actions < ACTION_ATTACK)
+        attack = actions >= ACTION_ATTACK
+        if play.any():
+            self.deploy(rows[play], actions[play] - ACTION_PLAY)
+        if attack.any():
+            target = actions[attack] - ACTION_ATTACK
+            self.attack(rows[attack], target // SLOTS, target % SLOTS)
+        advance = actions == ACTION_ADVANCE
+        if advance.any():
+            self.advance(rows[advance])
+
+    def deploy(self, rows, hand_slots):
+        cards = self.hand[rows, 0, hand_slots]
+        self.hand[rows, 0, hand_slots] = EMPTY
+        self.energy[rows, 0] -= self.cost[cards]
+        slots = (self.battlefield[rows, 0] == EMPTY).argmax(axis=1)
+        self.battlefield[rows, 0, slots] = cards
+        self.exhausted[rows, 0, slots] = ~self.swift[cards]
+        self.wither[rows, 0, slots] = 0
+        self.deployed_turn[rows, 0, slots] = self.half_turn[rows]
+
+    def attack(self, rows, attacker_slots, defender_slots):
+        attackers = self.battlefield[rows, 0, attacker_slots]
+        defenders = self.battlefield[rows, 1, defender_slots]
+        attacker_atk = self.atk[attackers]
+        defender_def = np.maximum(1, self.defense[defenders] - self.wither[rows, 1, defender_slots])
+        attacker_def = np.maximum(1, self.defense[attackers] - self.wither[rows, 0, attacker_slots])
+
+        killed = attacker_atk > defender_def
+        survived = ~killed
+        self.wither[rows, 1, defender_slots] += survived & self.wither_kw[attackers]
+        retaliated = survived & ~self.exhausted[rows, 1, defender_slots] & (self.atk[defenders] > attacker_def)
+
+        # Pierce: the overflow goes to the other enemy Unit with the lowest DEF
+        overflow = np.where(killed & self.pierce_kw[attackers], attacker_atk - defender_def, 0)
+        if overflow.any():
+            others = self.battlefield[rows, 1]
+            others_def = np.maximum(1, self.defense[others] - self.wither[rows, 1])
+            valid = (others != EMPTY) & (np.arange(SLOTS) != defender_slots[:, None])
+            others_def = np.where(valid, others_def, np.iinfo(np.int16).max)
+            target = others_def.argmin(axis=1)
+            hit = (overflow > 0) & valid.any(axis=1) & (overflow >= others_def[np.arange(len(rows)), target])
+            self.remove_units(rows[hit], 1, target[hit])
+
+        self.remove_units(rows[killed], 1, defender_slots[killed])
+        self.remove_units(rows[retaliated], 0, attacker_slots[retaliated])
+        self.exhausted[rows[~retaliated], 0, attacker_slots[~retaliated]] = True
+
+    def remove_units(self, rows, side, slots):
+        self.battlefield[rows, side, slots] = EMPTY
+        self.exhausted[rows, side, slots] = False
+        self.wither[rows, side, slots] = 0
+
+    def advance(self, rows):
+        """deploy -> combat, combat -> end of turn"""
+        deploying = self.phase[rows] == PHASE_DEPLOY
+        self.phase[rows[deploying]] = PHASE_COMBAT
+        if (~deploying).any():
+            self.end_turn(rows[~deploying])
+
+    def end_turn(self, rows):
+        has_units = (self.battlefield[rows, 0] != EMPTY).any(axis=1)
+        control_loss = np.where(has_units, 0, self.control_loss[rows, 0] + 1)
+        self.control_loss[rows, 0] = control_loss
+        lost = control_loss >= CONTROL_LOSS_LIMIT
+        self.winner[rows[lost]] = 1 - self.active[rows[lost]]
+        rows = rows[~lost]
+
+        self.energy[rows, 0] = np.minimum(self.energy[rows, 0], ENERGY_CAP)
+        hand = self.hand[rows, 0]
+        held = hand != EMPTY
+        hand[held & (held.cumsum(axis=1) > HAND_LIMIT)] = EMPTY
+        self.hand[rows, 0] = hand
+
+        # The opponent becomes side 0
+        for name in self.sided:
+            values = getattr(self, name)
+            values[rows] = values[rows, ::-1]
+        self.active[rows] = 1 - self.active[rows]
+        self.turn[rows] += self.active[rows] == 0
+        self.start_turn(rows)
+
+    def start_turn(self, rows):
+        self.half_turn[rows] += 1
+        self.wither[rows, 0] = 0
+
+        decked = self.deck_size[rows, 0] == 0
+        self.winner[rows[decked]] = 1 - self.active[rows[decked]]
+        drawing = rows[~decked]
+        self.deck_size[drawing, 0] -= 1
+        cards = self.deck[drawing, 0, self.deck_size[drawing, 0]]
+        free = self.hand[drawing, 0] == EMPTY
+        has_room = free.any(axis=1)
+        self.hand[drawing[has_room], 0, free[has_room].argmax(axis=1)] = cards[has_room]
+
+        self.energy[rows, 0] += TURN_ENERGY
+        self.exhausted[rows, 0] = False
+        self.phase[rows] = PHASE_DEPLOY
+
+
+def benchmark(num_envs, steps, seed=0):
+    """Random-move self-play; returns (steps per second, games finished)"""
+    env = UnitVecEnv(num_envs, seed=seed)
+    env.reset()
+    games = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, dones, _ = env.step(env.random_actions())
+        games += int(dones.sum())
+    elapsed = time.perf_counter() - start
+    return num_envs * steps / elapsed, games
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Units-only vectorized environment with random self-play')
+    parser.add_argument('--envs', type=int, default=1024)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rate, games = benchmark(args.envs, args.steps, args.seed)
+    print(f"{args.envs} envs x {args.steps} steps: {rate:,.0f} steps/s, {games} games finished")
@@ -0,0 +1,364 @@
+"""
+The Seventh Sanctum - WebSocket Game Channels
+asyncio server that exposes the game engine over one WebSocket per game
+
+Runs next to the normal Flask routes in the same process and shares the
+same game store, so a game can be driven over HTTP, over its WebSocket, or
+both. One event loop holds every connection, so idle clients cost a socket
+and a small object rather than a server thread.
+
+Connect to ws://HOST:WS_PORT/ws/game/<game_id>?player=0 (PvP games also need
+&token=<that seat's token>) and send actions as JSON text messages named
+after the HTTP endpoints. They always act for the seat connected as:
+
+    {"action": "play_card", "card_id": "skyforge_skyforge_drone"}
+    {"action": "attack", "attacker_index": 0, "defender_index": 2}
+    {"action": "advance_phase"}
+
+The server replies with {"type": "result", "action": ..., "status": ...,
+"result": ...} (the same JSON the HTTP endpoint returns) and pushes
+{"type": "delta", "changes": {...}} to every socket on the game whenever
+its state changes, no matter which client changed it. The first delta is
+the full state; after that only changed keys are sent. Nested objects
+should be merged, anything else replaced.
+
+Game events (see app.EventBus) are pushed as they happen, before the delta
+that reflects them, for clients that want to animate what changed:
+
+    {"type": "event", "event": {"type": "UnitDestroyed", "player": 1, ...}}
+
+Usage:
+    python ws_server.py --port 5000 --ws-port 5001
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import struct
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import app as game_app
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+CHANNEL_PATH = re.compile(r'^/ws/game/([0-9a-f-]{36})$')
+MAX_MESSAGE_BYTES = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Actions accepted over the socket - the same names as the HTTP endpoints
+ACTIONS = (
+    'play_card', 'attack', 'activate_trap', 'activate_counter_sigil', 'pierce',
+    'target_technique', 'advance_phase', 'discard', 'rotfall_destroy',
+)
+
+
+def state_delta(old, new):
+    """Keys of `new` that differ from `old`, recursing into nested dicts"""
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key, ...)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = state_delta(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+class WebSocket:
+    """Minimal RFC 6455 server-side connection (text messages, ping/pong, close)"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    async def recv(self):
+        """Next text message, or None once the client closes"""
+        message = b''
+        while True:
+            head = await self.reader.readexactly(2)
+            fin = head[0] & 0x80
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+            if length + len(message) > MAX_MESSAGE_BYTES:
+                await self.close(1009)
+                return None
+            if not head[1] & 0x80:
+                # RFC 6455 5.1: clients must mask every frame
+                await self.close(1002)
+                return None
+            mask = await self.reader.readexactly(4)
+            payload = await self.reader.readexactly(length)
+            if payload:
+                key = (mask * (length // 4 + 1))[:length]
+                payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+            if opcode == 0x8:  # Close
+                await self.close()
+                return None
+            if opcode == 0x9:  # Ping
+                await self.send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:  # Pong
+                continue
+            message += payload
+            if fin:
+                try:
+                    return message.decode('utf-8')
+                except UnicodeDecodeError:
+                    # RFC 6455 8.1: invalid UTF-8 in a text message fails the connection
+                    await self.close(1007)
+                    return None
+
+    async def send(self, data):
+        await self.send_frame(0x1, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    async def send_frame(self, opcode, payload):
+        if self.closed:
+            return
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        async with self.send_lock:
+            self.writer.write(header + payload)
+            await self.writer.drain()
+
+    async def close(self, code=1000):
+        if not self.closed:
+            try:
+                await self.send_frame(0x8, struct.pack('!H', code))
+            except ConnectionError:
+                pass
+            self.closed = True
+        self.writer.close()
+
+
+class Connection:
+    """One client socket watching a game from one player's perspective"""
+
+    def __init__(self, ws, game_id, player, token=None):
+        self.ws = ws
+        self.game_id = game_id
+        self.player = player
+        self.token = token  # Seat token checked at the handshake, sent with every action
+        self.last_state = {}
+
+
+class GameChannels:
+    """Routes actions into the engine and pushes state deltas and game events to subscribers"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.channels = {}  # game_id -> set of Connection
+        self.pushes = set()  # game_ids with a push already scheduled
+        game_app.GAME_CHANGE_LISTENERS.append(self.game_changed)
+        game_app.EVENT_BUS.subscribe(self.game_event)
+
+    def game_event(self, event):
+        """EventBus handler, called from whichever thread changed the game"""
+        if event.game_id in self.channels:
+            self.loop.call_soon_threadsafe(self.loop.create_task, self.push_event(event))
+
+    async def push_event(self, event):
+        message = {'type': 'event', 'event': game_app.event_to_dict(event)}
+        for conn in list(self.channels.get(event.game_id, ())):
+            try:
+                await conn.ws.send(message)
+            except ConnectionError:
+                pass
+
+    def game_changed(self, game_id):
+        """Called from any request thread after a game changes"""
+        if game_id in self.channels:
+            self.loop.call_soon_threadsafe(self.schedule_push, game_id)
+
+    def schedule_push(self, game_id):
+        # Coalesce bursts of changes into one push per game
+        if game_id not in self.pushes:
+            self.pushes.add(game_id)
+            self.loop.create_task(self.push(game_id))
+
+    async def push(self, game_id):
+        self.pushes.discard(game_id)
+        for conn in list(self.channels.get(game_id, ())):
+            state = await self.loop.run_in_executor(None, self.read_state, game_id, conn.player)
+            if state is None:
+                continue
+            changes = state_delta(conn.last_state, state)
+            conn.last_state = state
+            if changes:
+                try:
+                    await conn.ws.send({'type': 'delta', 'changes': changes})
+                except ConnectionError:
+                    pass
+
+    @staticmethod
+    def read_state(game_id, player):
+        game = game_app.games.get(game_id)
+        if game is None:
+            return None
+        with game_app.games.locked(game_id):
+            return game.get_state(player)
+
+    @staticmethod
+    def run_action(game_id, action, body):
+        """Run an action through its HTTP view (locking, logging and persistence included)"""
+        path = f'/api/game/{game_id}/{action}'
+        with game_app.app.test_request_context(path, method='POST', json=body):
+            view = game_app.app.view_functions[game_app.request.endpoint]
+            response = game_app.make_response(view(**game_app.request.view_args))
+            return response.status_code, response.get_json()
+
+    async def handle(self, conn):
+        self.channels.setdefault(conn.game_id, set()).add(conn)
+        try:
+            await self.push_one(conn)
+            while True:
+                text = await conn.ws.recv()
+                if text is None:
+                    break
+                try:
+                    message = json.loads(text)
+                    action = message.pop('action')
+                except (ValueError, AttributeError, KeyError):
+                    await conn.ws.send({'type': 'error', 'error': 'Expected {"action": ...} JSON'})
+                    continue
+                if action not in ACTIONS:
+                    await conn.ws.send({'type': 'error', 'error': f'Unknown action: {action}'})
+                    continue
+                # The seat was bound at the handshake, whatever the message claims
+                message['player'] = conn.player
+                message['token'] = conn.token
+                try:
+                    status, result = await self.loop.run_in_executor(
+                        None, self.run_action, conn.game_id, action, message
+                    )
+                except Exception as e:
+                    # One bad action must not close the channel
+                    logger.exception('WebSocket action %s failed on game %s', action, conn.game_id)
+                    await conn.ws.send({'type': 'error', 'action': action, 'error': f'Action failed: {type(e).__name__}'})
+                    continue
+                await conn.ws.send({'type': 'result', 'action': action, 'status': status, 'result': result})
+        finally:
+            self.channels[conn.game_id].discard(conn)
+            if not self.channels[conn.game_id]:
+                del self.channels[conn.game_id]
+
+    async def push_one(self, conn):
+        state = await self.loop.run_in_executor(None, self.read_state, conn.game_id, conn.player)
+        conn.last_state = state or {}
+        await conn.ws.send({'type': 'delta', 'changes': conn.last_state})
+
+
+async def handshake(reader, writer):
+    """Read the HTTP upgrade request; returns (path, query) or None after rejecting it"""
+    try:
+        request_head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    lines = request_head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    key = headers.get('sec-websocket-key')
+    if len(parts) < 2 or parts[0] != 'GET' or headers.get('upgrade', '').lower() != 'websocket' or not key:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        await writer.drain()
+        writer.close()
+        return None
+
+    url = urlsplit(parts[1])
+    if not CHANNEL_PATH.match(url.path):
+        writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+        await writer.drain()
+        writer.close()
+        return None
+
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+    writer.write((
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+    ).encode('ascii'))
+    await writer.drain()
+    return url.path, parse_qs(url.query)
+
+
+async def serve(host, port):
+    loop = asyncio.get_running_loop()
+    channels = GameChannels(loop)
+
+    async def on_connect(reader, writer):
+        upgraded = await handshake(reader, writer)
+        if upgraded is None:
+            return
+        path, query = upgraded
+        game_id = CHANNEL_PATH.match(path).group(1)
+        ws = WebSocket(reader, writer)
+        game = await loop.run_in_executor(None, game_app.games.get, game_id)
+        if game is None:
+            await ws.send({'type': 'error', 'error': 'Game not found'})
+            await ws.close(1008)
+            return
+        try:
+            player = int(query.get('player', ['0'])[0])
+        except ValueError:
+            player = 0
+        token = query.get('token', [None])[0]
+        if not game_app.seat_token_ok(game, player, token):
+            await ws.send({'type': 'error', 'error': 'Invalid seat token'})
+            await ws.close(1008)
+            return
+        try:
+            await channels.handle(Connection(ws, game_id, player, token))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_connect, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve The Seventh Sanctum over HTTP and WebSockets')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000, help='HTTP port (Flask routes)')
+    parser.add_argument('--ws-port', type=int, default=5001, help='WebSocket port')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    # Flask keeps serving the HTTP API from a background thread
+    http_thread = threading.Thread(
+        target=game_app.app.run,
+        kwargs={'host': args.host, 'port': args.port, 'threaded': True, 'use_reloader': False},
+        name='flask-http',
+        daemon=True
+    )
+    http_thread.start()
+    asyncio.run(serve(args.host, args.ws_port))